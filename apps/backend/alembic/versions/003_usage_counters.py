@@ -0,0 +1,58 @@
+"""Add materialized per-user usage counters
+
+Revision ID: 003_usage_counters
+Revises: 002_flask_migration
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_usage_counters'
+down_revision = '002_flask_migration'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('usage_counters',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('api_calls', sa.Integer(), nullable=False),
+        sa.Column('active_keys', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+    op.create_table('daily_usage',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('api_calls', sa.Integer(), nullable=False),
+        sa.Column('credits_used', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+    # Backfill from the ledger (same logic as `flask reconcile-usage`)
+    op.execute("""
+        INSERT INTO daily_usage (user_id, day, api_calls, credits_used)
+        SELECT user_id, date(created_at), count(id), -sum(amount)
+        FROM transactions
+        WHERE transaction_type = 'usage'
+        GROUP BY user_id, date(created_at)
+    """)
+    op.execute("""
+        INSERT INTO usage_counters (user_id, api_calls, active_keys)
+        SELECT users.id,
+               (SELECT count(*) FROM transactions t
+                WHERE t.user_id = users.id AND t.transaction_type = 'usage'),
+               (SELECT count(*) FROM api_keys k
+                WHERE k.user_id = users.id AND k.is_active)
+        FROM users
+    """)
+
+
+def downgrade():
+    op.drop_table('daily_usage')
+    op.drop_table('usage_counters')
@@ -0,0 +1,50 @@
+"""Add per-minute usage rollups replacing per-call usage transactions
+
+Revision ID: 004_usage_rollups
+Revises: 003_usage_counters
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_usage_rollups'
+down_revision = '003_usage_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('usage_rollups',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('api_key_id', sa.Integer(), nullable=False),
+        sa.Column('endpoint', sa.String(length=100), nullable=False),
+        sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('calls', sa.Integer(), nullable=False),
+        sa.Column('credits_used', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'api_key_id', 'endpoint', 'bucket')
+    )
+    op.create_index('ix_usage_rollups_user_bucket', 'usage_rollups', ['user_id', 'bucket'], unique=False)
+
+    # Backfill from legacy per-call usage transactions ("API call: <endpoint>")
+    if op.get_bind().dialect.name == 'postgresql':
+        bucket = "date_trunc('minute', created_at)"
+        endpoint = "coalesce(substring(description from 11), '')"
+    else:
+        bucket = "strftime('%Y-%m-%d %H:%M:00', created_at)"
+        endpoint = "coalesce(substr(description, 11), '')"
+
+    op.execute(f"""
+        INSERT INTO usage_rollups (user_id, api_key_id, endpoint, bucket, calls, credits_used)
+        SELECT user_id, 0, {endpoint}, {bucket}, count(id), -sum(amount)
+        FROM transactions
+        WHERE transaction_type = 'usage'
+        GROUP BY user_id, {endpoint}, {bucket}
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_usage_rollups_user_bucket', table_name='usage_rollups')
+    op.drop_table('usage_rollups')
@@ -0,0 +1,80 @@
+"""Add composite and partial indexes for hot queries, drop redundant PK indexes
+
+Revision ID: 005_workload_indexes
+Revises: 004_usage_rollups
+Create Date: 2026-10-18
+
+Indexes are built with CREATE INDEX CONCURRENTLY on PostgreSQL so the tables
+stay writable during the migration.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_workload_indexes'
+down_revision = '004_usage_rollups'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial WHERE clause)
+NEW_INDEXES = [
+    ('ix_transactions_user_created', 'transactions', ['user_id', 'created_at', 'id'], None),
+    ('ix_api_keys_user_id', 'api_keys', ['user_id'], None),
+    ('ix_fingerprints_bot_id', 'fingerprints', ['id'], 'is_bot'),
+    ('ix_fingerprints_risk_score', 'fingerprints', ['risk_score'], None),
+]
+
+# Plain indexes on primary keys, already covered by the PK constraint
+REDUNDANT_PK_INDEXES = [
+    ('ix_users_id', 'users'),
+    ('ix_credits_id', 'credits'),
+    ('ix_transactions_id', 'transactions'),
+    ('ix_api_keys_id', 'api_keys'),
+    ('ix_fingerprints_id', 'fingerprints'),
+]
+
+
+def _create_new_indexes(concurrently):
+    for name, table, columns, where in NEW_INDEXES:
+        op.create_index(
+            name, table, columns, unique=False,
+            postgresql_concurrently=concurrently,
+            postgresql_where=sa.text(where) if where else None,
+            sqlite_where=sa.text(where) if where else None,
+        )
+
+
+def _drop_new_indexes(concurrently):
+    for name, table, columns, where in reversed(NEW_INDEXES):
+        op.drop_index(name, table_name=table, postgresql_concurrently=concurrently)
+
+
+def _create_pk_indexes(concurrently):
+    for name, table in reversed(REDUNDANT_PK_INDEXES):
+        op.create_index(name, table, ['id'], unique=False, postgresql_concurrently=concurrently)
+
+
+def _drop_pk_indexes(concurrently):
+    for name, table in REDUNDANT_PK_INDEXES:
+        op.drop_index(name, table_name=table, postgresql_concurrently=concurrently)
+
+
+def _run(*steps):
+    """Run steps CONCURRENTLY outside the migration transaction on PostgreSQL"""
+    if op.get_bind().dialect.name == 'postgresql':
+        # CONCURRENTLY cannot run inside a transaction block
+        with op.get_context().autocommit_block():
+            for step in steps:
+                step(True)
+    else:
+        for step in steps:
+            step(False)
+
+
+def upgrade():
+    _run(_create_new_indexes, _drop_pk_indexes)
+
+
+def downgrade():
+    _run(_create_pk_indexes, _drop_new_indexes)
@@ -0,0 +1,55 @@
+"""Add the Stripe webhook inbox and make stripe_payment_id unique
+
+Revision ID: 006_webhook_inbox
+Revises: 005_workload_indexes
+Create Date: 2026-10-18
+
+The unique index refuses to build while a payment is recorded twice; such
+duplicates are double credits and have to be reviewed by hand, so the
+migration stops and lists them instead of deleting anything.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006_webhook_inbox'
+down_revision = '005_workload_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('webhook_events',
+        sa.Column('id', sa.String(length=255), nullable=False),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('available_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_webhook_events_status_available', 'webhook_events', ['status', 'available_at'], unique=False)
+
+    duplicates = op.get_bind().execute(sa.text("""
+        SELECT stripe_payment_id, count(*) FROM transactions
+        WHERE stripe_payment_id IS NOT NULL
+        GROUP BY stripe_payment_id HAVING count(*) > 1
+    """)).fetchall()
+    if duplicates:
+        listed = ', '.join(f"{payment_id} ({count}x)" for payment_id, count in duplicates[:20])
+        raise RuntimeError(
+            f"{len(duplicates)} Stripe payment(s) were credited more than once: {listed}. "
+            "Reconcile these transactions before upgrading."
+        )
+
+    op.create_index('uq_transactions_stripe_payment_id', 'transactions', ['stripe_payment_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_transactions_stripe_payment_id', table_name='transactions')
+    op.drop_index('ix_webhook_events_status_available', table_name='webhook_events')
+    op.drop_table('webhook_events')
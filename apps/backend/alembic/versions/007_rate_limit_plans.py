@@ -0,0 +1,42 @@
+"""Add rate limit plans and per-API-key limit overrides
+
+Revision ID: 007_rate_limit_plans
+Revises: 006_webhook_inbox
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007_rate_limit_plans'
+down_revision = '006_webhook_inbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('plans',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('rate_limit', sa.String(length=50), nullable=False),
+        sa.Column('max_concurrent', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('plan_name', sa.String(length=50), nullable=True))
+        batch_op.create_foreign_key('fk_users_plan_name', 'plans', ['plan_name'], ['name'])
+
+    op.add_column('api_keys', sa.Column('rate_limit', sa.String(length=50), nullable=True))
+    op.add_column('api_keys', sa.Column('max_concurrent', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('api_keys', 'max_concurrent')
+    op.drop_column('api_keys', 'rate_limit')
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_constraint('fk_users_plan_name', type_='foreignkey')
+        batch_op.drop_column('plan_name')
+
+    op.drop_table('plans')
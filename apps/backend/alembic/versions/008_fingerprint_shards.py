@@ -0,0 +1,32 @@
+"""Add the fingerprint shard range map
+
+Revision ID: 008_fingerprint_shards
+Revises: 007_rate_limit_plans
+Create Date: 2026-10-18
+
+Starts empty: every hash stays on the main database until ranges are moved
+with `flask move-fingerprints`. Shard databases get their fingerprints table
+from `flask init-db`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_fingerprint_shards'
+down_revision = '007_rate_limit_plans'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('fingerprint_shard_ranges',
+        sa.Column('start', sa.String(length=32), nullable=False),
+        sa.Column('shard', sa.String(length=50), nullable=False),
+        sa.Column('state', sa.String(length=20), nullable=True),
+        sa.PrimaryKeyConstraint('start')
+    )
+
+
+def downgrade():
+    op.drop_table('fingerprint_shard_ranges')
@@ -0,0 +1,37 @@
+"""Add the fingerprint visit log
+
+Revision ID: 009_fingerprint_visits
+Revises: 008_fingerprint_shards
+Create Date: 2026-10-18
+
+Partitioned by range of seen_at on PostgreSQL. Daily partitions are created
+by the app's visit log thread or `flask maintain-visits`; run it once after
+upgrading so visits have somewhere to go before the first request.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009_fingerprint_visits'
+down_revision = '008_fingerprint_shards'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('fingerprint_visits',
+        sa.Column('hash_key', sa.BigInteger(), nullable=False),
+        sa.Column('seen_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('api_key_id', sa.Integer(), nullable=False),
+        sa.Column('ip', sa.LargeBinary(length=16), nullable=True),
+        postgresql_partition_by='RANGE (seen_at)'
+    )
+    op.create_index('ix_fingerprint_visits_hash_key_seen_at', 'fingerprint_visits',
+                    ['hash_key', 'seen_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_fingerprint_visits_hash_key_seen_at', table_name='fingerprint_visits')
+    # Drops the partitions with it
+    op.drop_table('fingerprint_visits')
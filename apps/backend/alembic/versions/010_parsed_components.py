@@ -0,0 +1,43 @@
+"""Add parsed component columns to fingerprints
+
+Revision ID: 010_parsed_components
+Revises: 009_fingerprint_visits
+Create Date: 2026-10-18
+
+Existing rows keep NULLs (missing_components IS NULL means "not parsed yet")
+until `flask backfill-components` fills them; run it after upgrading. Shard
+databases need this revision too.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010_parsed_components'
+down_revision = '009_fingerprint_visits'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fingerprints') as batch_op:
+        batch_op.add_column(sa.Column('cpu_cores', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('device_memory', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('screen_width', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('screen_height', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('max_touch_points', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('tz_offset', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('missing_components', sa.Integer(), nullable=True))
+    op.create_index('ix_fingerprints_cpu_cores', 'fingerprints', ['cpu_cores'], unique=False)
+    op.create_index('ix_fingerprints_screen', 'fingerprints', ['screen_width', 'screen_height'], unique=False)
+    op.create_index('ix_fingerprints_tz_offset', 'fingerprints', ['tz_offset'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_fingerprints_tz_offset', table_name='fingerprints')
+    op.drop_index('ix_fingerprints_screen', table_name='fingerprints')
+    op.drop_index('ix_fingerprints_cpu_cores', table_name='fingerprints')
+    with op.batch_alter_table('fingerprints') as batch_op:
+        for column in ('missing_components', 'tz_offset', 'max_touch_points', 'screen_height',
+                       'screen_width', 'device_memory', 'cpu_cores'):
+            batch_op.drop_column(column)
@@ -0,0 +1,46 @@
+"""Compress the long component columns
+
+Revision ID: 011_compressed_components
+Revises: 010_parsed_components
+Create Date: 2026-10-19
+
+canvas, fonts, browser and plugins become binary: existing text is kept as its
+UTF-8 bytes, which the app reads as uncompressed values. Run
+`flask train-compression-dictionaries` and `flask compress-components` after
+upgrading. Before downgrading, run `flask compress-components --decompress`.
+Shard databases need this revision too (the dictionaries live in the main one).
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011_compressed_components'
+down_revision = '010_parsed_components'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('canvas', 'fonts', 'browser', 'plugins')
+
+
+def upgrade():
+    op.create_table('compression_dictionaries',
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('column_name', sa.String(length=50), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('samples', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('version')
+    )
+    with op.batch_alter_table('fingerprints') as batch_op:
+        for column in COLUMNS:
+            batch_op.alter_column(column, existing_type=sa.String(), type_=sa.LargeBinary(),
+                                  postgresql_using=f"convert_to({column}, 'UTF8')")
+
+
+def downgrade():
+    with op.batch_alter_table('fingerprints') as batch_op:
+        for column in COLUMNS:
+            batch_op.alter_column(column, existing_type=sa.LargeBinary(), type_=sa.String(),
+                                  postgresql_using=f"convert_from({column}, 'UTF8')")
+    op.drop_table('compression_dictionaries')
@@ -0,0 +1,34 @@
+"""Add revocations of signed API tokens
+
+Revision ID: 012_token_revocations
+Revises: 011_compressed_components
+Create Date: 2026-10-19
+
+One row per disabled or deleted API key ("key") and deactivated or deleted
+user ("user"), written by the app as it changes them and read by every process
+to refuse their signed tokens.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012_token_revocations'
+down_revision = '011_compressed_components'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('token_revocations',
+        sa.Column('subject', sa.String(length=10), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('subject', 'subject_id')
+    )
+    op.create_index('ix_token_revocations_revoked_at', 'token_revocations', ['revoked_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_token_revocations_revoked_at', table_name='token_revocations')
+    op.drop_table('token_revocations')
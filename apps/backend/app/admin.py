@@ -1,19 +1,111 @@
 """Flask-Admin configuration"""
+import threading
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.filters import BaseSQLAFilter
 from flask_login import current_user
-from flask import redirect, url_for, request
-from .models import User, Credit, Transaction, APIKey, Fingerprint, db
+from flask import current_app, redirect, url_for, request
+from .models import User, Plan, Credit, Transaction, APIKey, Fingerprint, db
+from .ratelimit import parse_limit
+from .replicas import route_reads_to_replica
+from .usage import refresh_active_keys
+from .admin_stats import init_admin_stats
+from .components import MISSING_COMPONENTS
 
 class SecureModelView(ModelView):
     """Base model view with authentication"""
     
+    # Build form/column scaffolding on first use instead of at app startup
+    lazy_scaffolding = True
+    
+    def __init__(self, *args, **kwargs):
+        self._cache_ready = False
+        self._cache_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+    
+    def _refresh_cache(self):
+        if self.lazy_scaffolding and not self._cache_ready:
+            # ModelView.__init__ still needs the list columns to compute joins
+            self._list_columns = self.get_list_columns()
+            return
+        super()._refresh_cache()
+        self._cache_ready = True
+    
+    def ensure_cache(self):
+        """Build the scaffolding cache if it has not been built yet"""
+        if self._cache_ready:
+            return
+        with self._cache_lock:
+            if not self._cache_ready:
+                super()._refresh_cache()
+                self._cache_ready = True
+    
+    def _handle_view(self, name, **kwargs):
+        abort = super()._handle_view(name, **kwargs)
+        if abort is None:
+            self.ensure_cache()
+            if name == 'index_view':
+                # List pages only read; edits and exports stay on the primary
+                route_reads_to_replica()
+        return abort
+    
     def is_accessible(self):
         return current_user.is_authenticated and current_user.is_admin
     
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for('auth_blueprint.login', next=request.url))
 
+class KeysetModelView(SecureModelView):
+    """
+    Model view paged by primary key instead of OFFSET, with no COUNT(*)
+    Applies to the default ordering (newest id first); an explicit column sort
+    falls back to offset paging, still without the count query.
+    """
+    
+    simple_list_pager = True
+    column_default_sort = ('id', True)
+    list_template = 'admin/model/keyset_list.html'
+    
+    def keyset_active(self):
+        """Keyset paging is used unless the user picked a sort column"""
+        return request.args.get('sort') is None
+    
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        if not self.keyset_active():
+            return super().get_list(page, sort_column, sort_desc, search, filters,
+                                    execute=execute, page_size=page_size)
+        
+        # Search, filters and default sort without any LIMIT/OFFSET
+        count, query = super().get_list(None, None, None, search, filters,
+                                        execute=False, page_size=False)
+        
+        after = request.args.get('after', type=int)
+        if after is not None:
+            query = query.filter(self.model.id < after)
+        
+        query = query.limit(page_size or self.page_size)
+        
+        return count, query.all() if execute else query
+    
+    def keyset_next_url(self, data):
+        """URL of the page after the given rows, or None on the last page"""
+        page_size = request.args.get('page_size', self.page_size, type=int)
+        if not data or len(data) < page_size:
+            return None
+        
+        args = request.args.to_dict()
+        args.pop('page', None)
+        args['after'] = data[-1].id
+        return url_for('.index_view', **args)
+    
+    def keyset_first_url(self):
+        """URL of the first (newest) page with the current search and filters"""
+        args = request.args.to_dict()
+        args.pop('page', None)
+        args.pop('after', None)
+        return url_for('.index_view', **args)
+
 class SecureAdminIndexView(AdminIndexView):
     """Secure admin index view"""
     
@@ -22,34 +114,52 @@ class SecureAdminIndexView(AdminIndexView):
         if not current_user.is_authenticated or not current_user.is_admin:
             return redirect(url_for('auth_blueprint.login'))
         
-        # Get statistics
-        user_count = User.query.count()
-        fingerprint_count = Fingerprint.query.count()
-        total_credits_purchased = db.session.query(
-            db.func.sum(Credit.total_purchased)
-        ).scalar() or 0
-        total_credits_used = db.session.query(
-            db.func.sum(Credit.total_used)
-        ).scalar() or 0
+        # Get statistics (estimated/cached unless exact counts are requested)
+        exact = request.args.get('exact') == '1'
+        stats = current_app.extensions['admin_stats'].get(exact=exact)
         
         return self.render(
             'admin/index.html',
-            user_count=user_count,
-            fingerprint_count=fingerprint_count,
-            total_credits_purchased=total_credits_purchased,
-            total_credits_used=total_credits_used
+            stats_age=int(stats.age),
+            stats_exact=stats.exact,
+            **stats.values
         )
 
 class UserAdmin(SecureModelView):
     """User admin view"""
-    column_list = ['id', 'username', 'email', 'is_admin', 'is_active', 'created_at']
+    column_list = ['id', 'username', 'email', 'plan_name', 'is_admin', 'is_active', 'created_at']
     column_searchable_list = ['username', 'email']
     column_filters = ['is_admin', 'is_active', 'created_at']
-    form_excluded_columns = ['password_hash', 'credits', 'transactions', 'api_keys']
+    form_excluded_columns = ['password_hash', 'credits', 'transactions', 'api_keys', 'usage_counter', 'daily_usage', 'usage_rollups']
+    
+    can_create = True
+    can_edit = True
+    can_delete = True
+
+def _validate_rate_limit(model):
+    if model.rate_limit:
+        parse_limit(model.rate_limit)  # Flask-Admin flashes the ValueError
+    if model.max_concurrent is not None and model.max_concurrent < 0:
+        raise ValueError("max_concurrent must be 0 (unlimited) or more")
+
+class PlanAdmin(SecureModelView):
+    """Rate limit plan admin view"""
+    column_list = ['name', 'rate_limit', 'max_concurrent']
+    form_columns = ['name', 'rate_limit', 'max_concurrent']
+    column_display_pk = True
     
     can_create = True
     can_edit = True
     can_delete = True
+    
+    def on_model_change(self, form, model, is_created):
+        _validate_rate_limit(model)
+    
+    def after_model_change(self, form, model, is_created):
+        current_app.extensions['rate_limit_plans'].invalidate()
+    
+    def after_model_delete(self, model):
+        current_app.extensions['rate_limit_plans'].invalidate()
 
 class CreditAdmin(SecureModelView):
     """Credit admin view"""
@@ -61,7 +171,7 @@ class CreditAdmin(SecureModelView):
     can_edit = True
     can_delete = False
 
-class TransactionAdmin(SecureModelView):
+class TransactionAdmin(KeysetModelView):
     """Transaction admin view"""
     column_list = ['id', 'user_id', 'amount', 'transaction_type', 'description', 'created_at']
     column_searchable_list = ['user_id', 'description', 'stripe_payment_id']
@@ -73,26 +183,67 @@ class TransactionAdmin(SecureModelView):
 
 class APIKeyAdmin(SecureModelView):
     """API Key admin view"""
-    column_list = ['id', 'user_id', 'name', 'is_active', 'created_at', 'last_used']
+    column_list = ['id', 'user_id', 'name', 'is_active', 'rate_limit', 'max_concurrent', 'created_at', 'last_used']
     column_searchable_list = ['name', 'key']
     column_filters = ['is_active', 'created_at', 'last_used']
     
     can_create = False
     can_edit = True
     can_delete = True
+    
+    def on_model_change(self, form, model, is_created):
+        _validate_rate_limit(model)
+    
+    def after_model_change(self, form, model, is_created):
+        refresh_active_keys(model.user_id)
+        self.session.commit()
+    
+    def after_model_delete(self, model):
+        refresh_active_keys(model.user_id)
+        self.session.commit()
 
-class FingerprintAdmin(SecureModelView):
+class MissingComponentFilter(BaseSQLAFilter):
+    """Fingerprints whose browser did not provide a component (a missing_components bit)"""
+    
+    def __init__(self, column, name):
+        options = [(str(bit), component) for component, (bit, _) in MISSING_COMPONENTS.items()]
+        super().__init__(column, name, options=options)
+    
+    def validate(self, value):
+        return value.isdigit()
+    
+    def clean(self, value):
+        return int(value)
+    
+    def apply(self, query, value, alias=None):
+        return query.filter(self.get_column(alias).op('&')(value) != 0)
+    
+    def operation(self):
+        return 'is missing'
+
+class FingerprintAdmin(KeysetModelView):
     """Fingerprint admin view"""
     column_list = ['id', 'hash', 'risk_score', 'is_bot', 'visit_count', 'first_seen', 'last_seen']
     column_searchable_list = ['hash']
-    column_filters = ['is_bot', 'risk_score', 'first_seen']
+    column_filters = [
+        'is_bot', 'risk_score', 'first_seen',
+        # Parsed component columns (app.components)
+        'cpu_cores', 'device_memory', 'screen_width', 'screen_height', 'max_touch_points', 'tz_offset',
+        MissingComponentFilter(Fingerprint.missing_components, 'Component'),
+    ]
     
     can_create = False
     can_edit = False
     can_delete = True
 
 def init_admin(app):
-    """Initialize Flask-Admin"""
+    """
+    Initialize Flask-Admin
+    Model views defer their scaffolding unless ADMIN_LAZY_VIEWS is disabled
+    """
+    SecureModelView.lazy_scaffolding = app.config.get('ADMIN_LAZY_VIEWS', True)
+    init_admin_stats(app)
+    
     admin = Admin(
         app,
         name='SixFinger Admin',
@@ -102,9 +253,16 @@ def init_admin(app):
     
     # Add views
     admin.add_view(UserAdmin(User, db.session, name='Users'))
+    admin.add_view(PlanAdmin(Plan, db.session, name='Plans'))
     admin.add_view(CreditAdmin(Credit, db.session, name='Credits'))
     admin.add_view(TransactionAdmin(Transaction, db.session, name='Transactions'))
     admin.add_view(APIKeyAdmin(APIKey, db.session, name='API Keys'))
     admin.add_view(FingerprintAdmin(Fingerprint, db.session, name='Fingerprints'))
     
     return admin
+
+def warm_admin(admin):
+    """Build every model view's scaffolding up front (e.g. in a preforking master)"""
+    for view in admin._views:
+        if isinstance(view, SecureModelView):
+            view.ensure_cache()
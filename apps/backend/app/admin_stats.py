@@ -0,0 +1,130 @@
+"""Approximate and cached statistics for the admin index page"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import text
+
+from .models import User, Credit, Fingerprint, db
+
+# Tables whose row counts are shown on the admin index, by stat name
+COUNTED_TABLES = {
+    'user_count': User,
+    'fingerprint_count': Fingerprint,
+}
+
+class StatsSnapshot:
+    """Admin statistics computed at a point in time"""
+
+    def __init__(self, values, exact, computed_at=None):
+        self.values = values
+        self.exact = exact
+        self.computed_at = computed_at if computed_at is not None else time.time()
+
+    @property
+    def age(self):
+        """Seconds since the snapshot was computed"""
+        return time.time() - self.computed_at
+
+class AdminStatsProvider:
+    """
+    Serves admin index statistics without scanning large tables on every page load
+    On PostgreSQL row counts come from planner estimates (pg_class.reltuples);
+    elsewhere they are exact counts. Snapshots are cached for `ttl` seconds and
+    refreshed in a background thread once stale, serving the stale snapshot meanwhile.
+    """
+
+    def __init__(self, ttl=300, use_estimates=True):
+        self.ttl = ttl
+        self.use_estimates = use_estimates
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self, exact=False):
+        """Return a snapshot; exact=True always computes exact counts synchronously"""
+        if exact:
+            return self.refresh(exact=True)
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+
+        if snapshot.age > self.ttl:
+            self._refresh_in_background()
+
+        return snapshot
+
+    def refresh(self, exact=False):
+        """Compute and cache a new snapshot"""
+        snapshot = StatsSnapshot(self._compute(exact), exact=exact or not self._estimating())
+        self._snapshot = snapshot
+        return snapshot
+
+    def _estimating(self):
+        return self.use_estimates and db.engine.dialect.name == 'postgresql'
+
+    def _compute(self, exact):
+        values = {}
+
+        if not exact and self._estimating():
+            values.update(self._estimated_counts())
+
+        # Fingerprints may be spread over shards: gather the count from each
+        shards = current_app.extensions.get('fingerprint_shards')
+        if shards is not None and shards.sharded:
+            values['fingerprint_count'] = shards.count(estimate=not exact and self.use_estimates)
+
+        for name, model in COUNTED_TABLES.items():
+            if name not in values:
+                values[name] = db.session.query(db.func.count()).select_from(model).scalar()
+
+        values['total_credits_purchased'] = db.session.query(
+            db.func.sum(Credit.total_purchased)
+        ).scalar() or 0
+        values['total_credits_used'] = db.session.query(
+            db.func.sum(Credit.total_used)
+        ).scalar() or 0
+
+        return values
+
+    def _estimated_counts(self):
+        """Planner row estimates; tables never analyzed (reltuples < 0) are left out"""
+        names = {model.__tablename__: name for name, model in COUNTED_TABLES.items()}
+        rows = db.session.execute(
+            text(
+                "SELECT relname, reltuples::bigint FROM pg_class "
+                "WHERE relkind = 'r' AND relname = ANY(:tables) "
+                "AND pg_table_is_visible(oid)"
+            ),
+            {'tables': list(names)}
+        )
+        return {names[relname]: estimate for relname, estimate in rows if estimate >= 0}
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    self.refresh()
+            except Exception as e:
+                app.logger.error(f"Error refreshing admin stats: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='admin-stats-refresh', daemon=True).start()
+
+def init_admin_stats(app):
+    """Create the app's admin stats provider"""
+    provider = AdminStatsProvider(
+        ttl=app.config.get('ADMIN_STATS_TTL', 300),
+        use_estimates=app.config.get('ADMIN_STATS_ESTIMATES', True)
+    )
+    app.extensions['admin_stats'] = provider
+    return provider
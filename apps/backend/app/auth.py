@@ -3,7 +3,10 @@ from functools import wraps
 from datetime import datetime
 from flask import jsonify, request, session
 from flask_login import current_user
-from .models import User, APIKey, Credit, Transaction, db
+from .models import User, APIKey, Credit, db
+from .ratelimit import enforce_api_key_limits, enforce_default_limit, exempt
+from .tokens import TokenError, api_tokens, is_token
+from .usage import record_usage, refund_usage
 import secrets
 
 def generate_api_key():
@@ -11,34 +14,50 @@ def generate_api_key():
     return secrets.token_urlsafe(48)
 
 def require_api_key(f):
-    """Decorator to require API key for endpoints"""
+    """
+    Decorator to require API key for endpoints
+    Accepts opaque keys and signed tokens (app.tokens, checked without a query).
+    Valid keys are rate limited per key instead of per client IP.
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
         api_key = request.headers.get('X-API-Key')
         
         if not api_key:
-            return jsonify({"error": "API key required"}), 401
+            return enforce_default_limit() or (jsonify({"error": "API key required"}), 401)
         
-        # Check API key
-        key_obj = APIKey.query.filter_by(key=api_key, is_active=True).first()
-        if not key_obj:
-            return jsonify({"error": "Invalid API key"}), 401
-        
-        # Update last used with Python datetime
-        key_obj.last_used = datetime.utcnow()
-        db.session.commit()
+        tokens = api_tokens()
+        if tokens is not None and is_token(api_key):
+            try:
+                user, key_obj = tokens.verify(api_key)
+            except TokenError as e:
+                return enforce_default_limit() or (jsonify({"error": str(e)}), 401)
+        else:
+            # Check API key
+            key_obj = APIKey.query.filter_by(key=api_key, is_active=True).first()
+            if not key_obj:
+                return enforce_default_limit() or (jsonify({"error": "Invalid API key"}), 401)
+            
+            # Update last used with Python datetime
+            key_obj.last_used = datetime.utcnow()
+            db.session.commit()
+            
+            # Check user is active
+            user = User.query.get(key_obj.user_id)
+            if not user or not user.is_active:
+                return jsonify({"error": "User account is not active"}), 401
         
-        # Check user is active
-        user = User.query.get(key_obj.user_id)
-        if not user or not user.is_active:
-            return jsonify({"error": "User account is not active"}), 401
+        limited = enforce_api_key_limits(key_obj, user)
+        if limited is not None:
+            return limited
         
-        # Attach user to request
+        # Attach user and key to request
         request.current_user = user
+        request.api_key = key_obj
         
         return f(*args, **kwargs)
     
-    return decorated_function
+    return exempt(decorated_function)
 
 def require_credits(cost=1):
     """Decorator to require credits for API usage"""
@@ -63,14 +82,14 @@ def require_credits(cost=1):
             credit.balance -= cost
             credit.total_used += cost
             
-            # Record transaction
-            transaction = Transaction(
-                user_id=user.id,
-                amount=-cost,
-                transaction_type='usage',
-                description=f'API call: {request.endpoint}'
+            # Record usage in the per-minute rollups (no per-call transaction row)
+            api_key = getattr(request, 'api_key', None)
+            record_usage(
+                user.id,
+                cost,
+                api_key_id=api_key.id if api_key else None,
+                endpoint=request.endpoint
             )
-            db.session.add(transaction)
             db.session.commit()
             
             # Attach credit info to request
@@ -82,6 +101,24 @@ def require_credits(cost=1):
         return decorated_function
     return decorator
 
+def refund_credits():
+    """
+    Give back the credits require_credits took for this request
+    For requests refused before doing any work, so a retry is not billed twice.
+    """
+    cost = getattr(request, 'credits_used', 0)
+    if not cost:
+        return
+    user = request.current_user
+    credit = Credit.query.filter_by(user_id=user.id).first()
+    credit.balance += cost
+    credit.total_used -= cost
+    api_key = getattr(request, 'api_key', None)
+    refund_usage(user.id, cost, api_key_id=api_key.id if api_key else None, endpoint=request.endpoint)
+    db.session.commit()
+    request.credits_used = 0
+    request.credits_remaining = credit.balance
+
 def admin_required(f):
     """Decorator to require admin privileges"""
     @wraps(f)
@@ -0,0 +1,430 @@
+"""
+Bloom filter of stored fingerprint hashes
+Lookups of hashes that were never submitted (scrapers probing random hashes)
+are answered from the filter without a query. A miss is definite; a hit may
+be a false positive at about BLOOM_ERROR_RATE while the filter holds up to
+BLOOM_CAPACITY hashes, and goes to the database as before.
+
+A background thread in each process reads rows stored since its last pass
+(by id, on every shard) into the filter, and submit_fingerprint, bulk imports
+and shard moves add their hashes as they write. Lookups go to the database
+until the first full pass is done.
+
+A row must never be missed (that would be a wrong 404), and ids are allocated
+before their transaction commits, so a pass can see id 5000 before id 100
+commits. Each pass therefore remembers the ids it skipped as gaps and
+re-reads them on every later pass until rows show up there, up to the next
+rebuild, which reads everything again. Gaps left by rollbacks and deletes stay
+empty; past MAX_SYNC_GAPS per shard the closest ones are merged (re-reading
+the few rows between them).
+
+BLOOM_FILTER selects where the bits live:
+- "local": in each process. Another process learns a new hash on its next
+  pass, up to BLOOM_SYNC_INTERVAL seconds later.
+- "redis": in Redis, shared by every process. The pass runs in one process at
+  a time.
+Either way the filter is rebuilt every BLOOM_REBUILD_INTERVAL seconds (in
+Redis: built in memory, then swapped in). Redis errors fail open: the lookup
+goes to the database.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import or_, select
+
+from .models import Fingerprint
+from .ratelimit import storage_from_url
+
+BLOOM_MODES = ('local', 'redis', 'off')
+SYNC_BATCH_SIZE = 10000
+# Ranges of skipped ids re-read on each pass, per shard
+MAX_SYNC_GAPS = 100
+# Seconds the shared pass lock is held without progress before another process takes over
+REDIS_LOCK_TTL = 60
+
+def bloom_parameters(capacity, error_rate):
+    """(bits, hash functions) for `capacity` keys at `error_rate` false positives"""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+class LocalBits:
+    """Bit array in process memory"""
+
+    def __init__(self, size):
+        self.array = bytearray((size + 7) // 8)
+
+    def set(self, position_lists):
+        array = self.array
+        for positions in position_lists:
+            for p in positions:
+                array[p >> 3] |= 0x80 >> (p & 7)
+
+    def test(self, positions):
+        array = self.array
+        return all(array[p >> 3] & (0x80 >> (p & 7)) for p in positions)
+
+    def count(self):
+        return int.from_bytes(self.array, 'big').bit_count()
+
+    @property
+    def memory(self):
+        return len(self.array)
+
+class RedisBits:
+    """Bit array in a Redis string (SETBIT/GETBIT, one pipelined round trip per call)"""
+
+    def __init__(self, client, key, size):
+        self.client = client
+        self.key = key
+        self.memory = (size + 7) // 8
+
+    def set(self, position_lists):
+        pipe = self.client.pipeline(transaction=False)
+        for positions in position_lists:
+            for p in positions:
+                pipe.setbit(self.key, p, 1)
+        pipe.execute()
+
+    def test(self, positions):
+        pipe = self.client.pipeline(transaction=False)
+        for p in positions:
+            pipe.getbit(self.key, p)
+        return all(pipe.execute())
+
+    def count(self):
+        return self.client.bitcount(self.key)
+
+class BloomFilter:
+    """Bloom filter over strings with double hashing of one blake2b digest"""
+
+    def __init__(self, capacity, error_rate, bits=LocalBits):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size, self.hashes = bloom_parameters(capacity, error_rate)
+        self.bits = bits(self.size)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        self.bits.set([self.positions(key)])
+
+    def add_many(self, keys):
+        self.bits.set([self.positions(key) for key in keys])
+
+    def __contains__(self, key):
+        return self.bits.test(self.positions(key))
+
+    def false_positive_rate(self):
+        """Estimated from the share of bits set"""
+        return (self.bits.count() / self.size) ** self.hashes
+
+class KnownHashes:
+    """The app's filter of stored hashes, its sync thread and its counters"""
+
+    def __init__(self, app, capacity, error_rate, redis=None, sync_interval=1.0,
+                 rebuild_interval=3600.0, prefix='bloom:fingerprints'):
+        self.app = app
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.redis = redis
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.bloom = None
+        self.ready = False
+        self._positions = {}
+        self._built_at = 0.0
+        if redis is not None:
+            size, hashes = bloom_parameters(capacity, error_rate)
+            # Keys name the parameters, so resizing starts a new filter
+            self.prefix = f"{prefix}:{size}:{hashes}"
+            self.bloom = BloomFilter(
+                capacity, error_rate,
+                bits=lambda size: RedisBits(redis, f"{self.prefix}:bits", size)
+            )
+        self.lookups = 0
+        self.misses = 0
+        self.false_positives = 0
+        self.adds = 0
+        self.errors = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def shared(self):
+        return self.redis is not None
+
+    def check(self, hash):
+        """False if the hash is certainly not stored, True if it may be, None before the first pass"""
+        self.start()
+        self.lookups += 1
+        if not self.ready:
+            return None
+        try:
+            found = hash in self.bloom
+        except Exception as e:
+            self.errors += 1
+            current_app.logger.warning(f"Bloom filter lookup failed: {e}")
+            return None
+        if not found:
+            self.misses += 1
+        return found
+
+    def record_false_positive(self):
+        """A hash the filter passed turned out not to be stored"""
+        self.false_positives += 1
+
+    def add(self, hash):
+        """Record a stored hash; a failure is repaired by the next sync pass"""
+        self.add_many([hash])
+
+    def add_many(self, hashes):
+        bloom = self.bloom
+        if bloom is None:
+            return
+        try:
+            bloom.add_many(hashes)
+            self.adds += len(hashes)
+        except Exception as e:
+            self.errors += 1
+            current_app.logger.warning(f"Bloom filter add failed: {e}")
+
+    # Sync
+
+    def sync(self):
+        """Read rows stored since the last pass; returns how many"""
+        if not self.shared:
+            if self.bloom is None or time.monotonic() - self._built_at >= self.rebuild_interval:
+                return self._rebuild()
+            return self._read_new_rows(self.bloom, self._positions.get, self._positions.__setitem__)
+
+        token = uuid.uuid4().hex
+        lock_key = f"{self.prefix}:lock"
+        if not self.redis.set(lock_key, token, ex=REDIS_LOCK_TTL, nx=True):
+            # Another process is reading; just follow its ready flag
+            self.ready = self.redis.get(f"{self.prefix}:ready") is not None
+            return 0
+        try:
+            added = 0
+            built_at = self.redis.get(f"{self.prefix}:built")
+            if built_at is None or time.time() - float(built_at) >= self.rebuild_interval:
+                added = self._rebuild_shared(lock_key)
+
+            def position(shard):
+                value = self.redis.get(f"{self.prefix}:pos:{shard}")
+                return json.loads(value) if value is not None else None
+
+            def save_position(shard, state):
+                self.redis.set(f"{self.prefix}:pos:{shard}", json.dumps(state))
+                self.redis.expire(lock_key, REDIS_LOCK_TTL)
+
+            # After a rebuild: rows committed while it was reading
+            added += self._read_new_rows(self.bloom, position, save_position)
+            self.redis.set(f"{self.prefix}:ready", 1)
+            self.ready = True
+            return added
+        finally:
+            if self.redis.get(lock_key) == token.encode():
+                self.redis.delete(lock_key)
+
+    def _rebuild(self):
+        """Fill a new local filter from every row, then swap it in"""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        positions = {}
+        added = self._read_new_rows(bloom, positions.get, positions.__setitem__)
+        self.bloom, self._positions = bloom, positions
+        self._built_at = time.monotonic()
+        self.ready = True
+        return added
+
+    def _rebuild_shared(self, lock_key):
+        """Fill a filter in memory from every row, then replace the Redis bits with it"""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        positions = {}
+
+        def save_position(shard, state):
+            positions[shard] = state
+            self.redis.expire(lock_key, REDIS_LOCK_TTL)
+
+        added = self._read_new_rows(bloom, positions.get, save_position)
+        pipe = self.redis.pipeline(transaction=True)
+        # LocalBits uses Redis's bit order, so the array is the bitmap
+        pipe.set(f"{self.prefix}:rebuild", bytes(bloom.bits.array))
+        pipe.rename(f"{self.prefix}:rebuild", f"{self.prefix}:bits")
+        for shard, state in positions.items():
+            pipe.set(f"{self.prefix}:pos:{shard}", json.dumps(state))
+        pipe.set(f"{self.prefix}:built", time.time())
+        pipe.execute()
+        return added
+
+    def _read_new_rows(self, bloom, position, save_position):
+        shards = current_app.extensions['fingerprint_shards']
+        names = ['main', *shards.engines]
+        table = Fingerprint.__table__
+        added = 0
+        for name in names:
+            engine = shards.engine(name)
+            state = position(name) or {'last': 0, 'gaps': []}
+            gaps, found = _read_gaps(engine, bloom, state['gaps'])
+            added += found
+            last_id = state['last']
+            while True:
+                with engine.connect() as conn:
+                    rows = conn.execute(
+                        select(table.c.id, table.c.hash)
+                        .where(table.c.id > last_id)
+                        .order_by(table.c.id)
+                        .limit(SYNC_BATCH_SIZE)
+                    ).all()
+                if not rows:
+                    break
+                bloom.add_many([row.hash for row in rows])
+                for row in rows:
+                    if row.id > last_id + 1:
+                        # Not committed yet, rolled back or deleted
+                        gaps.append([last_id + 1, row.id - 1])
+                    last_id = row.id
+                gaps = _merge_gaps(gaps)
+                save_position(name, {'last': last_id, 'gaps': gaps})
+                added += len(rows)
+            save_position(name, {'last': last_id, 'gaps': gaps})
+        return added
+
+    # Background thread, started lazily so each forked server process runs its own
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self.run, name='bloom-sync', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        while not self._stopping:
+            try:
+                with self.app.app_context():
+                    self.sync()
+            except Exception as e:
+                self.errors += 1
+                self.app.logger.error(f"Bloom filter sync error: {e}")
+            self._wake.wait(self.sync_interval)
+
+    def stats(self):
+        """Configuration, size and counters for the metrics endpoint"""
+        size, hashes = bloom_parameters(self.capacity, self.error_rate)
+        stats = {
+            'mode': 'redis' if self.shared else 'local',
+            'ready': self.ready,
+            'capacity': self.capacity,
+            'error_rate': self.error_rate,
+            'bits': size,
+            'hash_functions': hashes,
+            'memory_bytes': (size + 7) // 8,
+            'lookups': self.lookups,
+            'definite_misses': self.misses,
+            'false_positives': self.false_positives,
+            'adds': self.adds,
+            'errors': self.errors,
+        }
+        # Share of absent hashes the filter let through
+        probes = self.misses + self.false_positives
+        stats['observed_false_positive_rate'] = self.false_positives / probes if probes else None
+        try:
+            stats['estimated_false_positive_rate'] = (
+                self.bloom.false_positive_rate() if self.bloom is not None else None
+            )
+        except Exception:
+            stats['estimated_false_positive_rate'] = None
+        return stats
+
+def _read_gaps(engine, bloom, gaps):
+    """Add rows that appeared in skipped id ranges; returns (ranges still empty, rows found)"""
+    if not gaps:
+        return [], 0
+    table = Fingerprint.__table__
+    pending = [list(gap) for gap in sorted(gaps)]
+    remaining = []
+    found = 0
+    i = 0
+    after = 0
+    while i < len(pending):
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.hash)
+                .where(table.c.id > after, or_(*[table.c.id.between(lo, hi) for lo, hi in pending[i:]]))
+                .order_by(table.c.id)
+                .limit(SYNC_BATCH_SIZE)
+            ).all()
+        if not rows:
+            break
+        bloom.add_many([row.hash for row in rows])
+        for row in rows:
+            # Split the range holding this id around it
+            while pending[i][1] < row.id:
+                remaining.append(pending[i])
+                i += 1
+            if row.id > pending[i][0]:
+                remaining.append([pending[i][0], row.id - 1])
+            pending[i][0] = row.id + 1
+            if pending[i][0] > pending[i][1]:
+                i += 1
+        after = rows[-1].id
+        found += len(rows)
+    remaining.extend(gap for gap in pending[i:] if gap[0] <= gap[1])
+    return remaining, found
+
+def _merge_gaps(gaps):
+    """At most MAX_SYNC_GAPS ranges, merging the closest neighbours"""
+    gaps = sorted(gaps)
+    while len(gaps) > MAX_SYNC_GAPS:
+        i = min(range(len(gaps) - 1), key=lambda i: gaps[i + 1][0] - gaps[i][1])
+        gaps[i:i + 2] = [[gaps[i][0], gaps[i + 1][1]]]
+    return gaps
+
+def known_hashes():
+    """The app's KnownHashes, or None when BLOOM_FILTER is off"""
+    return current_app.extensions.get('known_hashes')
+
+def init_bloom(app):
+    """Create the app's hash filter from the BLOOM_* settings"""
+    mode = app.config.get('BLOOM_FILTER', 'local')
+    if mode not in BLOOM_MODES:
+        raise ValueError(f"BLOOM_FILTER must be one of {', '.join(BLOOM_MODES)}")
+    known = None
+    if mode != 'off':
+        redis = None
+        if mode == 'redis':
+            redis = storage_from_url(app.config.get('BLOOM_REDIS_URL'), timeout=1.0)
+            if redis is None:
+                raise RuntimeError("BLOOM_FILTER=redis needs the redis package")
+        known = KnownHashes(
+            app,
+            capacity=app.config.get('BLOOM_CAPACITY', 10_000_000),
+            error_rate=app.config.get('BLOOM_ERROR_RATE', 0.01),
+            redis=redis,
+            sync_interval=app.config.get('BLOOM_SYNC_INTERVAL', 1.0),
+            rebuild_interval=app.config.get('BLOOM_REBUILD_INTERVAL', 3600.0)
+        )
+    app.extensions['known_hashes'] = known
+    return known
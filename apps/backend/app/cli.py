@@ -0,0 +1,355 @@
+"""Flask CLI commands"""
+import csv
+import random
+import sys
+import click
+from flask import current_app
+from sqlalchemy import LargeBinary, bindparam, select, type_coerce, update
+from .components import parse_components
+from .compression import compression, train_dictionary
+from .models import (
+    COMPONENT_COLUMNS,
+    COMPRESSED_COLUMNS,
+    PARSED_COLUMNS,
+    CompressionDictionary,
+    Fingerprint,
+    db,
+)
+from .export import (
+    EXPORT_FORMATS,
+    export_stream,
+    stream_fingerprint_rows,
+    fingerprint_export_query,
+    usage_export_query,
+)
+from .importer import (
+    IMPORT_CHUNK_SIZE,
+    IMPORT_FORMATS,
+    detect_format,
+    import_fingerprints,
+    open_import_file,
+)
+from .risk_model import train
+from .sharding import move_range
+from .usage import rebuild_usage_counters
+from .visits import drop_expired, ensure_partitions
+from .webhooks import WebhookWorker, process_pending_events
+
+def _write_export(stmt, fmt, compress, output, **options):
+    """Stream an export to a file (or stdout for '-')"""
+    out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        for chunk in export_stream(stmt, fmt, compress=compress, **options):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+def _labeled_fingerprints(labels, batch_size=1000):
+    """(components, visit_count, label) for each labeled hash found on any shard"""
+    shards = current_app.extensions['fingerprint_shards']
+    table = Fingerprint.__table__
+    columns = [table.c.hash, table.c.visit_count, *(table.c[c] for c in COMPONENT_COLUMNS.values())]
+    hashes = list(labels)
+    for i in range(0, len(hashes), batch_size):
+        stmt = select(*columns).where(table.c.hash.in_(hashes[i:i + batch_size]))
+        for rows in shards.stream(stmt, batch_size):
+            for row in rows:
+                components = {name: row._mapping[column] for name, column in COMPONENT_COLUMNS.items()}
+                yield components, row.visit_count or 1, labels[row.hash]
+
+def _backfill_components(engine, batch_size):
+    """Fill the parsed component columns of rows stored before them; returns the count"""
+    table = Fingerprint.__table__
+    columns = [table.c.id, *(table.c[c] for c in COMPONENT_COLUMNS.values())]
+    fill = update(table).where(table.c.id == bindparam('_id')).values(
+        **{column: bindparam(column) for column in PARSED_COLUMNS}
+    )
+    filled, after = 0, 0
+    while True:
+        # Keyset by id: filled rows leave the NULL set, so no OFFSET drift
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(*columns)
+                .where(table.c.missing_components.is_(None), table.c.id > after)
+                .order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return filled
+            conn.execute(fill, [
+                {'_id': row.id, **parse_components(
+                    {name: row._mapping[column] for name, column in COMPONENT_COLUMNS.items()}
+                )}
+                for row in rows
+            ])
+        filled += len(rows)
+        after = rows[-1].id
+
+def _sample_column(column, sample):
+    """Up to `sample` of the most recent non-null values of a column, across all shards"""
+    shards = current_app.extensions['fingerprint_shards']
+    table = Fingerprint.__table__
+    values = []
+    for name in ['main', *shards.engines]:
+        with shards.engine(name).connect() as conn:
+            values.extend(conn.scalars(
+                select(table.c[column]).where(table.c[column].is_not(None))
+                .order_by(table.c.id.desc()).limit(sample)
+            ))
+    return random.sample(values, sample) if len(values) > sample else values
+
+def _compress_components(engine, batch_size, decompress=False):
+    """
+    Rewrite compressed columns with the current dictionaries (or as plain text)
+    Returns (rows rewritten, stored bytes before, stored bytes after).
+    """
+    registry = compression()
+    table = Fingerprint.__table__
+    # Stored bytes as they are, without decompressing
+    raw = [type_coerce(table.c[column], LargeBinary).label(column) for column in COMPRESSED_COLUMNS]
+    rewrite = update(table).where(table.c.id == bindparam('_id')).values(
+        **{column: bindparam(f'_{column}', type_=LargeBinary) for column in COMPRESSED_COLUMNS}
+    )
+    rewritten = before = after = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, *raw).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return rewritten, before, after
+            changes = []
+            for row in rows:
+                values, changed = {'_id': row.id}, False
+                for column in COMPRESSED_COLUMNS:
+                    stored = row._mapping[column]
+                    if isinstance(stored, str):
+                        stored = stored.encode('utf-8')
+                    if stored is not None:
+                        before += len(stored)
+                        version = registry.version_of(stored)
+                        if decompress:
+                            if version is not None:
+                                stored, changed = registry.decompress(stored).encode('utf-8'), True
+                        elif version != registry.current_version(column):
+                            compressed = registry.compress(column, registry.decompress(stored))
+                            changed = changed or compressed != stored
+                            stored = compressed
+                        after += len(stored)
+                    values[f'_{column}'] = stored
+                if changed:
+                    changes.append(values)
+            if changes:
+                conn.execute(rewrite, changes)
+        rewritten += len(changes)
+        last_id = rows[-1].id
+
+def _read_labels(fh):
+    """{hash: is_bot} from a CSV with hash and is_bot columns"""
+    labels = {}
+    for line_no, row in enumerate(csv.DictReader(fh), 2):
+        try:
+            value = row['is_bot'].strip().lower()
+            labels[row['hash'].strip()] = value in ('1', 'true', 'yes', 'bot')
+        except (KeyError, AttributeError):
+            raise click.ClickException(f"Line {line_no}: expected hash and is_bot columns")
+    return labels
+
+def register_commands(app):
+    """Register CLI commands on the app"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create all database tables (and the fingerprints table on every shard)"""
+        db.create_all()
+        app.extensions['fingerprint_shards'].create_tables()
+        ensure_partitions(db.engine)
+        click.echo("Database tables created.")
+
+    @app.cli.command('reconcile-usage')
+    @click.option('--user-id', type=int, default=None, help='Only rebuild this user')
+    def reconcile_usage_command(user_id):
+        """Rebuild usage counters from the per-minute usage rollups"""
+        count = rebuild_usage_counters(user_id)
+        click.echo(f"Rebuilt usage counters for {count} user(s).")
+
+    @app.cli.command('export-fingerprints')
+    @click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson')
+    @click.option('--since', type=click.DateTime(), default=None, help='first_seen >= since')
+    @click.option('--until', type=click.DateTime(), default=None, help='first_seen < until')
+    @click.option('--is-bot/--not-bot', default=None, help='Only bots / only non-bots')
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+    @click.option('-o', '--output', default='-', help='Output file (default stdout)')
+    def export_fingerprints_command(fmt, since, until, is_bot, compress, output):
+        """Stream all fingerprints as NDJSON or CSV"""
+        stmt = fingerprint_export_query(since=since, until=until, is_bot=is_bot)
+        _write_export(stmt, fmt, compress, output, stream=stream_fingerprint_rows)
+
+    @app.cli.command('export-usage')
+    @click.option('--user-id', type=int, required=True)
+    @click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson')
+    @click.option('--since', type=click.DateTime(), default=None, help='bucket >= since')
+    @click.option('--until', type=click.DateTime(), default=None, help='bucket < until')
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+    @click.option('-o', '--output', default='-', help='Output file (default stdout)')
+    def export_usage_command(user_id, fmt, since, until, compress, output):
+        """Stream a user's usage rollups as NDJSON or CSV"""
+        stmt = usage_export_query(user_id, since=since, until=until)
+        _write_export(stmt, fmt, compress, output)
+
+    @app.cli.command('import-fingerprints')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None,
+                  help='Input format (default: from the file extension)')
+    @click.option('--chunk-size', type=click.IntRange(min=1), default=IMPORT_CHUNK_SIZE,
+                  help='Rows validated, scored and loaded per round')
+    @click.option('--workers', type=click.IntRange(min=1), default=None,
+                  help='Scoring processes (default: CPU count, 1 scores in-process)')
+    @click.option('--no-copy', is_flag=True, help='Use executemany instead of COPY on PostgreSQL')
+    def import_fingerprints_command(path, fmt, chunk_size, workers, no_copy):
+        """Bulk import historical fingerprints from NDJSON, CSV or MessagePack (optionally .gz/.zst)"""
+        fmt = fmt or detect_format(path)
+        try:
+            fh = open_import_file(path, fmt)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        with fh:
+            report = import_fingerprints(
+                fh,
+                fmt=fmt,
+                chunk_size=chunk_size,
+                workers=workers,
+                use_copy=not no_copy
+            )
+
+        for line_no, error in report.errors:
+            click.echo(f"line {line_no}: {error}", err=True)
+        if report.rejected > len(report.errors):
+            click.echo(f"... and {report.rejected - len(report.errors)} more", err=True)
+
+        click.echo(
+            f"Imported {report.imported} rows into {report.fingerprints} fingerprints, "
+            f"rejected {report.rejected}, in {report.elapsed:.2f}s "
+            f"({report.rows_per_second:,.0f} rows/s)."
+        )
+
+    @app.cli.command('move-fingerprints')
+    @click.argument('target')
+    @click.option('--start', default='', help='First hash prefix to move (default: the beginning)')
+    @click.option('--end', default=None, help='Hash prefix where the range ends, exclusive (default: the end)')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=1000, help='Rows copied per round trip')
+    @click.option('--keep-source', is_flag=True, help='Leave the moved rows on the old shard')
+    def move_fingerprints_command(target, start, end, batch_size, keep_source):
+        """Move a hash range of fingerprints to TARGET ('main' or a shard name), online"""
+        try:
+            copied = move_range(start, end, target, batch_size=batch_size,
+                                keep_source=keep_source, echo=click.echo)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Moved {copied} fingerprints to {target}.")
+
+    @app.cli.command('maintain-visits')
+    @click.option('--retention-days', type=click.IntRange(min=1), default=None,
+                  help='Keep this many days of visits (default: VISIT_RETENTION_DAYS)')
+    def maintain_visits_command(retention_days):
+        """Create upcoming visit log partitions and drop expired visits"""
+        retention_days = retention_days or app.config.get('VISIT_RETENTION_DAYS', 30)
+        created = ensure_partitions(db.engine)
+        removed = drop_expired(db.engine, retention_days)
+        unit = 'partitions' if db.engine.dialect.name == 'postgresql' else 'rows'
+        click.echo(f"Created {created} partitions, dropped {removed} expired {unit}.")
+
+    @app.cli.command('backfill-components')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=1000, help='Rows updated per transaction')
+    def backfill_components_command(batch_size):
+        """Parse the components of fingerprints stored before the typed columns existed"""
+        shards = app.extensions['fingerprint_shards']
+        for name in ['main', *shards.engines]:
+            filled = _backfill_components(shards.engine(name), batch_size)
+            click.echo(f"{name}: filled {filled} fingerprints.")
+
+    @app.cli.command('train-compression-dictionaries')
+    @click.option('--sample', type=click.IntRange(min=10), default=5000, help='Stored values sampled per column')
+    @click.option('--size', type=click.IntRange(min=1024), default=16 * 1024, help='Dictionary size in bytes')
+    @click.option('--column', 'columns', type=click.Choice(COMPRESSED_COLUMNS), multiple=True,
+                  help='Only this column (repeatable; default: all compressed columns)')
+    def train_compression_dictionaries_command(sample, size, columns):
+        """Train new zstd dictionaries for the compressed component columns"""
+        registry = compression()
+        for column in columns or COMPRESSED_COLUMNS:
+            values = _sample_column(column, sample)
+            try:
+                data = train_dictionary(values, size)
+            except (RuntimeError, ValueError) as e:
+                raise click.ClickException(f"{column}: {e}")
+            record = CompressionDictionary(column_name=column, data=data, samples=len(values))
+            db.session.add(record)
+            db.session.commit()
+            registry.register(record.version, column, data)
+            click.echo(f"{column}: version {record.version} from {len(values)} values ({len(data)} bytes).")
+        click.echo("Run `flask compress-components` to rewrite stored rows; restart the app to write with them.")
+
+    @app.cli.command('compress-components')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=1000, help='Rows rewritten per transaction')
+    @click.option('--decompress', is_flag=True, help='Store the values uncompressed (before downgrading)')
+    def compress_components_command(batch_size, decompress):
+        """Recompress stored component columns with the current dictionaries"""
+        shards = app.extensions['fingerprint_shards']
+        for name in ['main', *shards.engines]:
+            rewritten, before, after = _compress_components(shards.engine(name), batch_size, decompress)
+            click.echo(f"{name}: rewrote {rewritten} fingerprints; compressed columns {before:,} -> {after:,} bytes.")
+
+    @app.cli.command('train-risk-model')
+    @click.argument('labels', type=click.File('r'))
+    @click.option('--output', '-o', default='risk_model.json', help='Model artifact to write')
+    @click.option('--max-fpr', type=click.FloatRange(0, 1), default=0.01,
+                  help='Share of humans the model may flag as bots (sets the threshold)')
+    @click.option('--iterations', type=click.IntRange(min=1), default=500, help='Gradient descent steps')
+    def train_risk_model_command(labels, output, max_fpr, iterations):
+        """Fit the risk model from LABELS, a CSV of hash,is_bot for stored fingerprints"""
+        labels = _read_labels(labels)
+        rows = list(_labeled_fingerprints(labels))
+        if not rows:
+            raise click.ClickException("None of the labeled hashes are stored")
+        components, visit_counts, targets = zip(*rows)
+        try:
+            model, report = train(list(components), list(visit_counts), list(targets),
+                                  max_false_positive_rate=max_fpr, iterations=iterations)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        model.save(output)
+
+        click.echo(f"Trained on {len(rows)} of {len(labels)} labeled fingerprints; "
+                   f"threshold {report['threshold']:.4f}.")
+        for name in ('rules', 'model'):
+            metrics = {k: 'n/a' if v is None else f"{v:.3f}" for k, v in report[name].items()}
+            click.echo(f"  {name:>5}: precision {metrics['precision']}, recall {metrics['recall']}, "
+                       f"false positive rate {metrics['false_positive_rate']}")
+        click.echo(f"Wrote {output}; set RISK_MODEL_PATH to use it.")
+
+    @app.cli.command('process-webhooks')
+    @click.option('--once', is_flag=True, help='Apply due events and exit')
+    def process_webhooks_command(once):
+        """Apply pending Stripe webhook events (dedicated worker when WEBHOOK_WORKER=off)"""
+        max_attempts = app.config.get('WEBHOOK_MAX_ATTEMPTS', 5)
+        if once:
+            total = 0
+            while True:
+                handled = process_pending_events(max_attempts=max_attempts)
+                if not handled:
+                    break
+                total += handled
+            click.echo(f"Processed {total} webhook event(s).")
+            return
+
+        worker = WebhookWorker(
+            app,
+            poll_interval=app.config.get('WEBHOOK_POLL_INTERVAL', 5.0),
+            max_attempts=max_attempts
+        )
+        click.echo("Processing webhook events, Ctrl+C to stop.")
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,120 @@
+"""
+Single-flight coalescing of concurrent fingerprint submits
+A burst of submits for one hash used to queue on that row's lock, each
+holding a pooled connection while it waited. Now each process has at most one
+write per hash in flight: submits arriving meanwhile join the next batch, and
+the first of them writes it once, adding the batch's size to visit_count,
+while the rest wait without a connection. Each caller then answers as if the
+submits had run one after another (visit counts V+1 .. V+N) and pays its own
+credit, which require_credits has already taken.
+
+Coalescing only happens between threads of one process (gthread workers);
+processes still write separately. SUBMIT_COALESCING = "off" writes each
+submit on its own as before.
+"""
+import threading
+
+from flask import current_app
+
+SUBMIT_COALESCING_MODES = ('on', 'off')
+
+class _Batch:
+    """Submits of one hash that share a write"""
+    __slots__ = ('count', 'turn', 'done', 'result', 'error')
+
+    def __init__(self):
+        self.count = 0
+        # Set when the batch may write (the previous write for the hash is done)
+        self.turn = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SubmitCoalescer:
+    """In-flight writes per key, and the batches queued behind them"""
+
+    def __init__(self):
+        # key -> batch queued behind the write in flight, or None if nothing is queued
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.submits = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.errors = 0
+
+    def submit(self, key, write):
+        """
+        Run write(count) once for this caller's batch of concurrent submits
+        Returns (write's result, the batch's size, the caller's 1-based place in
+        it); an exception from write is raised to every caller in the batch.
+        """
+        with self._lock:
+            self.submits += 1
+            if key in self._flights:
+                batch = self._flights[key]
+                if batch is None:
+                    # The first to queue writes for everyone queued with it
+                    batch = self._flights[key] = _Batch()
+            else:
+                self._flights[key] = None
+                batch = _Batch()
+                batch.turn.set()
+            batch.count += 1
+            position = batch.count
+
+        if position > 1:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+            return batch.result, batch.count, position
+
+        batch.turn.wait()
+        with self._lock:
+            # Close the batch: later submits queue for the next write
+            if self._flights.get(key) is batch:
+                self._flights[key] = None
+            count = batch.count
+            self.writes += 1
+            self.largest_batch = max(self.largest_batch, count)
+        try:
+            batch.result = write(count)
+        except BaseException as e:
+            self.errors += 1
+            batch.error = e
+            raise
+        finally:
+            batch.done.set()
+            with self._lock:
+                following = self._flights[key]
+                if following is None:
+                    del self._flights[key]
+                else:
+                    following.turn.set()
+        return batch.result, count, position
+
+    def stats(self):
+        """Counters for the metrics endpoint"""
+        return {
+            'mode': 'on',
+            'submits': self.submits,
+            'writes': self.writes,
+            'coalesced': self.submits - self.writes,
+            # Submits per write; 1.0 when nothing was merged
+            'coalescing_ratio': self.submits / self.writes if self.writes else None,
+            'largest_batch': self.largest_batch,
+            'in_flight': len(self._flights),
+            'errors': self.errors,
+        }
+
+def submit_coalescer():
+    """The app's SubmitCoalescer, or None when SUBMIT_COALESCING is off"""
+    return current_app.extensions.get('submit_coalescer')
+
+def init_coalescing(app):
+    """Create the app's submit coalescer from SUBMIT_COALESCING"""
+    mode = app.config.get('SUBMIT_COALESCING', 'on')
+    if mode not in SUBMIT_COALESCING_MODES:
+        raise ValueError(f"SUBMIT_COALESCING must be one of {', '.join(SUBMIT_COALESCING_MODES)}")
+    coalescer = SubmitCoalescer() if mode == 'on' else None
+    app.extensions['submit_coalescer'] = coalescer
+    return coalescer
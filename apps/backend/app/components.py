@@ -0,0 +1,107 @@
+"""
+Typed values parsed from the component strings the collector sends
+Fingerprints store them at ingest in typed, indexed columns (see
+PARSED_COLUMNS in app.models), so scoring and admin filters compare numbers
+and flags instead of re-parsing strings or scanning with LIKE. Rows stored
+before the columns existed are filled by `flask backfill-components`, and
+parsed on the fly until then.
+"""
+import math
+import re
+from functools import lru_cache
+
+# Component -> (bit in missing_components, values meaning the browser did not provide it)
+MISSING_COMPONENTS = {
+    "canvas": (1, ("unsupported", "error")),
+    "webgl": (2, ("unsupported", "error")),
+    "audio": (4, ("unsupported", "error")),
+    "battery": (8, ("unsupported", "error")),
+    "media": (16, ("unsupported", "error", "")),
+    "fonts": (32, ("unsupported", "")),
+    "plugins": (64, ("none", "error", "")),
+    "network": (128, ("unsupported", "error")),
+    # Any "unknown" part (cores, memory or GPU)
+    "hardware": (256, None),
+}
+
+HARDWARE_PATTERN = re.compile(r'^cores:([^_]*)_mem:([^_]*)_gpu:')
+SCREEN_PATTERN = re.compile(r'^(\d+)x(\d+)_(\d+)x(\d+)_(\d+)$')
+
+# Integer values are stored in SMALLINT columns
+SMALLINT_MAX = 32767
+# UTC offsets stay within a day either way
+MAX_TZ_OFFSET = 24 * 60
+
+def parse_number(text):
+    """Finite float from a string, or None"""
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+def _integer(text, low=-SMALLINT_MAX, high=SMALLINT_MAX):
+    """Integer in [low, high] from a string, or None"""
+    value = parse_number(text)
+    if value is None or not value.is_integer() or not low <= value <= high:
+        return None
+    return int(value)
+
+@lru_cache(maxsize=4096)
+def parse_hardware(value):
+    """(cores, memory in GB) from "cores:8_mem:16_gpu:..."; None where unknown"""
+    match = HARDWARE_PATTERN.match(value or "")
+    if not match:
+        return None, None
+    return _integer(match.group(1), 0), parse_number(match.group(2))
+
+@lru_cache(maxsize=4096)
+def parse_screen(value):
+    """(width, height, available width, available height, color depth), or None"""
+    match = SCREEN_PATTERN.match(value or "")
+    if not match:
+        return None
+    values = tuple(int(group) for group in match.groups())
+    return values if max(values) <= SMALLINT_MAX else None
+
+@lru_cache(maxsize=4096)
+def parse_touch(value):
+    """Max touch points from "5_true", or None"""
+    points, _, _ = (value or "").partition('_')
+    return _integer(points, 0)
+
+@lru_cache(maxsize=4096)
+def parse_timezone(value):
+    """UTC offset in minutes, as getTimezoneOffset() reports it (positive west of UTC), or None"""
+    _, _, offset = (value or "").rpartition('_')
+    return _integer(offset, -MAX_TZ_OFFSET, MAX_TZ_OFFSET)
+
+def missing_mask(components):
+    """Bit set of the components the browser did not provide (MISSING_COMPONENTS)"""
+    mask = 0
+    for name, (bit, missing) in MISSING_COMPONENTS.items():
+        value = components.get(name) or ""
+        if missing is None:
+            if "unknown" in value.lower():
+                mask |= bit
+        elif value in missing:
+            mask |= bit
+    return mask
+
+def missing_names(mask):
+    """Component names in a missing_components bit set"""
+    return [name for name, (bit, _) in MISSING_COMPONENTS.items() if mask & bit]
+
+def parse_components(components):
+    """Typed column values for a components dict (keys are app.models.PARSED_COLUMNS)"""
+    cores, memory = parse_hardware(components.get("hardware"))
+    screen = parse_screen(components.get("screen"))
+    return {
+        "cpu_cores": cores,
+        "device_memory": memory,
+        "screen_width": screen[0] if screen else None,
+        "screen_height": screen[1] if screen else None,
+        "max_touch_points": parse_touch(components.get("touch")),
+        "tz_offset": parse_timezone(components.get("timezone")),
+        "missing_components": missing_mask(components),
+    }
@@ -0,0 +1,185 @@
+"""
+zstd compression of long, repetitive component columns
+CompressedText stores values of COMPONENT_COMPRESSION_MIN_BYTES or more as
+MARKER + dictionary version (4 bytes) + a zstd frame, and shorter ones as plain
+UTF-8, which never starts with MARKER. Dictionaries are trained per column from
+a sample of stored values (`flask train-compression-dictionaries`) and kept in
+compression_dictionaries, so rows written with an older version stay readable;
+version 0 is zstd without a dictionary. `flask compress-components` rewrites
+stored rows with the current dictionaries.
+
+Compressed columns are opaque to SQL (no LIKE or equality on the text). On
+Fingerprint they are deferred, so they are only loaded, and decompressed, when
+an attribute is read.
+"""
+import struct
+import threading
+
+from flask import current_app, has_app_context
+from sqlalchemy import LargeBinary, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+MARKER = b"\xff"
+HEADER = struct.Struct(">cI")
+
+def is_compressed(data):
+    return data[:1] == MARKER
+
+class CompressionDictionaries:
+    """Trained dictionaries by version, and the current version of each column"""
+
+    def __init__(self, app, min_bytes=256, level=3):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.level = level
+        self._dictionaries = {}
+        self._current = {}
+        self._lock = threading.Lock()
+        # Compression contexts are reusable but not thread-safe
+        self._local = threading.local()
+
+    def load(self):
+        """
+        (Re)read the stored dictionaries
+        Done at startup: newly trained versions are used for writes after a
+        restart, and read whenever a row needs one.
+        """
+        # app.models imports this module for CompressedText
+        from .models import CompressionDictionary, db
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                rows = conn.execute(
+                    select(CompressionDictionary.version, CompressionDictionary.column_name,
+                           CompressionDictionary.data)
+                    .order_by(CompressionDictionary.version)
+                ).all()
+        with self._lock:
+            for version, column, data in rows:
+                if version not in self._dictionaries:
+                    self._dictionaries[version] = zstandard.ZstdCompressionDict(data)
+                self._current[column] = version
+
+    def current_version(self, column):
+        return self._current.get(column, 0)
+
+    def register(self, version, column, data):
+        """Make a newly stored dictionary current in this process"""
+        with self._lock:
+            self._dictionaries[version] = zstandard.ZstdCompressionDict(data)
+            self._current[column] = version
+
+    def _dictionary(self, version):
+        if version and version not in self._dictionaries:
+            # Trained by another process since we loaded
+            self.load()
+        try:
+            return self._dictionaries[version] if version else None
+        except KeyError:
+            raise ValueError(f"Unknown compression dictionary version {version}")
+
+    def _context(self, kind, version):
+        contexts = self._local.__dict__.setdefault(kind, {})
+        context = contexts.get(version)
+        if context is None:
+            dictionary = self._dictionary(version)
+            if kind == "compress":
+                context = zstandard.ZstdCompressor(
+                    level=self.level, dict_data=dictionary, write_dict_id=False
+                )
+            else:
+                context = zstandard.ZstdDecompressor(dict_data=dictionary)
+            contexts[version] = context
+        return context
+
+    def compress(self, column, value):
+        """Stored bytes for a column value"""
+        data = value.encode("utf-8")
+        if zstandard is None or not self.min_bytes or len(data) < self.min_bytes:
+            return data
+        version = self.current_version(column)
+        compressed = self._context("compress", version).compress(data)
+        if len(compressed) + HEADER.size >= len(data):
+            return data
+        return HEADER.pack(MARKER, version) + compressed
+
+    def decompress(self, data):
+        """Column value from stored bytes"""
+        if not is_compressed(data):
+            return data.decode("utf-8")
+        if zstandard is None:
+            raise RuntimeError("Reading compressed components needs the zstandard package")
+        _, version = HEADER.unpack_from(data)
+        return self._context("decompress", version).decompress(data[HEADER.size:]).decode("utf-8")
+
+    def version_of(self, data):
+        """Dictionary version a stored value was compressed with, or None if plain"""
+        return HEADER.unpack_from(data)[1] if is_compressed(data) else None
+
+def compression():
+    """This app's CompressionDictionaries, or None outside an app context"""
+    return current_app.extensions.get('compression') if has_app_context() else None
+
+class CompressedText(TypeDecorator):
+    """Text stored as (possibly dictionary-compressed) bytes, see the module docstring"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, column):
+        super().__init__()
+        # Dictionaries are per column
+        self.column = column
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        registry = compression()
+        if registry is None:
+            return value.encode("utf-8")
+        return registry.compress(self.column, value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            # Text left by a database that kept the pre-migration storage class (SQLite)
+            return value
+        value = bytes(value)
+        if not is_compressed(value):
+            return value.decode("utf-8")
+        registry = compression()
+        if registry is None:
+            raise RuntimeError("Reading compressed components needs an app context")
+        return registry.decompress(value)
+
+def train_dictionary(values, size):
+    """zstd dictionary bytes trained from sample column values"""
+    if zstandard is None:
+        raise RuntimeError("Training compression dictionaries needs the zstandard package")
+    samples = [value.encode("utf-8") for value in values if value]
+    if len(samples) < 10:
+        raise ValueError("Need at least 10 non-empty samples to train a dictionary")
+    try:
+        return zstandard.train_dictionary(size, samples).as_bytes()
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Dictionary training failed: {e}")
+
+def init_compression(app):
+    """Set up component compression and read the stored dictionaries"""
+    registry = CompressionDictionaries(
+        app,
+        min_bytes=app.config.get('COMPONENT_COMPRESSION_MIN_BYTES', 256),
+        level=app.config.get('COMPONENT_COMPRESSION_LEVEL', 3),
+    )
+    if zstandard is not None:
+        try:
+            registry.load()
+        except SQLAlchemyError as e:
+            # Not migrated yet, or the database is down: plain zstd until restarted
+            app.logger.warning(f"Compression dictionaries not loaded: {e}")
+    app.extensions['compression'] = registry
+    return registry
@@ -7,3 +7,17 @@ def init_db(app):
     db.init_app(app)
     with app.app_context():
         db.create_all()
+
+def dispose_engines(app):
+    """
+    Drop pooled connections inherited from a parent process
+    Call in each worker after fork; close=False leaves the parent's sockets alone
+    """
+    replicas = app.extensions.get('replicas')
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        for engine in (replicas.engines.values() if replicas else ()):
+            engine.dispose(close=False)
+        if 'fingerprint_shards' in app.extensions:
+            app.extensions['fingerprint_shards'].dispose()
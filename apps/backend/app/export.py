@@ -0,0 +1,129 @@
+"""Streaming NDJSON/CSV export of fingerprints and usage"""
+import csv
+import io
+import zlib
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select
+
+from .models import Fingerprint, UsageRollup, db
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+FINGERPRINT_EXPORT_COLUMNS = [
+    Fingerprint.hash,
+    Fingerprint.risk_score,
+    Fingerprint.is_bot,
+    Fingerprint.visit_count,
+    Fingerprint.first_seen,
+    Fingerprint.last_seen,
+]
+
+USAGE_EXPORT_COLUMNS = [
+    UsageRollup.bucket,
+    UsageRollup.api_key_id,
+    UsageRollup.endpoint,
+    UsageRollup.calls,
+    UsageRollup.credits_used,
+]
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+def parse_timestamp(value):
+    """Parse an optional ISO 8601 filter value; raises ValueError if malformed"""
+    return datetime.fromisoformat(value) if value else None
+
+def fingerprint_export_query(since=None, until=None, is_bot=None):
+    """SELECT for a fingerprint export, filtered on first_seen and is_bot"""
+    stmt = select(*FINGERPRINT_EXPORT_COLUMNS).order_by(Fingerprint.id)
+    if since is not None:
+        stmt = stmt.where(Fingerprint.first_seen >= since)
+    if until is not None:
+        stmt = stmt.where(Fingerprint.first_seen < until)
+    if is_bot is not None:
+        stmt = stmt.where(Fingerprint.is_bot == is_bot)
+    return stmt
+
+def usage_export_query(user_id, since=None, until=None):
+    """SELECT for a user's usage rollups, filtered on bucket time"""
+    stmt = select(*USAGE_EXPORT_COLUMNS).where(
+        UsageRollup.user_id == user_id
+    ).order_by(UsageRollup.bucket, UsageRollup.api_key_id, UsageRollup.endpoint)
+    if since is not None:
+        stmt = stmt.where(UsageRollup.bucket >= since)
+    if until is not None:
+        stmt = stmt.where(UsageRollup.bucket < until)
+    return stmt
+
+def stream_rows(stmt, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield lists of rows from a server-side cursor
+    Only one batch is held in memory at a time, whatever the export size.
+    """
+    result = db.session.execute(
+        stmt.execution_options(stream_results=True, yield_per=batch_size)
+    )
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+def stream_fingerprint_rows(stmt, batch_size=EXPORT_BATCH_SIZE):
+    """stream_rows for a fingerprint SELECT, gathered from every shard"""
+    shards = current_app.extensions['fingerprint_shards']
+    if not shards.sharded:
+        return stream_rows(stmt, batch_size)
+    return shards.stream(stmt, batch_size)
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def ndjson_chunks(batches, names):
+    """Encode row batches as newline-delimited JSON, one chunk per batch"""
+    dumps = current_app.json.dumps
+    for batch in batches:
+        yield ''.join(
+            dumps({name: value for name, value in zip(names, row)}) + '\n'
+            for row in batch
+        )
+
+def csv_chunks(batches, names):
+    """Encode row batches as CSV with a header row, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    yield buffer.getvalue()
+
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_plain(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of text chunks into a gzip stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(stmt, fmt, compress=False, batch_size=EXPORT_BATCH_SIZE, stream=stream_rows):
+    """Generator of encoded (and optionally gzipped) export chunks for a SELECT"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    names = [column.name for column in stmt.selected_columns]
+    encode = ndjson_chunks if fmt == 'ndjson' else csv_chunks
+    chunks = encode(stream(stmt, batch_size), names)
+
+    if compress:
+        return gzip_chunks(chunks)
+    return (chunk.encode() for chunk in chunks)
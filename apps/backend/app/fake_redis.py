@@ -0,0 +1,298 @@
+"""
+In-memory stand-in for the subset of redis-py the app uses
+Backs "memory://" storage URLs, so tests and single-process development run
+the same code paths as production without a Redis server. It can simulate
+round-trip latency and outages.
+"""
+import threading
+import time
+
+try:
+    from redis.exceptions import ConnectionError as RedisConnectionError
+except ImportError:
+    RedisConnectionError = ConnectionError
+
+class FakeRedis:
+    """Thread-safe dict-backed Redis with expiry; `down = True` makes every command fail"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.down = False
+        self.round_trips = 0
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.down:
+            raise RedisConnectionError("FakeRedis is down")
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _live(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    # Commands; each is one round trip when called directly
+
+    def get(self, key):
+        self._round_trip()
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        self._round_trip()
+        with self._lock:
+            return self._set(key, value, ex, nx)
+
+    def incrby(self, key, amount=1):
+        self._round_trip()
+        with self._lock:
+            return self._incrby(key, amount)
+
+    def expire(self, key, seconds):
+        self._round_trip()
+        with self._lock:
+            return self._expire(key, seconds)
+
+    def delete(self, *keys):
+        self._round_trip()
+        with self._lock:
+            return self._delete(*keys)
+
+    def rename(self, key, new_key):
+        self._round_trip()
+        with self._lock:
+            return self._rename(key, new_key)
+
+    def setbit(self, key, offset, value):
+        self._round_trip()
+        with self._lock:
+            return self._setbit(key, offset, value)
+
+    def getbit(self, key, offset):
+        self._round_trip()
+        with self._lock:
+            return self._getbit(key, offset)
+
+    def bitcount(self, key):
+        self._round_trip()
+        with self._lock:
+            return self._bitcount(key)
+
+    def mget(self, keys):
+        self._round_trip()
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def sadd(self, key, *members):
+        self._round_trip()
+        with self._lock:
+            return self._sadd(key, *members)
+
+    def srem(self, key, *members):
+        self._round_trip()
+        with self._lock:
+            return self._srem(key, *members)
+
+    def smembers(self, key):
+        self._round_trip()
+        with self._lock:
+            return set(self._data[key]) if self._live(key) else set()
+
+    def zadd(self, key, mapping):
+        self._round_trip()
+        with self._lock:
+            return self._zadd(key, mapping)
+
+    def zrem(self, key, *members):
+        self._round_trip()
+        with self._lock:
+            return self._zrem(key, *members)
+
+    def zremrangebyscore(self, key, min, max):
+        self._round_trip()
+        with self._lock:
+            return self._zremrangebyscore(key, min, max)
+
+    def zcard(self, key):
+        self._round_trip()
+        with self._lock:
+            return self._zcard(key)
+
+    def ping(self):
+        self._round_trip()
+        return True
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    # Implementations, called with the lock held
+
+    def _get(self, key):
+        if not self._live(key):
+            return None
+        value = self._data[key]
+        if isinstance(value, bytearray):
+            return bytes(value)
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def _set(self, key, value, ex=None, nx=False):
+        if nx and self._live(key):
+            return None
+        self._data[key] = value if isinstance(value, bytes) else str(value).encode()
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expires[key] = time.time() + ex
+        return True
+
+    def _incrby(self, key, amount):
+        current = int(self._data[key]) if self._live(key) else 0
+        current += amount
+        self._data[key] = str(current).encode()
+        return current
+
+    def _expire(self, key, seconds):
+        if not self._live(key):
+            return False
+        self._expires[key] = time.time() + seconds
+        return True
+
+    def _rename(self, key, new_key):
+        if not self._live(key):
+            raise ValueError("no such key")
+        self._data[new_key] = self._data.pop(key)
+        self._expires.pop(new_key, None)
+        if key in self._expires:
+            self._expires[new_key] = self._expires.pop(key)
+        return True
+
+    def _bitmap(self, key, size=0):
+        """The key's value as a mutable bitmap of at least `size` bytes"""
+        value = self._data.get(key) if self._live(key) else None
+        if not isinstance(value, bytearray):
+            value = bytearray(value or b'')
+            self._data[key] = value
+        if len(value) < size:
+            value.extend(bytes(size - len(value)))
+        return value
+
+    def _setbit(self, key, offset, value):
+        bitmap = self._bitmap(key, (offset >> 3) + 1)
+        mask = 0x80 >> (offset & 7)
+        previous = 1 if bitmap[offset >> 3] & mask else 0
+        if value:
+            bitmap[offset >> 3] |= mask
+        else:
+            bitmap[offset >> 3] &= ~mask & 0xff
+        return previous
+
+    def _getbit(self, key, offset):
+        if not self._live(key) or (offset >> 3) >= len(self._data[key]):
+            return 0
+        return 1 if self._data[key][offset >> 3] & (0x80 >> (offset & 7)) else 0
+
+    def _bitcount(self, key):
+        if not self._live(key):
+            return 0
+        return int.from_bytes(self._data[key], 'big').bit_count()
+
+    def _sadd(self, key, *members):
+        members = {m if isinstance(m, bytes) else str(m).encode() for m in members}
+        if not self._live(key):
+            self._data[key] = set()
+        current = self._data[key]
+        added = len(members - current)
+        current.update(members)
+        return added
+
+    def _srem(self, key, *members):
+        if not self._live(key):
+            return 0
+        members = {m if isinstance(m, bytes) else str(m).encode() for m in members}
+        removed = len(members & self._data[key])
+        self._data[key] -= members
+        return removed
+
+    def _zadd(self, key, mapping):
+        if not self._live(key):
+            self._data[key] = {}
+        current = self._data[key]
+        added = 0
+        for member, score in mapping.items():
+            member = member if isinstance(member, bytes) else str(member).encode()
+            added += member not in current
+            current[member] = float(score)
+        return added
+
+    def _zrem(self, key, *members):
+        if not self._live(key):
+            return 0
+        current = self._data[key]
+        members = {m if isinstance(m, bytes) else str(m).encode() for m in members}
+        removed = [m for m in members if current.pop(m, None) is not None]
+        if not current:
+            self._delete(key)
+        return len(removed)
+
+    def _zremrangebyscore(self, key, min, max):
+        if not self._live(key):
+            return 0
+        low, high = float(min), float(max)
+        current = self._data[key]
+        removed = [m for m, score in current.items() if low <= score <= high]
+        for member in removed:
+            del current[member]
+        if not current:
+            self._delete(key)
+        return len(removed)
+
+    def _zcard(self, key):
+        return len(self._data[key]) if self._live(key) else 0
+
+    def _delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key):
+                removed += 1
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return removed
+
+class FakePipeline:
+    """Queues commands and runs them in one round trip on execute()"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, f"_{name}", None)
+        if method is None:
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        self.redis._round_trip()
+        with self.redis._lock:
+            return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.commands = []
@@ -0,0 +1,136 @@
+"""
+Numeric features of fingerprint components for the learned risk model
+Each extractor turns one component string into a fixed number of floats:
+sentinel flags ("unsupported", "error", ...), screen dimensions, core and
+memory counts from `hardware`, font and plugin counts, touch points and the
+timezone offset. feature_vector() builds one row for per-request scoring;
+feature_matrix() builds a batch column by column, parsing each distinct
+value once (components repeat heavily across devices).
+
+The order of FEATURE_NAMES is part of the model artifact format: append new
+features at the end and retrain.
+"""
+import math
+from functools import lru_cache
+
+from .components import parse_hardware, parse_number, parse_screen, parse_timezone, parse_touch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SENTINELS = frozenset(("unsupported", "error", ""))
+# Values the collector reports for screen sizes common in headless browsers
+BOT_SCREENS = ("800x600", "1024x768")
+SOFTWARE_RENDERERS = ("swiftshader", "llvmpipe", "software")
+
+def _list_count(value):
+    return float(len(value.split(','))) if value else 0.0
+
+# Extractors: component string -> tuple of floats (cached, values repeat)
+
+@lru_cache(maxsize=4096)
+def _missing(value):
+    return (float(value in SENTINELS),)
+
+@lru_cache(maxsize=4096)
+def _webgl(value):
+    lowered = value.lower()
+    return (float(value in SENTINELS), float(any(name in lowered for name in SOFTWARE_RENDERERS)))
+
+@lru_cache(maxsize=4096)
+def _listed(value):
+    """Comma-separated list: (missing, entries)"""
+    missing = value in SENTINELS
+    return (float(missing), 0.0 if missing else _list_count(value))
+
+@lru_cache(maxsize=4096)
+def _plugins(value):
+    missing = value in SENTINELS or value == "none"
+    return (float(missing), 0.0 if missing else _list_count(value))
+
+@lru_cache(maxsize=4096)
+def _do_not_track(value):
+    return (float(value == "1"),)
+
+@lru_cache(maxsize=4096)
+def _browser(value):
+    return (float("headless" in value.lower()),)
+
+@lru_cache(maxsize=4096)
+def _hardware(value):
+    cores, memory = parse_hardware(value)
+    return (float(cores is None or memory is None), float(cores or 0), memory or 0.0)
+
+@lru_cache(maxsize=4096)
+def _screen(value):
+    screen = parse_screen(value)
+    if screen is None:
+        return (0.0, 0.0, 0.0, 0.0)
+    width, height, _, avail_height, _ = (float(part) for part in screen)
+    # Space taken by taskbars and docks; none in most headless browsers
+    return (width, height, height - avail_height, float(value.startswith(BOT_SCREENS)))
+
+@lru_cache(maxsize=4096)
+def _pixel_ratio(value):
+    _, _, ratio = value.partition('_')
+    return (parse_number(ratio) or 0.0,)
+
+@lru_cache(maxsize=4096)
+def _touch(value):
+    return (float(parse_touch(value) or 0),)
+
+@lru_cache(maxsize=4096)
+def _timezone(value):
+    return ((parse_timezone(value) or 0) / 60,)
+
+# (component, feature names, extractor) in feature order
+EXTRACTORS = (
+    ("canvas", ("canvas_missing",), _missing),
+    ("webgl", ("webgl_missing", "software_renderer"), _webgl),
+    ("audio", ("audio_missing",), _missing),
+    ("battery", ("battery_missing",), _missing),
+    ("media", ("media_missing", "media_device_count"), _listed),
+    ("network", ("network_missing",), _missing),
+    ("fonts", ("fonts_missing", "font_count"), _listed),
+    ("plugins", ("plugins_missing", "plugin_count"), _plugins),
+    ("doNotTrack", ("dnt_enabled",), _do_not_track),
+    ("browser", ("headless_user_agent",), _browser),
+    ("hardware", ("hardware_unknown", "cores", "memory_gb"), _hardware),
+    ("screen", ("screen_width", "screen_height", "screen_taskbar", "screen_common_bot"), _screen),
+    ("colorDepth", ("pixel_ratio",), _pixel_ratio),
+    ("touch", ("touch_points",), _touch),
+    ("timezone", ("timezone_offset_hours",), _timezone),
+)
+FEATURE_NAMES = tuple(name for _, names, _ in EXTRACTORS for name in names) + ("log_visits",)
+
+def feature_vector(components, visit_count):
+    """One fingerprint's features as a list of floats, in FEATURE_NAMES order"""
+    vector = []
+    for component, _, extract in EXTRACTORS:
+        vector.extend(extract(components.get(component) or ""))
+    vector.append(math.log1p(visit_count))
+    return vector
+
+def feature_matrix(components_list, visit_counts):
+    """Features of a batch as a float64 array of shape (rows, len(FEATURE_NAMES))"""
+    if np is None:
+        raise RuntimeError("feature_matrix needs numpy")
+    rows = len(components_list)
+    matrix = np.empty((rows, len(FEATURE_NAMES)), dtype=np.float64)
+    if not rows:
+        return matrix
+    column = 0
+    for component, names, extract in EXTRACTORS:
+        # Code each row by its distinct value, extract once per value, then gather
+        distinct = {}
+        codes = np.fromiter(
+            (distinct.setdefault(c.get(component) or "", len(distinct)) for c in components_list),
+            dtype=np.intp, count=rows
+        )
+        table = np.array([extract(value) for value in distinct], dtype=np.float64)
+        matrix[:, column:column + len(names)] = table[codes]
+        column += len(names)
+    matrix[:, column] = np.log1p(np.asarray(visit_counts, dtype=np.float64))
+    return matrix
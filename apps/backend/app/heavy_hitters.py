@@ -0,0 +1,357 @@
+"""
+Heavy hitters: the fingerprint hashes, API keys and client IPs that dominate
+recent submits
+Each dimension keeps a Count-Min Sketch per step of a sliding window
+(HEAVY_HITTERS_WINDOW seconds in HEAVY_HITTERS_BUCKETS steps), a running sum
+of the live steps, and up to 2 x HEAVY_HITTERS_TOP_K candidate keys. Memory is
+fixed whatever the traffic: width x depth 4-byte counters per sketch. A count
+is never under-estimated, and over-estimated by at most e / width of the
+window's events with probability 1 - e^-depth.
+
+Sketches of the same shape add up, so they merge across processes. In
+"redis" mode a background thread in each process publishes its window every
+HEAVY_HITTERS_PUBLISH_INTERVAL seconds, and /api/stats/top sums every live
+process's sketches with its own. "local" reports this process only. Redis
+errors are logged and leave the local counts intact.
+"""
+import hashlib
+import json
+import math
+import operator
+import os
+import threading
+import time
+import uuid
+from array import array
+from collections import deque
+
+from flask import current_app
+
+from .ratelimit import storage_from_url
+
+HEAVY_HITTERS_MODES = ('local', 'redis', 'off')
+DIMENSIONS = ('hash', 'api_key', 'ip')
+
+class CountMinSketch:
+    """depth rows of width counters; a key's estimate is its smallest counter"""
+
+    def __init__(self, width=2048, depth=4, counts=None):
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array('I', bytes(4 * width * depth))
+
+    def indexes(self, key):
+        """One counter per row, by double hashing of one blake2b digest"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, key, count=1, indexes=None):
+        """Count `key`; returns its new estimate"""
+        counts = self.counts
+        indexes = indexes or self.indexes(key)
+        for i in indexes:
+            counts[i] += count
+        return min(counts[i] for i in indexes)
+
+    def estimate(self, key, indexes=None):
+        counts = self.counts
+        return min(counts[i] for i in (indexes or self.indexes(key)))
+
+    def _check_shape(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Count-Min Sketches of different shapes cannot be combined")
+
+    def merge(self, other):
+        """Add another sketch's counts into this one"""
+        self._check_shape(other)
+        self.counts = array('I', map(operator.add, self.counts, other.counts))
+        return self
+
+    def subtract(self, other):
+        """Remove counts previously merged or added from `other`"""
+        self._check_shape(other)
+        self.counts = array('I', map(operator.sub, self.counts, other.counts))
+        return self
+
+    def copy(self):
+        return CountMinSketch(self.width, self.depth, array('I', self.counts))
+
+    def to_bytes(self):
+        return self.counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, width, depth, data):
+        counts = array('I')
+        counts.frombytes(data)
+        if len(counts) != width * depth:
+            raise ValueError("Count-Min Sketch data does not match its shape")
+        return cls(width, depth, counts)
+
+    @property
+    def memory(self):
+        return self.counts.itemsize * len(self.counts)
+
+class SlidingTopK:
+    """Count-Min Sketch over a sliding window, with the candidates for its top k"""
+
+    def __init__(self, window=300.0, buckets=10, width=2048, depth=4, k=50):
+        self.window = window
+        self.buckets = buckets
+        self.step = window / buckets
+        self.width = width
+        self.depth = depth
+        self.k = k
+        # (step number, sketch, events) for each live step, oldest first
+        self._steps = deque()
+        self.total = CountMinSketch(width, depth)
+        self.events = 0
+        # Key -> estimate when last counted; bounded at 2k
+        self.candidates = {}
+        # Smallest candidate estimate, or None to recompute
+        self._floor = None
+        self._lock = threading.Lock()
+
+    def _advance(self, now):
+        """Drop steps that left the window and open the current one"""
+        number = int(now // self.step)
+        steps = self._steps
+        if steps and steps[-1][0] >= number:
+            # Same step, or a clock that stepped back: count in the newest one
+            return steps[-1]
+        expired = False
+        while steps and steps[0][0] <= number - self.buckets:
+            _, sketch, events = steps.popleft()
+            self.total.subtract(sketch)
+            self.events -= events
+            expired = True
+        if expired:
+            # Stale estimates would keep new heavy hitters out of a full candidate set
+            total = self.total
+            self.candidates = {
+                key: estimate for key, estimate in
+                ((key, total.estimate(key)) for key in self.candidates) if estimate
+            }
+            self._floor = None
+        steps.append([number, CountMinSketch(self.width, self.depth), 0])
+        return steps[-1]
+
+    def add(self, key, now=None, count=1):
+        """Count `key` now; returns its estimated count over the window"""
+        now = time.time() if now is None else now
+        with self._lock:
+            step = self._advance(now)
+            indexes = step[1].indexes(key)
+            step[1].add(key, count, indexes)
+            step[2] += count
+            self.events += count
+            estimate = self.total.add(key, count, indexes)
+            self._offer(key, estimate)
+            return estimate
+
+    def _offer(self, key, estimate):
+        candidates = self.candidates
+        previous = candidates.get(key)
+        if previous is not None or len(candidates) < 2 * self.k:
+            candidates[key] = estimate
+            if previous is None or previous == self._floor:
+                self._floor = None
+            return
+        # Most events are of long-tail keys below every candidate
+        if self._floor is None:
+            self._floor = min(candidates.values())
+        if estimate > self._floor:
+            del candidates[min(candidates, key=candidates.get)]
+            candidates[key] = estimate
+            self._floor = None
+
+    def estimate(self, key, now=None):
+        with self._lock:
+            self._advance(time.time() if now is None else now)
+            return self.total.estimate(key)
+
+    def snapshot(self, now=None):
+        """(window sketch copy, events, candidate keys) for top() or publishing"""
+        with self._lock:
+            self._advance(time.time() if now is None else now)
+            return self.total.copy(), self.events, list(self.candidates)
+
+def rank(sketch, candidates, k):
+    """The k candidates with the highest estimates in `sketch`"""
+    counts = ((key, sketch.estimate(key)) for key in set(candidates))
+    return sorted((item for item in counts if item[1]), key=lambda item: (-item[1], item[0]))[:k]
+
+class HeavyHitters:
+    """The app's windowed sketches per dimension, and their publishing thread"""
+
+    def __init__(self, app, window=300.0, buckets=10, width=2048, depth=4, k=50,
+                 redis=None, publish_interval=5.0, prefix='heavy_hitters'):
+        self.app = app
+        self.window = window
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self.redis = redis
+        self.publish_interval = publish_interval
+        self.prefix = f"{prefix}:{width}:{depth}"
+        self._worker = None
+        self.dimensions = {
+            name: SlidingTopK(window, buckets, width, depth, k) for name in DIMENSIONS
+        }
+        self.errors = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def shared(self):
+        return self.redis is not None
+
+    @property
+    def worker_id(self):
+        """This process's publishing id, new in each worker forked from a preloading master"""
+        pid = os.getpid()
+        if self._worker is None or self._worker[0] != pid:
+            self._worker = (pid, f"{pid}-{uuid.uuid4().hex[:8]}")
+        return self._worker[1]
+
+    def record(self, now=None, **keys):
+        """Count one event per dimension given; returns each key's window estimate"""
+        if self.shared:
+            self.start()
+        return {
+            name: self.dimensions[name].add(key, now)
+            for name, key in keys.items() if key is not None
+        }
+
+    def estimate(self, dimension, key, now=None):
+        """This process's window count for `key` (what scoring uses; no round trip)"""
+        return self.dimensions[dimension].estimate(key, now)
+
+    def top(self, dimension, k=None, now=None):
+        """
+        Top keys of a dimension over the window, merged across live processes
+        Returns (items, events, processes merged)
+        """
+        k = k or self.k
+        sketch, events, candidates = self.dimensions[dimension].snapshot(now)
+        processes = 1
+        for payload in self._published(dimension):
+            try:
+                header, data = payload.split(b'\n', 1)
+                header = json.loads(header)
+                sketch.merge(CountMinSketch.from_bytes(self.width, self.depth, data))
+            except ValueError as e:
+                current_app.logger.warning(f"Skipping unreadable heavy hitters snapshot: {e}")
+                continue
+            events += header['events']
+            candidates.extend(header['candidates'])
+            processes += 1
+        return rank(sketch, candidates, k), events, processes
+
+    def error_bound(self, events):
+        """Most a reported count can exceed the true one by (with probability 1 - e^-depth)"""
+        return math.ceil(math.e / self.width * events)
+
+    # Sharing through Redis
+
+    def _published(self, dimension):
+        """Other live processes' snapshots of a dimension"""
+        if not self.shared:
+            return []
+        try:
+            workers = [w.decode() for w in self.redis.smembers(f"{self.prefix}:workers")]
+            workers = [w for w in workers if w != self.worker_id]
+            if not workers:
+                return []
+            payloads = self.redis.mget([f"{self.prefix}:{dimension}:{w}" for w in workers])
+            gone = [w for w, payload in zip(workers, payloads) if payload is None]
+            if gone:
+                self.redis.srem(f"{self.prefix}:workers", *gone)
+            return [payload for payload in payloads if payload is not None]
+        except Exception as e:
+            self.errors += 1
+            current_app.logger.warning(f"Reading heavy hitters from Redis failed: {e}")
+            return []
+
+    def publish(self, now=None):
+        """Store this process's window sketches for the others to merge"""
+        ttl = math.ceil(self.publish_interval * 3)
+        pipe = self.redis.pipeline(transaction=False)
+        for name, dimension in self.dimensions.items():
+            sketch, events, candidates = dimension.snapshot(now)
+            header = json.dumps({'events': events, 'candidates': candidates}).encode()
+            pipe.set(f"{self.prefix}:{name}:{self.worker_id}", header + b'\n' + sketch.to_bytes(), ex=ttl)
+        pipe.sadd(f"{self.prefix}:workers", self.worker_id)
+        pipe.execute()
+
+    # Background thread, started lazily so each forked server process runs its own
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self.run, name='heavy-hitters', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        while not self._stopping:
+            try:
+                self.publish()
+            except Exception as e:
+                self.errors += 1
+                self.app.logger.error(f"Heavy hitters publish error: {e}")
+            self._wake.wait(self.publish_interval)
+
+    def stats(self):
+        """Configuration and memory for the endpoint"""
+        sketches = sum(d.buckets + 1 for d in self.dimensions.values())
+        return {
+            'mode': 'redis' if self.shared else 'local',
+            'window_seconds': self.window,
+            'width': self.width,
+            'depth': self.depth,
+            'memory_bytes': sketches * self.width * self.depth * 4,
+            'errors': self.errors,
+        }
+
+def heavy_hitters():
+    """The app's HeavyHitters, or None when HEAVY_HITTERS is off"""
+    return current_app.extensions.get('heavy_hitters')
+
+def init_heavy_hitters(app):
+    """Create the app's heavy hitter sketches from the HEAVY_HITTERS_* settings"""
+    mode = app.config.get('HEAVY_HITTERS', 'redis')
+    if mode not in HEAVY_HITTERS_MODES:
+        raise ValueError(f"HEAVY_HITTERS must be one of {', '.join(HEAVY_HITTERS_MODES)}")
+    tracker = None
+    if mode != 'off':
+        redis = None
+        if mode == 'redis':
+            redis = storage_from_url(app.config.get('HEAVY_HITTERS_REDIS_URL'), timeout=1.0)
+            if redis is None:
+                raise RuntimeError("HEAVY_HITTERS=redis needs the redis package")
+        tracker = HeavyHitters(
+            app,
+            window=app.config.get('HEAVY_HITTERS_WINDOW', 300.0),
+            buckets=app.config.get('HEAVY_HITTERS_BUCKETS', 10),
+            width=app.config.get('HEAVY_HITTERS_WIDTH', 2048),
+            depth=app.config.get('HEAVY_HITTERS_DEPTH', 4),
+            k=app.config.get('HEAVY_HITTERS_TOP_K', 50),
+            redis=redis,
+            publish_interval=app.config.get('HEAVY_HITTERS_PUBLISH_INTERVAL', 5.0)
+        )
+    app.extensions['heavy_hitters'] = tracker
+    return tracker
@@ -0,0 +1,413 @@
+"""Bulk import of historical fingerprints from NDJSON/CSV/MessagePack files"""
+import csv
+import gzip
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+
+from flask import current_app
+from pydantic import ValidationError
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .bloom import known_hashes
+from .components import parse_components
+from .models import COMPONENT_COLUMNS, COMPRESSED_COLUMNS, PARSED_COLUMNS, Fingerprint, db
+from .risk_model import risk_model
+from .risk_scoring import calculate_risk_score
+from .schemas import FingerprintImportRecord
+from .wire import msgpack, zstandard
+
+# msgpack: a stream of concatenated records, read in binary
+IMPORT_FORMATS = ('ndjson', 'csv', 'msgpack')
+
+# Records validated, scored and loaded per round
+IMPORT_CHUNK_SIZE = 5000
+
+IMPORT_COLUMNS = [
+    'hash', 'risk_score', 'is_bot', 'visit_count', 'first_seen', 'last_seen',
+    *COMPONENT_COLUMNS.values(),
+    *PARSED_COLUMNS
+]
+
+# Rejected rows kept on the report for display
+MAX_REPORTED_ERRORS = 20
+
+class ImportReport:
+    """Counters for one import run"""
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        # Rows upserted; the executemany loader counts a hash repeated in the file once per chunk
+        self.fingerprints = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line_no, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, error))
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+def detect_format(path):
+    """Guess the import format from a file name (.csv / .msgpack, optionally .gz/.zst, else NDJSON)"""
+    name = path.rsplit('.', 1)[0] if path.endswith(('.gz', '.zst')) else path
+    if name.endswith('.csv'):
+        return 'csv'
+    return 'msgpack' if name.endswith(('.msgpack', '.mpk')) else 'ndjson'
+
+def open_import_file(path, fmt='ndjson'):
+    """Open an import file (binary for msgpack, else text), transparently decompressing .gz/.zst"""
+    mode, options = ('rb', {}) if fmt == 'msgpack' else ('rt', {'encoding': 'utf-8', 'newline': ''})
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, **options)
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("Reading .zst files needs the zstandard package")
+        return zstandard.open(path, mode, **options)
+    return open(path, mode[0], **options)
+
+def _format_error(e):
+    if isinstance(e, ValidationError):
+        return '; '.join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+        )
+    return str(e)
+
+def _csv_record(row):
+    """Build an import record from a CSV row; component headers may be API or column names"""
+    data = {
+        'hash': row.get('hash'),
+        'components': {
+            name: row.get(name, row.get(column))
+            for name, column in COMPONENT_COLUMNS.items()
+        },
+    }
+    for field in ('visit_count', 'first_seen', 'last_seen'):
+        if row.get(field):
+            data[field] = row[field]
+    return FingerprintImportRecord.model_validate(data)
+
+def iter_records(fh, fmt, report):
+    """
+    Yield (line_no, record) for every valid row of an import file
+    Invalid rows are counted on `report` and skipped.
+    """
+    if fmt == 'csv':
+        rows = csv.DictReader(fh)
+        parse = _csv_record
+        # Line 1 is the header
+        numbered = enumerate(rows, 2)
+    elif fmt == 'msgpack':
+        # "Lines" are record numbers; a corrupt stream ends the import
+        parse = FingerprintImportRecord.model_validate
+        numbered = enumerate(msgpack.Unpacker(fh, raw=False), 1)
+    else:
+        parse = FingerprintImportRecord.model_validate_json
+        numbered = ((n, line) for n, line in enumerate(fh, 1) if line.strip())
+
+    for line_no, raw in numbered:
+        try:
+            yield line_no, parse(raw)
+        except (ValidationError, ValueError) as e:
+            report.reject(line_no, _format_error(e))
+
+def _utc(value):
+    """Normalize to naive UTC, matching datetime.utcnow() used elsewhere"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def score_chunk(items, model=None):
+    """Score (components, visit_count) pairs, with the risk model if given; runs in the worker processes"""
+    if model is not None:
+        components, visit_counts = zip(*items) if items else ((), ())
+        return model.score_batch(list(components), list(visit_counts))
+    return [calculate_risk_score(components, visit_count)[:2] for components, visit_count in items]
+
+def _score_input(chunk):
+    return [(record.components.model_dump(), record.visit_count) for _, record in chunk]
+
+def scored_chunks(chunks, workers, model=None):
+    """
+    Yield (chunk, scores) for each chunk, scoring in a process pool
+    At most 2 * workers chunks are in flight, so memory stays bounded
+    regardless of the file size. workers <= 1 scores in-process.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield chunk, score_chunk(_score_input(chunk), model)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(score_chunk, _score_input(chunk), model)))
+            if len(pending) >= workers * 2:
+                done, future = pending.popleft()
+                yield done, future.result()
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
+
+def _rows(chunk, scores, now):
+    """Fingerprint column values for a scored chunk"""
+    rows = []
+    for (_, record), (risk_score, is_bot) in zip(chunk, scores):
+        first_seen = _utc(record.first_seen) or now
+        row = {
+            'hash': record.hash,
+            'risk_score': risk_score,
+            'is_bot': is_bot,
+            'visit_count': record.visit_count,
+            'first_seen': first_seen,
+            'last_seen': _utc(record.last_seen) or first_seen,
+        }
+        components = record.components
+        for name, column in COMPONENT_COLUMNS.items():
+            row[column] = getattr(components, name)
+        row.update(parse_components(components.model_dump()))
+        rows.append(row)
+    return rows
+
+def _fold_repeated(rows):
+    """
+    One row per hash, as CopyLoader's merge does: visit counts summed, first/last
+    seen widened, the last occurrence wins otherwise and risk_score is left NULL
+    for rescore_merged(). PostgreSQL batches an executemany into one statement,
+    which cannot update the same row twice.
+    """
+    folded = {}
+    for row in rows:
+        previous = folded.pop(row['hash'], None)
+        if previous is not None:
+            row = dict(
+                row,
+                visit_count=previous['visit_count'] + row['visit_count'],
+                first_seen=min(previous['first_seen'], row['first_seen']),
+                last_seen=max(previous['last_seen'], row['last_seen']),
+                risk_score=None,
+            )
+        folded[row['hash']] = row
+    return list(folded.values())
+
+class ExecutemanyLoader:
+    """Upserts each chunk with one executemany INSERT ... ON CONFLICT statement"""
+
+    def __init__(self, session):
+        self.session = session
+        table = Fingerprint.__table__
+        dialect = session.get_bind(mapper=Fingerprint).dialect.name
+        if dialect == 'postgresql':
+            stmt = postgresql.insert(table)
+            least, greatest = func.least, func.greatest
+        elif dialect == 'sqlite':
+            stmt = sqlite.insert(table)
+            # SQLite's multi-argument min()/max() are scalar
+            least, greatest = func.min, func.max
+        else:
+            raise ValueError(f"Bulk import is not supported on {dialect}")
+
+        excluded = stmt.excluded
+        self.stmt = stmt.on_conflict_do_update(
+            index_elements=['hash'],
+            set_={
+                'visit_count': table.c.visit_count + excluded.visit_count,
+                'first_seen': least(
+                    func.coalesce(table.c.first_seen, excluded.first_seen), excluded.first_seen
+                ),
+                'last_seen': greatest(
+                    func.coalesce(table.c.last_seen, excluded.last_seen), excluded.last_seen
+                ),
+                # Scored at the file row's visit count: rescored by rescore_merged()
+                'risk_score': None,
+                'is_bot': excluded.is_bot,
+                # A hash always has the same components, so the same parsed values
+                **{
+                    column: func.coalesce(table.c[column], excluded[column])
+                    for column in (*COMPONENT_COLUMNS.values(), *PARSED_COLUMNS)
+                },
+            }
+        )
+        self.rowcount = 0
+
+    def load(self, rows):
+        self.rowcount += self.session.execute(self.stmt, _fold_repeated(rows)).rowcount
+
+    def finish(self):
+        return self.rowcount
+
+class CopyLoader:
+    """
+    PostgreSQL loader: COPY every chunk into a temporary staging table, then
+    merge it into fingerprints with a single INSERT ... SELECT ... ON CONFLICT
+    Rows repeated within the file are folded before the merge: visit counts are
+    summed, first/last seen widened, and the last occurrence wins otherwise.
+    """
+
+    STAGING_TABLE = 'fingerprint_import'
+
+    def __init__(self, session):
+        self.session = session
+        # Compressed columns are staged as the bytea they are stored as
+        table = Fingerprint.__table__
+        self.compressed = {column: table.c[column].type for column in COMPRESSED_COLUMNS}
+        components = ', '.join(
+            f"{column} {'bytea' if column in self.compressed else 'varchar'}"
+            for column in COMPONENT_COLUMNS.values()
+        )
+        parsed = ', '.join(
+            f"{column} {'double precision' if column == 'device_memory' else 'integer'}"
+            for column in PARSED_COLUMNS
+        )
+        session.execute(text(
+            f"CREATE TEMPORARY TABLE {self.STAGING_TABLE} ("
+            "seq bigserial, hash varchar(32), risk_score double precision, is_bot boolean, "
+            "visit_count integer, first_seen timestamptz, last_seen timestamptz, "
+            f"{components}, {parsed}) ON COMMIT DROP"
+        ))
+        self.cursor = session.connection().connection.driver_connection.cursor()
+        self.copy_sql = (
+            f"COPY {self.STAGING_TABLE} ({', '.join(IMPORT_COLUMNS)}) "
+            "FROM STDIN WITH (FORMAT csv)"
+        )
+
+    def load(self, rows):
+        buffer = io.StringIO()
+        # Strings are quoted and None is written unquoted, so COPY reads only
+        # missing values as NULL and keeps empty strings
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for row in rows:
+            for column, column_type in self.compressed.items():
+                if row[column] is not None:
+                    # bytea hex input format
+                    row[column] = '\\x' + column_type.process_bind_param(row[column], None).hex()
+        writer.writerows([row[column] for column in IMPORT_COLUMNS] for row in rows)
+        buffer.seek(0)
+        self.cursor.copy_expert(self.copy_sql, buffer)
+
+    def finish(self):
+        columns = ', '.join(IMPORT_COLUMNS)
+        components = ', '.join((*COMPONENT_COLUMNS.values(), *PARSED_COLUMNS))
+        keep_components = ', '.join(
+            f"{column} = COALESCE(fingerprints.{column}, EXCLUDED.{column})"
+            for column in (*COMPONENT_COLUMNS.values(), *PARSED_COLUMNS)
+        )
+        result = self.session.execute(text(
+            f"INSERT INTO fingerprints ({columns}) "
+            # Repeated rows were scored at one row's visit count: rescore_merged() scores the sum
+            "SELECT DISTINCT ON (hash) hash, "
+            "CASE WHEN count(*) OVER w > 1 THEN NULL ELSE risk_score END, is_bot, "
+            "sum(visit_count) OVER w, min(first_seen) OVER w, max(last_seen) OVER w, "
+            f"{components} "
+            f"FROM {self.STAGING_TABLE} "
+            "WINDOW w AS (PARTITION BY hash) "
+            "ORDER BY hash, seq DESC "
+            "ON CONFLICT (hash) DO UPDATE SET "
+            "visit_count = fingerprints.visit_count + EXCLUDED.visit_count, "
+            "first_seen = LEAST(fingerprints.first_seen, EXCLUDED.first_seen), "
+            "last_seen = GREATEST(fingerprints.last_seen, EXCLUDED.last_seen), "
+            "risk_score = NULL, "
+            "is_bot = EXCLUDED.is_bot, "
+            f"{keep_components}"
+        ))
+        return result.rowcount
+
+def rescore_merged(session, model=None, batch_size=IMPORT_CHUNK_SIZE):
+    """
+    Score the rows a loader merged (risk_score left NULL) at their merged visit count
+    Reads them in batches of batch_size by id. Returns the number rescored.
+    """
+    table = Fingerprint.__table__
+    columns = [table.c.id, table.c.visit_count, *(table.c[c] for c in COMPONENT_COLUMNS.values())]
+    names = list(COMPONENT_COLUMNS)
+    rescored = 0
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(*columns)
+            .where(table.c.risk_score.is_(None), table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return rescored
+        scores = score_chunk([(dict(zip(names, row[2:])), row.visit_count) for row in rows], model)
+        session.execute(update(Fingerprint), [
+            {'id': row.id, 'risk_score': risk_score, 'is_bot': is_bot}
+            for row, (risk_score, is_bot) in zip(rows, scores)
+        ])
+        rescored += len(rows)
+        last_id = rows[-1].id
+
+def _loader(session, use_copy):
+    dialect = session.get_bind(mapper=Fingerprint).dialect.name
+    if use_copy and dialect == 'postgresql':
+        return CopyLoader(session)
+    return ExecutemanyLoader(session)
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def import_fingerprints(fh, fmt='ndjson', chunk_size=IMPORT_CHUNK_SIZE, workers=None,
+                        use_copy=True, report=None):
+    """
+    Import fingerprints from an open NDJSON/CSV/MessagePack file in one transaction per shard
+    Rows are validated with FingerprintImportRecord and scored with the rule
+    engine. Existing hashes are merged: visit counts added, first/last seen
+    widened, risk rescored. Hash ranges that are being moved between shards
+    are refused (ShardUnavailable). Returns an ImportReport.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+    if fmt == 'msgpack' and msgpack is None:
+        raise ValueError("The msgpack import format needs the msgpack package")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    report = report or ImportReport()
+    now = datetime.utcnow()
+    shards = current_app.extensions['fingerprint_shards']
+    # The filter learns the hashes now (other processes' local filters on their next pass)
+    known = known_hashes()
+    loaders = {}
+
+    try:
+        chunks = _chunked(iter_records(fh, fmt, report), chunk_size)
+        model = risk_model()
+        for chunk, scores in scored_chunks(chunks, workers, model):
+            for shard, rows in shards.group_rows(_rows(chunk, scores, now)).items():
+                if shard not in loaders:
+                    loaders[shard] = _loader(shards.session(shard), use_copy)
+                loaders[shard].load(rows)
+                if known is not None:
+                    # Before commit: a rolled back import only leaves false positives
+                    known.add_many([row['hash'] for row in rows])
+            report.imported += len(chunk)
+        report.fingerprints = sum(loader.finish() for loader in loaders.values())
+        for loader in loaders.values():
+            rescore_merged(loader.session, model)
+            loader.session.commit()
+    except Exception:
+        for loader in loaders.values():
+            loader.session.rollback()
+        db.session.rollback()
+        raise
+    finally:
+        report.elapsed = time.perf_counter() - report.started
+
+    return report
@@ -0,0 +1,101 @@
+"""Pluggable JSON providers for request bodies and responses"""
+import decimal
+import uuid
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+def _default(o):
+    """Fallback encoder for types the fast encoders don't handle natively"""
+    if isinstance(o, date):
+        return o.isoformat()
+
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Stdlib json provider emitting ISO 8601 datetimes like the fast providers"""
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        return _default(o)
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype="application/json")
+
+class MsgspecProvider(JSONProvider):
+    """JSON provider backed by msgspec"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._encoder = msgspec.json.Encoder(enc_hook=_default)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj, **kwargs):
+        return self._encoder.encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return self._decoder.decode(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encoder.encode(obj), mimetype="application/json")
+
+PROVIDERS = {
+    "orjson": (OrjsonProvider, lambda: orjson is not None),
+    "msgspec": (MsgspecProvider, lambda: msgspec is not None),
+    "stdlib": (StdlibJSONProvider, lambda: True),
+}
+
+def get_json_provider_class(name="auto"):
+    """
+    Resolve a JSON provider class by name
+    'auto' picks the fastest installed encoder and falls back to stdlib
+    """
+    if name == "auto":
+        for candidate in ("orjson", "msgspec", "stdlib"):
+            provider_class, available = PROVIDERS[candidate]
+            if available():
+                return provider_class
+
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown JSON provider: {name}")
+
+    provider_class, available = PROVIDERS[name]
+    if not available():
+        raise ValueError(f"JSON provider '{name}' is not installed")
+
+    return provider_class
+
+def init_json_provider(app):
+    """Install the configured JSON provider on the app"""
+    provider_class = get_json_provider_class(app.config.get('JSON_PROVIDER', 'auto'))
+    app.json = provider_class(app)
+    return app.json
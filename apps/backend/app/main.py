@@ -2,18 +2,29 @@
 from flask import Flask, jsonify, request, render_template
 from flask_login import LoginManager
 from flask_migrate import Migrate
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from flask_cors import CORS
 
 from .config import get_config
-from .models import db, User
-from .admin import init_admin
+from .models import db
+from .admin import init_admin, warm_admin
+from .bloom import init_bloom
+from .coalesce import init_coalescing
+from .heavy_hitters import init_heavy_hitters
+from .visits import init_visits
+from .risk_model import init_risk_model
+from .compression import init_compression
+from .json_provider import init_json_provider
+from .ratelimit import RateLimiter
+from .replicas import init_replicas
+from .sharding import init_sharding
+from .tokens import init_api_tokens
+from .user_cache import init_user_cache
+from .webhooks import init_webhooks
 
 # Initialize extensions
 login_manager = LoginManager()
 migrate = Migrate()
-limiter = Limiter(key_func=get_remote_address)
+limiter = RateLimiter()
 
 def create_app(config_name=None):
     """Application factory"""
@@ -25,23 +36,43 @@ def create_app(config_name=None):
     else:
         app.config.from_object(get_config())
     
+    # JSON encoding/decoding for request bodies and responses
+    init_json_provider(app)
+    
     # Initialize extensions
     db.init_app(app)
+    init_replicas(app)
+    init_sharding(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     limiter.init_app(app)
     CORS(app)
     
     # Initialize admin
-    init_admin(app)
+    app.extensions['sixfinger_admin'] = init_admin(app)
+    
+    # Stripe webhook inbox worker
+    init_webhooks(app)
+    
+    # Filter of stored fingerprint hashes for lookups
+    init_bloom(app)
+    init_heavy_hitters(app)
+    init_visits(app)
+    init_risk_model(app)
+    # One write at a time per hash for concurrent submits
+    init_coalescing(app)
     
     # Configure login manager
     login_manager.login_view = 'auth_blueprint.login'
     login_manager.login_message = 'Please log in to access this page.'
     
+    user_cache = init_user_cache(app)
+    # Signed API tokens and their revocation list
+    init_api_tokens(app)
+    
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
     
     # Context processor for templates
     @app.context_processor
@@ -54,11 +85,15 @@ def create_app(config_name=None):
     from .views.api import api_bp
     from .views.payment import payment_bp
     from .views.dashboard import dashboard_bp
+    from .views.export import export_bp
+    from .views.stats import stats_bp
     
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(api_bp, url_prefix='/api')
     app.register_blueprint(payment_bp, url_prefix='/payment')
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
+    app.register_blueprint(export_bp, url_prefix='/export')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
     
     # Root routes
     @app.route('/')
@@ -84,17 +119,43 @@ def create_app(config_name=None):
         db.session.rollback()
         return jsonify({"error": "Internal server error"}), 500
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
+    # CLI commands (flask init-db, ...)
+    from .cli import register_commands
+    register_commands(app)
+    
+    # Create tables only when explicitly enabled; production uses migrations or `flask init-db`
+    if app.config.get('AUTO_CREATE_SCHEMA'):
+        with app.app_context():
+            db.create_all()
+            app.extensions['fingerprint_shards'].create_tables()
+    
+    # Compression dictionaries for component columns (after the schema exists)
+    init_compression(app)
+    
+    return app
+
+def warm_app(app):
+    """
+    Do the work that is otherwise deferred to the first request
+    Used by a preforking master so workers inherit the warmed state
+    """
+    warm_admin(app.extensions['sixfinger_admin'])
+    
+    for name in app.jinja_loader.list_templates():
+        app.jinja_env.get_template(name)
     
     return app
 
-# For backward compatibility and direct running
-app = create_app()
+def __getattr__(name):
+    """Create the module-level app on first access (e.g. ``gunicorn app.main:app``)"""
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
     import os
     # Use FLASK_DEBUG environment variable (Flask 2.2+)
     debug = os.environ.get('FLASK_DEBUG', '0') == '1'
-    app.run(debug=debug, host='0.0.0.0', port=5000)
+    create_app().run(debug=debug, host='0.0.0.0', port=5000)
@@ -1,28 +1,40 @@
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    BigInteger, Column, Integer, SmallInteger, String, Float, Date, DateTime, Boolean, ForeignKey,
+    Index, LargeBinary, Text, text
+)
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from .components import parse_components
+from .compression import CompressedText
+from .replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class User(db.Model, UserMixin):
     __tablename__ = "users"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
     username = Column(String(100), unique=True, index=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     is_admin = Column(Boolean, default=False)
     is_active = Column(Boolean, default=True)
+    plan_name = Column(String(50), ForeignKey("plans.name"), nullable=True)  # None = default API limits
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
+    plan = relationship("Plan")
     credits = relationship("Credit", back_populates="user", uselist=False, cascade="all, delete-orphan")
     transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
     api_keys = relationship("APIKey", back_populates="user", cascade="all, delete-orphan")
+    usage_counter = relationship("UsageCounter", uselist=False, cascade="all, delete-orphan")
+    daily_usage = relationship("DailyUsage", lazy="dynamic", cascade="all, delete-orphan")
+    usage_rollups = relationship("UsageRollup", lazy="dynamic", cascade="all, delete-orphan")
     
     def set_password(self, password):
         """Set user password with hashing"""
@@ -37,10 +49,21 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return f"<User {self.username}>"
 
+class Plan(db.Model):
+    """API rate limit tier assigned to users"""
+    __tablename__ = "plans"
+    
+    name = Column(String(50), primary_key=True)
+    rate_limit = Column(String(50), nullable=False)  # e.g. "1000/minute"
+    max_concurrent = Column(Integer, nullable=False, default=0)  # 0 = unlimited
+    
+    def __repr__(self):
+        return f"<Plan {self.name} {self.rate_limit}>"
+
 class Credit(db.Model):
     __tablename__ = "credits"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
     balance = Column(Integer, default=0)
     total_purchased = Column(Integer, default=0)
@@ -55,39 +78,134 @@ class Credit(db.Model):
 class Transaction(db.Model):
     __tablename__ = "transactions"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     amount = Column(Integer, nullable=False)
-    transaction_type = Column(String(50), nullable=False)  # 'purchase', 'usage', 'refund'
+    transaction_type = Column(String(50), nullable=False)  # 'purchase', 'refund' ('usage' only in legacy rows, see UsageRollup)
     description = Column(Text, nullable=True)
     stripe_payment_id = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="transactions")
     
+    __table_args__ = (
+        # History and API listings: newest first per user, keyset on (created_at, id)
+        Index("ix_transactions_user_created", "user_id", "created_at", "id"),
+        # One ledger row per Stripe payment, however often its events are delivered
+        Index("uq_transactions_stripe_payment_id", "stripe_payment_id", unique=True),
+    )
+    
     def __repr__(self):
         return f"<Transaction {self.transaction_type} amount={self.amount}>"
 
+class WebhookEvent(db.Model):
+    """Inbox of received Stripe webhook events, applied by app.webhooks"""
+    __tablename__ = "webhook_events"
+    
+    id = Column(String(255), primary_key=True)  # Stripe event id
+    type = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # 'pending', 'processed', 'ignored', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    available_at = Column(DateTime(timezone=True), nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        # Worker poll: due pending events, oldest first
+        Index("ix_webhook_events_status_available", "status", "available_at"),
+    )
+    
+    def __repr__(self):
+        return f"<WebhookEvent {self.id} {self.type} {self.status}>"
+
 class APIKey(db.Model):
     __tablename__ = "api_keys"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     key = Column(String(64), unique=True, index=True, nullable=False)
     name = Column(String(100), nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_used = Column(DateTime(timezone=True), nullable=True)
+    # Overrides of the owner's plan limits (None = use the plan's)
+    rate_limit = Column(String(50), nullable=True)  # e.g. "1000/minute"
+    max_concurrent = Column(Integer, nullable=True)  # 0 = unlimited
     
     user = relationship("User", back_populates="api_keys")
     
+    __table_args__ = (
+        # require_api_key looks keys up through the unique index on key
+        Index("ix_api_keys_user_id", "user_id"),
+    )
+    
     def __repr__(self):
         return f"<APIKey {self.name}>"
 
+class TokenRevocation(db.Model):
+    """A disabled API key or user whose signed tokens are refused (see app.tokens)"""
+    __tablename__ = "token_revocations"
+
+    subject = Column(String(10), primary_key=True)  # "key" or "user"
+    subject_id = Column(Integer, primary_key=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_token_revocations_revoked_at", "revoked_at"),
+    )
+
+    def __repr__(self):
+        return f"<TokenRevocation {self.subject} {self.subject_id}>"
+
+class UsageCounter(db.Model):
+    """Per-user usage totals maintained incrementally on every credit debit"""
+    __tablename__ = "usage_counters"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    api_calls = Column(Integer, default=0, nullable=False)
+    active_keys = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<UsageCounter user_id={self.user_id} api_calls={self.api_calls}>"
+
+class DailyUsage(db.Model):
+    """Per-user, per-day API call and credit counts"""
+    __tablename__ = "daily_usage"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    api_calls = Column(Integer, default=0, nullable=False)
+    credits_used = Column(Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<DailyUsage user_id={self.user_id} day={self.day} api_calls={self.api_calls}>"
+
+class UsageRollup(db.Model):
+    """API calls per user, API key, endpoint and minute; replaces per-call usage transactions"""
+    __tablename__ = "usage_rollups"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # Not a foreign key: usage history outlives deleted keys (0 = unknown, e.g. backfilled rows)
+    api_key_id = Column(Integer, primary_key=True, default=0)
+    endpoint = Column(String(100), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    calls = Column(Integer, default=0, nullable=False)
+    credits_used = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_usage_rollups_user_bucket", "user_id", "bucket"),
+    )
+    
+    def __repr__(self):
+        return f"<UsageRollup user_id={self.user_id} endpoint={self.endpoint} bucket={self.bucket} calls={self.calls}>"
+
 class Fingerprint(db.Model):
     __tablename__ = "fingerprints"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     hash = Column(String(32), unique=True, index=True, nullable=False)
     risk_score = Column(Float, default=0.0)
     is_bot = Column(Boolean, default=False)
@@ -95,19 +213,137 @@ class Fingerprint(db.Model):
     last_seen = Column(DateTime(timezone=True), onupdate=func.now())
     visit_count = Column(Integer, default=1)
     
-    # Component data (simplified storage)
-    canvas = Column(String, nullable=True)
+    # Component data (simplified storage); the long, repetitive ones are
+    # zstd-compressed (app.compression) and only loaded when read
+    canvas = deferred(Column(CompressedText("canvas"), nullable=True), group="compressed_components")
     webgl = Column(String, nullable=True)
     audio = Column(String, nullable=True)
-    fonts = Column(String, nullable=True)
+    fonts = deferred(Column(CompressedText("fonts"), nullable=True), group="compressed_components")
     hardware = Column(String, nullable=True)
     screen = Column(String, nullable=True)
-    browser = Column(String, nullable=True)
+    browser = deferred(Column(CompressedText("browser"), nullable=True), group="compressed_components")
     timezone = Column(String, nullable=True)
-    plugins = Column(String, nullable=True)
+    plugins = deferred(Column(CompressedText("plugins"), nullable=True), group="compressed_components")
     touch = Column(String, nullable=True)
     battery = Column(String, nullable=True)
     network = Column(String, nullable=True)
     media = Column(String, nullable=True)
     color_depth = Column(String, nullable=True)
     do_not_track = Column(String, nullable=True)
+    
+    # Typed values parsed from the components at ingest (app.components);
+    # NULL missing_components means the row predates them (flask backfill-components)
+    cpu_cores = Column(SmallInteger, nullable=True)
+    device_memory = Column(Float, nullable=True)
+    screen_width = Column(SmallInteger, nullable=True)
+    screen_height = Column(SmallInteger, nullable=True)
+    max_touch_points = Column(SmallInteger, nullable=True)
+    tz_offset = Column(SmallInteger, nullable=True)  # minutes, positive west of UTC
+    missing_components = Column(Integer, nullable=True)  # bit set of app.components.MISSING_COMPONENTS
+    
+    __table_args__ = (
+        # Admin "is_bot" filter with keyset paging by id
+        Index(
+            "ix_fingerprints_bot_id", "id",
+            postgresql_where=text("is_bot"), sqlite_where=text("is_bot")
+        ),
+        # Admin risk_score range filters
+        Index("ix_fingerprints_risk_score", "risk_score"),
+        # Device analytics and admin filters on parsed components
+        Index("ix_fingerprints_cpu_cores", "cpu_cores"),
+        Index("ix_fingerprints_screen", "screen_width", "screen_height"),
+        Index("ix_fingerprints_tz_offset", "tz_offset"),
+    )
+    
+    def components_dict(self):
+        """Stored components keyed by their API (camelCase) names"""
+        return {name: getattr(self, column) for name, column in COMPONENT_COLUMNS.items()}
+    
+    def parsed_components(self):
+        """Typed component values, parsed now if the row predates the columns"""
+        if self.missing_components is None:
+            return parse_components(self.components_dict())
+        return {column: getattr(self, column) for column in PARSED_COLUMNS}
+    
+    def set_parsed_components(self, parsed):
+        for column, value in parsed.items():
+            setattr(self, column, value)
+
+class CompressionDictionary(db.Model):
+    """A trained zstd dictionary for one compressed column; rows keep the version they used"""
+    __tablename__ = "compression_dictionaries"
+    
+    version = Column(Integer, primary_key=True)
+    column_name = Column(String(50), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    samples = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<CompressionDictionary version={self.version} column={self.column_name}>"
+
+class FingerprintShardRange(db.Model):
+    """Fingerprints with hash >= start (up to the next range's start) live on `shard`"""
+    __tablename__ = "fingerprint_shard_ranges"
+    
+    start = Column(String(32), primary_key=True)  # '' = from the beginning
+    shard = Column(String(50), nullable=False)  # 'main' or a FINGERPRINT_SHARDS name
+    state = Column(String(20), nullable=True)  # None, 'moving' or 'frozen' (writes refused)
+    
+    def __repr__(self):
+        return f"<FingerprintShardRange {self.start!r} {self.shard} {self.state}>"
+
+class FingerprintVisit(db.Model):
+    """
+    One submit of a fingerprint; append-only, written in batches by app.visits
+    On PostgreSQL the table is partitioned by range of seen_at, one partition
+    per day (created and dropped by app.visits).
+    """
+    __tablename__ = "fingerprint_visits"
+    
+    # Signed 64-bit digest of the hash (app.visits.hash_key): stable across shards
+    hash_key = Column(BigInteger, nullable=False)
+    seen_at = Column(DateTime(timezone=True), nullable=False)
+    # Not a foreign key: the log outlives deleted keys
+    api_key_id = Column(Integer, nullable=False, default=0)
+    # Packed address: 4 bytes for IPv4, 16 for IPv6
+    ip = Column(LargeBinary(16), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_fingerprint_visits_hash_key_seen_at", "hash_key", "seen_at"),
+        {"postgresql_partition_by": "RANGE (seen_at)"},
+    )
+    # No primary key in the table (a partitioned one would need seen_at in it);
+    # the ORM identity is only used for reads
+    __mapper_args__ = {"primary_key": [hash_key, seen_at]}
+    
+    def __repr__(self):
+        return f"<FingerprintVisit {self.hash_key} {self.seen_at}>"
+
+# API component name -> Fingerprint column
+COMPONENT_COLUMNS = {
+    "canvas": "canvas",
+    "webgl": "webgl",
+    "audio": "audio",
+    "fonts": "fonts",
+    "hardware": "hardware",
+    "screen": "screen",
+    "browser": "browser",
+    "timezone": "timezone",
+    "plugins": "plugins",
+    "touch": "touch",
+    "battery": "battery",
+    "network": "network",
+    "media": "media",
+    "colorDepth": "color_depth",
+    "doNotTrack": "do_not_track",
+}
+
+# Fingerprint columns filled by app.components.parse_components
+PARSED_COLUMNS = (
+    "cpu_cores", "device_memory", "screen_width", "screen_height",
+    "max_touch_points", "tz_offset", "missing_components",
+)
+
+# Fingerprint columns stored with app.compression.CompressedText
+COMPRESSED_COLUMNS = ("canvas", "fonts", "browser", "plugins")
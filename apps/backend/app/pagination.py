@@ -0,0 +1,64 @@
+"""Keyset (cursor) pagination helpers"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+def encode_cursor(values):
+    """Encode the sort-key values of the last row as an opaque URL-safe cursor"""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def decode_cursor(cursor, columns):
+    """
+    Decode a cursor back into typed values for `columns`
+    Raises ValueError for malformed or mismatched cursors
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("Invalid cursor")
+
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+        if python_type is datetime:
+            if not isinstance(value, str):
+                raise ValueError("Invalid cursor")
+            value = datetime.fromisoformat(value)
+        # bool is an int, but never a valid int sort key
+        elif isinstance(value, bool) is not (python_type is bool) or not isinstance(value, python_type):
+            raise ValueError("Invalid cursor")
+        decoded.append(value)
+    return decoded
+
+def keyset_page(query, columns, cursor=None, limit=50):
+    """
+    Fetch one page of `query` ordered by `columns` descending, after `cursor`
+    The cost is the same for every page: an index range scan of limit + 1 rows
+    with no OFFSET and no COUNT(*). Returns (items, next_cursor); next_cursor is
+    None on the last page.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        if len(columns) == 1:
+            query = query.filter(columns[0] < values[0])
+        else:
+            query = query.filter(tuple_(*columns) < tuple_(*values))
+
+    items = query.order_by(*[c.desc() for c in columns]).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+
+    return items, next_cursor
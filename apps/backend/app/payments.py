@@ -1,14 +1,19 @@
 """Stripe payment integration"""
-import stripe
+# stripe is imported inside the functions that use it; it is slow to import
+# and only needed on the payment paths
 from flask import current_app
+from sqlalchemy.exc import IntegrityError
 from .models import User, Credit, Transaction, db
 
 def init_stripe():
     """Initialize Stripe with API key"""
+    import stripe
     stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
 
 def create_checkout_session(user_id, package_name):
     """Create a Stripe checkout session for credit purchase"""
+    import stripe
+    
     user = User.query.get(user_id)
     if not user:
         raise ValueError("User not found")
@@ -51,49 +56,56 @@ def create_checkout_session(user_id, package_name):
         raise
 
 def handle_successful_payment(session):
-    """Handle successful payment and credit user account"""
+    """
+    Credit the user for a completed checkout session
+    Runs inside the caller's transaction and does not commit. Returns False
+    without changing anything if this payment was already credited; the
+    unique index on stripe_payment_id makes that hold under concurrent workers.
+    Raises ValueError if the session cannot be applied.
+    """
+    metadata = session.get('metadata') or {}
     try:
-        user_id = int(session.metadata.get('user_id'))
-        credits_amount = int(session.metadata.get('credits'))
-        package = session.metadata.get('package')
-        
-        user = User.query.get(user_id)
-        if not user:
-            current_app.logger.error(f"User {user_id} not found for payment")
-            return False
-        
-        # Get or create credit record
-        credit = Credit.query.filter_by(user_id=user_id).first()
-        if not credit:
-            credit = Credit(user_id=user_id, balance=0, total_purchased=0, total_used=0)
-            db.session.add(credit)
-        
-        # Add credits
-        credit.balance += credits_amount
-        credit.total_purchased += credits_amount
-        
-        # Create transaction record
-        transaction = Transaction(
-            user_id=user_id,
-            amount=credits_amount,
-            transaction_type='purchase',
-            description=f'Purchased {package} package',
-            stripe_payment_id=session.payment_intent
-        )
-        db.session.add(transaction)
-        
-        db.session.commit()
-        
-        current_app.logger.info(f"Added {credits_amount} credits to user {user_id}")
-        return True
-        
-    except Exception as e:
-        current_app.logger.error(f"Error handling payment: {e}")
-        db.session.rollback()
+        user_id = int(metadata.get('user_id'))
+        credits_amount = int(metadata.get('credits'))
+    except (TypeError, ValueError):
+        raise ValueError("Checkout session metadata is missing user_id or credits")
+    package = metadata.get('package')
+    payment_id = session.get('payment_intent') or session.get('id')
+    
+    if not db.session.get(User, user_id):
+        raise ValueError(f"User {user_id} not found for payment")
+    
+    try:
+        with db.session.begin_nested():
+            db.session.add(Transaction(
+                user_id=user_id,
+                amount=credits_amount,
+                transaction_type='purchase',
+                description=f'Purchased {package} package',
+                stripe_payment_id=payment_id
+            ))
+    except IntegrityError:
+        current_app.logger.info(f"Payment {payment_id} already credited")
         return False
+    
+    # Get or create credit record
+    credit = Credit.query.filter_by(user_id=user_id).first()
+    if not credit:
+        credit = Credit(user_id=user_id, balance=0, total_purchased=0, total_used=0)
+        db.session.add(credit)
+        db.session.flush()
+    
+    # Add credits in SQL so concurrent debits are not lost
+    credit.balance = Credit.balance + credits_amount
+    credit.total_purchased = Credit.total_purchased + credits_amount
+    
+    current_app.logger.info(f"Added {credits_amount} credits to user {user_id}")
+    return True
 
 def verify_webhook_signature(payload, sig_header):
     """Verify Stripe webhook signature"""
+    import stripe
+    
     webhook_secret = current_app.config.get('STRIPE_WEBHOOK_SECRET')
     
     if not webhook_secret:
@@ -0,0 +1,426 @@
+"""
+Two-tier rate limiting
+Each process enforces limits with local token buckets and pushes consumed
+tokens to Redis in batches, so most requests cost no network round trip.
+Between syncs the global limit can be overshot by at most
+(processes x RATELIMIT_SYNC_BATCH) hits per window. If Redis is unreachable
+the local buckets keep enforcing on their own until it is back.
+
+Anonymous and session traffic is limited per client IP (RATELIMIT_DEFAULT);
+API calls are limited per API key, with the key's or its owner's plan limits
+(API_RATE_LIMIT / API_MAX_CONCURRENT when neither sets one).
+"""
+import math
+import re
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from flask import current_app, g, jsonify, request
+
+from .fake_redis import FakeRedis
+from .models import Plan, db
+
+try:
+    import redis
+    from redis.exceptions import RedisError
+except ImportError:
+    redis = None
+    RedisError = OSError
+
+_UNITS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$')
+
+class RateLimit:
+    """`amount` hits per `period` seconds"""
+    __slots__ = ('amount', 'period')
+
+    def __init__(self, amount, period):
+        self.amount = amount
+        self.period = period
+
+    @property
+    def key(self):
+        return f"{self.amount}/{self.period}"
+
+    def __eq__(self, other):
+        return isinstance(other, RateLimit) and (self.amount, self.period) == (other.amount, other.period)
+
+    def __hash__(self):
+        return hash((self.amount, self.period))
+
+    def __repr__(self):
+        return f"<RateLimit {self.amount}/{self.period}s>"
+
+@lru_cache(maxsize=1024)
+def parse_limit(value):
+    """Parse "100/minute", "10 per second" or "1000/5 minutes"; raises ValueError"""
+    match = _LIMIT_RE.match(value.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit: {value!r}")
+    amount, multiple, unit = match.groups()
+    return RateLimit(int(amount), int(multiple or 1) * _UNITS[unit])
+
+class _KeyState:
+    """Local view of one (limit, key) pair"""
+    __slots__ = ('tokens', 'updated', 'window', 'global_count', 'pending', 'synced_at')
+
+    def __init__(self, limit, now):
+        self.tokens = float(limit.amount)
+        self.updated = now
+        self.window = int(now // limit.period)
+        self.global_count = 0
+        self.pending = 0
+        self.synced_at = 0.0
+
+class TwoTierStore:
+    """
+    Local token buckets backed by per-window hit counters in Redis
+    A hit must find a token in the local bucket (capacity `amount`, refilled
+    at amount/period per second) and fit under the limit given the last
+    synced global count plus this process's unsynced hits. Unsynced hits are
+    flushed with one pipelined INCRBY per key once `sync_batch` accumulate or
+    `sync_interval` seconds pass.
+    """
+
+    def __init__(self, redis_client=None, sync_batch=10, sync_interval=1.0,
+                 retry_interval=5.0, prefix='rl'):
+        self.redis = redis_client
+        self.sync_batch = sync_batch
+        self.sync_interval = sync_interval
+        self.retry_interval = retry_interval
+        self.prefix = prefix
+        self._states = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._redis_down_until = 0.0
+
+    @property
+    def degraded(self):
+        """True while enforcing locally only"""
+        return self.redis is None or time.time() < self._redis_down_until
+
+    def hit(self, key, limit, cost=1, now=None):
+        """
+        Record a hit for `key` under `limit`
+        Returns (allowed, remaining, reset) with reset in seconds until the
+        current window ends.
+        """
+        now = time.time() if now is None else now
+        state_key = (limit, key)
+
+        with self._lock:
+            state = self._states.get(state_key)
+            if state is None:
+                state = self._states[state_key] = _KeyState(limit, now)
+            self._advance(state, limit, now)
+            should_sync = not self.degraded and (
+                state.pending >= self.sync_batch or now - state.synced_at >= self.sync_interval
+            )
+
+        if should_sync:
+            self._sync(now)
+
+        with self._lock:
+            self._advance(state, limit, now)
+            used = state.pending if self.degraded else state.global_count + state.pending
+            allowed = state.tokens >= cost and used + cost <= limit.amount
+            if allowed:
+                state.tokens -= cost
+                state.pending += cost
+                used += cost
+            remaining = max(0, min(int(state.tokens), limit.amount - used))
+            reset = (state.window + 1) * limit.period - now
+
+        return allowed, remaining, reset
+
+    def _advance(self, state, limit, now):
+        """Refill the bucket and roll the window over; call with the lock held"""
+        elapsed = now - state.updated
+        if elapsed > 0:
+            state.tokens = min(float(limit.amount), state.tokens + elapsed * limit.amount / limit.period)
+            state.updated = now
+
+        window = int(now // limit.period)
+        if window != state.window:
+            # Hits in a finished window no longer count towards anything
+            state.window = window
+            state.global_count = 0
+            state.pending = 0
+            state.synced_at = 0.0
+
+    def _redis_key(self, limit, key, window):
+        return f"{self.prefix}:{limit.key}:{key}:{window}"
+
+    def sync(self, now=None):
+        """Flush unsynced hits of every key to Redis now"""
+        self._sync(time.time() if now is None else now)
+
+    def _sync(self, now):
+        with self._lock:
+            batch = []
+            for (limit, key), state in list(self._states.items()):
+                if int(now // limit.period) > state.window and state.pending == 0:
+                    # Idle key from an earlier window
+                    del self._states[(limit, key)]
+                    continue
+                if state.pending or now - state.synced_at >= self.sync_interval:
+                    batch.append((limit, key, state, state.window, state.pending))
+                    state.pending = 0
+
+        if not batch:
+            return
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for limit, key, state, window, pending in batch:
+                redis_key = self._redis_key(limit, key, window)
+                pipe.incrby(redis_key, pending)
+                pipe.expire(redis_key, limit.period * 2)
+            results = pipe.execute()
+        except (RedisError, OSError) as e:
+            self._mark_down(e)
+            with self._lock:
+                for limit, key, state, window, pending in batch:
+                    if state.window == window:
+                        state.pending += pending
+            return
+
+        with self._lock:
+            for (limit, key, state, window, pending), count in zip(batch, results[0::2]):
+                if state.window == window:
+                    state.global_count = int(count)
+                    state.synced_at = now
+
+    # Concurrency slots. Unlike hit counts these cannot be batched, so a capped
+    # key costs a round trip on acquire and on release; uncapped keys cost nothing.
+    # In Redis each slot is a lease in a sorted set scored by its acquire time:
+    # a slot leaked by a killed process ages out after CONCURRENCY_TTL, however
+    # busy the key stays.
+
+    def acquire(self, key, cap):
+        """
+        Take one of `cap` in-flight slots for `key`
+        Returns a slot to pass to release(), or None if all slots are taken.
+        Counted in Redis across processes, or locally while degraded.
+        """
+        redis_key = f"{self.prefix}:inflight:{key}"
+        lease = None
+        if not self.degraded:
+            lease = uuid.uuid4().hex
+            now = time.time()
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.zremrangebyscore(redis_key, '-inf', now - CONCURRENCY_TTL)
+                pipe.zadd(redis_key, {lease: now})
+                pipe.zcard(redis_key)
+                # Drops the set once every lease in it has aged out
+                pipe.expire(redis_key, CONCURRENCY_TTL)
+                count = pipe.execute()[2]
+            except (RedisError, OSError) as e:
+                self._mark_down(e)
+                lease = None
+
+        with self._lock:
+            local = self._in_flight.get(key, 0) + 1
+            self._in_flight[key] = local
+        if lease is None:
+            count = local
+
+        slot = (key, redis_key, lease)
+        if count > cap:
+            self.release(slot)
+            return None
+        return slot
+
+    def release(self, slot):
+        """Give back a slot returned by acquire()"""
+        key, redis_key, lease = slot
+        with self._lock:
+            local = self._in_flight.get(key, 0) - 1
+            if local > 0:
+                self._in_flight[key] = local
+            else:
+                self._in_flight.pop(key, None)
+        if lease is not None:
+            try:
+                self.redis.zrem(redis_key, lease)
+            except (RedisError, OSError) as e:
+                self._mark_down(e)
+
+    def _mark_down(self, error):
+        self._redis_down_until = time.time() + self.retry_interval
+        current_app.logger.warning(
+            f"Rate limit storage unreachable, enforcing locally for {self.retry_interval}s: {error}"
+        )
+
+# Seconds an in-flight slot is held at most if it is never released
+CONCURRENCY_TTL = 60
+
+class PlanCache:
+    """
+    Plan name -> (RateLimit, max_concurrent), read from the plans table at most
+    once per `ttl` seconds per process, so limit lookups cost no queries
+    Admin edits call invalidate() in the editing process; others pick the
+    change up within `ttl`.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._plans = None
+        self._loaded_at = 0.0
+
+    def get(self, name):
+        plans = self._plans
+        if plans is None or time.monotonic() - self._loaded_at > self.ttl:
+            plans = self._load()
+        return plans.get(name)
+
+    def invalidate(self):
+        self._plans = None
+
+    def _load(self):
+        plans = {}
+        for name, rate_limit, max_concurrent in db.session.query(
+            Plan.name, Plan.rate_limit, Plan.max_concurrent
+        ):
+            try:
+                plans[name] = (parse_limit(rate_limit), max_concurrent or 0)
+            except ValueError as e:
+                current_app.logger.error(f"Ignoring plan {name}: {e}")
+        self._plans = plans
+        self._loaded_at = time.monotonic()
+        return plans
+
+def api_key_limits(api_key, user):
+    """(RateLimit, max_concurrent) for an API key: key override, else plan, else defaults"""
+    plan = None
+    if user.plan_name:
+        plan = current_app.extensions['rate_limit_plans'].get(user.plan_name)
+
+    if api_key.rate_limit:
+        limit = parse_limit(api_key.rate_limit)
+    elif plan:
+        limit = plan[0]
+    else:
+        limit = parse_limit(current_app.config.get('API_RATE_LIMIT', '600/minute'))
+
+    if api_key.max_concurrent is not None:
+        max_concurrent = api_key.max_concurrent
+    elif plan:
+        max_concurrent = plan[1]
+    else:
+        max_concurrent = current_app.config.get('API_MAX_CONCURRENT', 0)
+
+    return limit, max_concurrent
+
+def _too_many(message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def _check(key, limit):
+    """Count a hit and remember the outcome for the RateLimit-* headers"""
+    allowed, remaining, reset = current_app.extensions['ratelimit'].hit(key, limit)
+    g.rate_limit = (limit, remaining, reset)
+    if not allowed:
+        return _too_many("Rate limit exceeded", reset)
+    return None
+
+def enforce_default_limit():
+    """Apply RATELIMIT_DEFAULT to the client IP; returns a 429 response or None"""
+    if not current_app.config.get('RATELIMIT_ENABLED', True):
+        return None
+    default = current_app.config.get('RATELIMIT_DEFAULT')
+    if not default:
+        return None
+    return _check(f"ip:{get_remote_address()}", parse_limit(default))
+
+def enforce_api_key_limits(api_key, user):
+    """
+    Apply the API key's rate limit and concurrency cap
+    Returns a 429 response or None; a concurrency slot taken here is released
+    when the request ends.
+    """
+    if not current_app.config.get('RATELIMIT_ENABLED', True):
+        return None
+    limit, max_concurrent = api_key_limits(api_key, user)
+
+    response = _check(f"key:{api_key.id}", limit)
+    if response is not None:
+        return response
+
+    if max_concurrent:
+        slot = current_app.extensions['ratelimit'].acquire(f"key:{api_key.id}", max_concurrent)
+        if slot is None:
+            return _too_many("Too many concurrent requests", 1)
+        g.rate_limit_slot = slot
+    return None
+
+def exempt(f):
+    """Skip the per-IP default limit for a view (it is limited another way)"""
+    f.rate_limit_exempt = True
+    return f
+
+def storage_from_url(url, timeout=0.05):
+    """Redis client for a storage URL; "memory://" gives a process-local FakeRedis"""
+    if not url or url.startswith('memory://'):
+        return FakeRedis()
+    if redis is None:
+        return None
+    return redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+def get_remote_address():
+    """Client IP (behind a proxy, configure ProxyFix so this is the real client)"""
+    return request.remote_addr or '127.0.0.1'
+
+class RateLimiter:
+    """Flask extension enforcing the per-IP default limit and setting RateLimit-* headers"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['ratelimit'] = TwoTierStore(
+            storage_from_url(
+                app.config.get('RATELIMIT_STORAGE_URL'),
+                timeout=app.config.get('RATELIMIT_REDIS_TIMEOUT', 0.05)
+            ),
+            sync_batch=app.config.get('RATELIMIT_SYNC_BATCH', 10),
+            sync_interval=app.config.get('RATELIMIT_SYNC_INTERVAL', 1.0),
+            retry_interval=app.config.get('RATELIMIT_REDIS_RETRY', 5.0)
+        )
+        app.extensions['rate_limit_plans'] = PlanCache(app.config.get('RATELIMIT_PLAN_TTL', 60.0))
+
+        @app.before_request
+        def check_rate_limit():
+            view = current_app.view_functions.get(request.endpoint)
+            if getattr(view, 'rate_limit_exempt', False):
+                return None
+            return enforce_default_limit()
+
+        @app.after_request
+        def add_rate_limit_headers(response):
+            state = g.get('rate_limit')
+            if state is not None:
+                limit, remaining, reset = state
+                response.headers['RateLimit-Limit'] = str(limit.amount)
+                response.headers['RateLimit-Remaining'] = str(remaining)
+                response.headers['RateLimit-Reset'] = str(math.ceil(reset))
+                response.headers['RateLimit-Policy'] = f"{limit.amount};w={limit.period}"
+            return response
+
+        @app.teardown_request
+        def release_concurrency_slot(exc):
+            slot = g.pop('rate_limit_slot', None)
+            if slot is not None:
+                current_app.extensions['ratelimit'].release(slot)
@@ -0,0 +1,162 @@
+"""
+Read-replica routing
+Replica URLs (SQLALCHEMY_REPLICA_URIS) get engines of their own, outside
+Flask-SQLAlchemy's binds so create_all/drop_all never touch them. Views
+marked with @replica_reads send their SELECTs to a replica; everything else,
+and every write, goes to the primary. Within a marked view the first
+write (flush, INSERT/UPDATE/DELETE or raw connection) pins the rest of the
+request to the primary, and a logged-in user who wrote recently reads from
+the primary for REPLICA_STICKY_SECONDS. With REPLICA_MAX_LAG set, replicas
+further behind than that are skipped (all of them lagging = primary).
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, create_engine, text
+
+REPLICA_NAME_PREFIX = 'replica_'
+STICKY_SESSION_KEY = '_primary_until'
+
+# Seconds the replica is behind; 0 when caught up or not a standby
+PG_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+class RoutingSession(Session):
+    """Session that reads from the request's replica, if one was chosen"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or not isinstance(clause, Select):
+                g.db_wrote = True
+                scope = g.get('db_replica')
+                if scope is not None:
+                    scope['pinned'] = True
+            else:
+                scope = g.get('db_replica')
+                if scope is not None and not scope['pinned'] and scope['engine'] is not None:
+                    return scope['engine']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_lag(engine):
+    """Replication lag in seconds (only measured on PostgreSQL)"""
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    with engine.connect() as conn:
+        return float(conn.execute(PG_LAG_SQL).scalar() or 0)
+
+class ReplicaRouter:
+    """Picks a replica engine for a read-only request"""
+
+    def __init__(self, engines, max_lag=None, check_interval=5.0, lag_probe=replica_lag):
+        self.engines = dict(engines)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag_probe = lag_probe
+        self._lag = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """A random replica engine within max_lag, or None for the primary"""
+        healthy = [key for key, engine in self.engines.items() if self.healthy(key, engine)]
+        return self.engines[random.choice(healthy)] if healthy else None
+
+    def healthy(self, key, engine, now=None):
+        if self.max_lag is None:
+            return True
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            checked = self._lag.get(key)
+        if checked is None or now - checked[0] >= self.check_interval:
+            try:
+                lag = self.lag_probe(engine)
+            except Exception as e:
+                current_app.logger.warning(f"Replica {key} lag check failed: {e}")
+                lag = float('inf')
+            checked = (now, lag)
+            with self._lock:
+                self._lag[key] = checked
+        return checked[1] <= self.max_lag
+
+def _sticky():
+    """Whether the logged-in user wrote within the sticky window"""
+    return '_user_id' in session and session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+def _choose_replica():
+    router = current_app.extensions.get('replicas')
+    if router is None or not router.engines or _sticky():
+        return None
+    return router.choose()
+
+def route_reads_to_replica():
+    """Send the rest of this request's reads to a replica (admin list views)"""
+    g.db_replica = {'engine': _choose_replica(), 'pinned': False}
+
+def reading_from_replica():
+    scope = g.get('db_replica')
+    return scope is not None and scope['engine'] is not None and not scope['pinned']
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block"""
+    scope = g.pop('db_replica', None)
+    try:
+        yield
+    finally:
+        if scope is not None:
+            g.db_replica = scope
+
+def replica_reads(f):
+    """
+    Route the view's reads to a replica
+    Put it below auth decorators, so their lookups and writes stay on the primary.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        previous = g.get('db_replica')
+        route_reads_to_replica()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.db_replica = previous
+    return decorated_function
+
+def init_replicas(app):
+    """Create replica engines and the routing hooks"""
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    engines = {
+        f'{REPLICA_NAME_PREFIX}{i}': create_engine(uri, **options)
+        for i, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or [])
+    }
+
+    router = ReplicaRouter(
+        engines,
+        max_lag=app.config.get('REPLICA_MAX_LAG'),
+        check_interval=app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5.0)
+    )
+    app.extensions['replicas'] = router
+    sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+    @app.before_request
+    def reset_routing():
+        g.pop('db_replica', None)
+        g.pop('db_wrote', None)
+
+    @app.after_request
+    def remember_writes(response):
+        if engines and g.pop('db_wrote', False) and '_user_id' in session:
+            session[STICKY_SESSION_KEY] = time.time() + sticky_seconds
+        return response
+
+    @app.teardown_request
+    def clear_routing(exc):
+        g.pop('db_replica', None)
+
+    return router
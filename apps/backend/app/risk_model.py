@@ -0,0 +1,210 @@
+"""
+Learned risk model: logistic regression over app.features
+`flask train-risk-model` fits it offline from labeled fingerprints and writes
+a JSON artifact; RISK_MODEL_PATH loads it once per process. Scoring is one
+dot product: standardization is folded into the weights at load time.
+risk_score is 100 x the bot probability, and is_bot compares the probability
+with the threshold picked in training for a target false positive rate.
+
+Without a model (or without numpy) scoring falls back to the hand-weighted
+rules in app.risk_scoring.
+"""
+import json
+import math
+import random
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from .features import FEATURE_NAMES, feature_matrix, feature_vector
+from .risk_scoring import calculate_risk_score
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MODEL_FORMAT = 1
+# Factors reported with a model score: the largest positive contributions
+MODEL_FACTORS = 5
+
+class RiskModel:
+    """A trained model's weights over standardized features, and its decision threshold"""
+
+    def __init__(self, weights, intercept, mean, scale, threshold=0.5,
+                 features=FEATURE_NAMES, metadata=None):
+        if np is None:
+            raise RuntimeError("The risk model needs numpy")
+        if tuple(features) != FEATURE_NAMES:
+            raise ValueError("Risk model was trained on different features; retrain it")
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.threshold = float(threshold)
+        self.metadata = metadata or {}
+        # w . ((x - mean) / scale) + b == x . w' + b'
+        self._raw_weights = self.weights / self.scale
+        self._raw_intercept = self.intercept - float(self._raw_weights @ self.mean)
+
+    def probabilities(self, matrix):
+        """Bot probability of each row of a feature matrix"""
+        return 1.0 / (1.0 + np.exp(-(matrix @ self._raw_weights + self._raw_intercept)))
+
+    def score(self, components, visit_count, explain=False):
+        """(risk_score, is_bot, factors) for one fingerprint, like calculate_risk_score"""
+        x = np.array(feature_vector(components, visit_count))
+        z = float(x @ self._raw_weights) + self._raw_intercept
+        probability = 1.0 / (1.0 + math.exp(-z)) if z > -500 else 0.0
+        factors = {"model": self.metadata.get("trained_at", "model")}
+        if explain:
+            contributions = (x - self.mean) / self.scale * self.weights
+            for i in np.argsort(contributions)[::-1][:MODEL_FACTORS]:
+                if contributions[i] <= 0:
+                    break
+                factors[FEATURE_NAMES[i]] = round(float(contributions[i]), 3)
+        return round(probability * 100, 2), probability >= self.threshold, factors
+
+    def score_batch(self, components_list, visit_counts):
+        """[(risk_score, is_bot)] for a batch"""
+        probabilities = self.probabilities(feature_matrix(components_list, visit_counts))
+        return [
+            (round(float(p) * 100, 2), bool(p >= self.threshold)) for p in probabilities
+        ]
+
+    def to_dict(self):
+        return {
+            "format": MODEL_FORMAT,
+            "features": list(FEATURE_NAMES),
+            "weights": self.weights.tolist(),
+            "intercept": self.intercept,
+            "mean": self.mean.tolist(),
+            "scale": self.scale.tolist(),
+            "threshold": self.threshold,
+            "metadata": self.metadata,
+        }
+
+    def save(self, path):
+        with open(path, "w") as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fh:
+            data = json.load(fh)
+        if data.get("format") != MODEL_FORMAT:
+            raise ValueError(f"Unsupported risk model format {data.get('format')!r}")
+        return cls(
+            data["weights"], data["intercept"], data["mean"], data["scale"],
+            threshold=data["threshold"], features=data["features"], metadata=data.get("metadata")
+        )
+
+# Training
+
+def classification_report(predicted, labels):
+    """Precision, recall and false positive rate of boolean predictions"""
+    predicted = np.asarray(predicted, dtype=bool)
+    labels = np.asarray(labels, dtype=bool)
+    true_positives = int(np.sum(predicted & labels))
+    false_positives = int(np.sum(predicted & ~labels))
+    positives, negatives = int(labels.sum()), int((~labels).sum())
+    flagged = true_positives + false_positives
+    return {
+        "precision": true_positives / flagged if flagged else None,
+        "recall": true_positives / positives if positives else None,
+        "false_positive_rate": false_positives / negatives if negatives else None,
+    }
+
+def threshold_for(probabilities, labels, max_false_positive_rate):
+    """Lowest threshold flagging at most max_false_positive_rate of the humans"""
+    humans = np.sort(np.asarray(probabilities)[~np.asarray(labels, dtype=bool)])[::-1]
+    allowed = int(max_false_positive_rate * len(humans))
+    if allowed >= len(humans):
+        return 0.0
+    # Just above the highest-scored human that must not be flagged
+    return float(np.nextafter(humans[allowed], np.inf))
+
+def train(components_list, visit_counts, labels, max_false_positive_rate=0.01,
+          iterations=500, learning_rate=0.5, l2=1e-3, validation=0.2, seed=0):
+    """
+    Fit a logistic regression with class-balanced weights by gradient descent
+    A validation share of the rows is held out to pick the threshold and to
+    compare the model with the rules. Returns (model, report).
+    """
+    if np is None:
+        raise RuntimeError("Training the risk model needs numpy")
+    labels = np.asarray(labels, dtype=bool)
+    if labels.all() or not labels.any():
+        raise ValueError("Training needs both bot and human examples")
+
+    matrix = feature_matrix(components_list, visit_counts)
+    order = list(range(len(labels)))
+    random.Random(seed).shuffle(order)
+    held_out = int(len(order) * validation) if len(order) >= 10 else 0
+    test, fit = np.array(order[:held_out], dtype=int), np.array(order[held_out:], dtype=int)
+    if held_out == 0:
+        test = fit
+
+    mean = matrix[fit].mean(axis=0)
+    scale = matrix[fit].std(axis=0)
+    scale[scale == 0] = 1.0
+    x = (matrix[fit] - mean) / scale
+    y = labels[fit].astype(np.float64)
+    # Bots are usually rare; weigh both classes equally
+    sample_weights = np.where(y == 1, 0.5 / y.mean(), 0.5 / (1 - y.mean())) / len(y)
+
+    weights = np.zeros(x.shape[1])
+    intercept = 0.0
+    for _ in range(iterations):
+        error = (1.0 / (1.0 + np.exp(-(x @ weights + intercept))) - y) * sample_weights
+        weights -= learning_rate * (x.T @ error + l2 * weights)
+        intercept -= learning_rate * float(error.sum())
+
+    model = RiskModel(weights, intercept, mean, scale)
+    probabilities = model.probabilities(matrix[test])
+    model.threshold = threshold_for(probabilities, labels[test], max_false_positive_rate)
+    model.metadata = {
+        "trained_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "rows": int(len(fit)),
+        "validation_rows": int(len(test)),
+        "max_false_positive_rate": max_false_positive_rate,
+    }
+
+    rules = [
+        calculate_risk_score(components_list[i], int(visit_counts[i]))[1] for i in test
+    ]
+    report = {
+        "model": classification_report(probabilities >= model.threshold, labels[test]),
+        "rules": classification_report(rules, labels[test]),
+        "threshold": model.threshold,
+    }
+    model.metadata["validation"] = report["model"]
+    return model, report
+
+# App integration
+
+def risk_model():
+    """The loaded RiskModel, or None when scoring uses the rules"""
+    return current_app.extensions.get('risk_model')
+
+def score_fingerprint(components, visit_count, recent_visits=None, explain=False, parsed=None):
+    """
+    (risk_score, is_bot, factors) from the model if one is loaded, else the rules
+    recent_visits only feeds the rules' burst factor (HEAVY_HITTERS_SCORING);
+    parsed is passed to the rules (already parsed component values).
+    """
+    model = risk_model()
+    if model is None:
+        return calculate_risk_score(components, visit_count, recent_visits, parsed)
+    return model.score(components, visit_count, explain=explain)
+
+def init_risk_model(app):
+    """Load RISK_MODEL_PATH, if set, for this app's processes"""
+    model = None
+    path = app.config.get('RISK_MODEL_PATH')
+    if path:
+        if np is None:
+            raise RuntimeError("RISK_MODEL_PATH needs the numpy package")
+        model = RiskModel.load(path)
+    app.extensions['risk_model'] = model
+    return model
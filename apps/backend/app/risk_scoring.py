@@ -1,70 +1,60 @@
 """
 Risk scoring algorithm for fingerprint analysis
 """
+from .components import MISSING_COMPONENTS, parse_components
 
-def calculate_risk_score(components: dict, visit_count: int) -> tuple[float, bool, dict]:
+# Submits of one hash within the heavy hitters window before it counts as a burst
+BURST_VISITS = 5
+
+# Missing component -> (points, factor)
+MISSING_COMPONENT_POINTS = {
+    "webgl": (15, "webgl_missing"),
+    "audio": (10, "audio_missing"),
+    "canvas": (15, "canvas_missing"),
+    "hardware": (10, "hardware_unknown"),
+    "plugins": (5, "no_plugins"),
+    "battery": (5, "battery_missing"),
+    "media": (10, "media_missing"),
+    "fonts": (10, "fonts_missing"),
+}
+# Screen sizes common in headless browsers
+BOT_SCREEN_SIZES = {(800, 600), (1024, 768)}
+
+def calculate_risk_score(components: dict, visit_count: int,
+                         recent_visits: int | None = None,
+                         parsed: dict | None = None) -> tuple[float, bool, dict]:
     """
     Calculate risk score based on fingerprint components
+    parsed holds the typed values of the components (a stored fingerprint's
+    parsed columns); they are parsed here when not given.
+    recent_visits is the hash's submits in the heavy hitters window, when
+    HEAVY_HITTERS_SCORING is on
     Returns: (risk_score, is_bot, factors)
     """
+    if parsed is None:
+        parsed = parse_components(components)
     factors = {}
     score = 0.0
     
-    # Check for automation indicators
-    if components.get("webgl") in ["unsupported", "error"]:
-        score += 15
-        factors["webgl_missing"] = True
-    
-    if components.get("audio") in ["unsupported", "error"]:
-        score += 10
-        factors["audio_missing"] = True
-    
-    if components.get("canvas") in ["unsupported", "error"]:
-        score += 15
-        factors["canvas_missing"] = True
-    
-    # Check for suspicious hardware
-    hardware = components.get("hardware", "")
-    if "unknown" in hardware.lower():
-        score += 10
-        factors["hardware_unknown"] = True
-    
-    # Check for headless browser indicators
-    plugins = components.get("plugins", "")
-    if plugins in ["none", "error", ""]:
-        score += 5
-        factors["no_plugins"] = True
+    # Automation indicators: components headless browsers do not provide
+    missing = parsed["missing_components"]
+    for name, (points, factor) in MISSING_COMPONENT_POINTS.items():
+        if missing & MISSING_COMPONENTS[name][0]:
+            score += points
+            factors[factor] = True
     
     # Check for touch support on desktop
-    touch = components.get("touch", "")
-    if touch.startswith("0_"):
+    if parsed["max_touch_points"] == 0:
         score += 2
         factors["no_touch"] = True
     
     # Check for unusual screen resolution
-    screen = components.get("screen", "")
-    if "800x600" in screen or "1024x768" in screen:
+    if (parsed["screen_width"], parsed["screen_height"]) in BOT_SCREEN_SIZES:
         score += 8
         factors["suspicious_screen"] = True
     
-    # Battery API missing (common in headless)
-    if components.get("battery") in ["unsupported", "error"]:
-        score += 5
-        factors["battery_missing"] = True
-    
-    # Media devices missing
-    if components.get("media") in ["unsupported", "error", ""]:
-        score += 10
-        factors["media_missing"] = True
-    
-    # Font detection issues
-    fonts = components.get("fonts", "")
-    if not fonts or fonts == "unsupported":
-        score += 10
-        factors["fonts_missing"] = True
-    
     # Do Not Track enabled (privacy conscious or bot)
-    dnt = components.get("doNotTrack", "")
+    dnt = components.get("doNotTrack") or ""
     if dnt == "1":
         score += 3
         factors["dnt_enabled"] = True
@@ -74,6 +64,11 @@ def calculate_risk_score(components: dict, visit_count: int) -> tuple[float, boo
         score += min(visit_count, 30)
         factors["rapid_visits"] = visit_count
     
+    # Burst of visits right now, whatever the lifetime count
+    if recent_visits is not None and recent_visits > BURST_VISITS:
+        score += min(2 * recent_visits, 20)
+        factors["burst_visits"] = recent_visits
+    
     # Cap score at 100
     risk_score = min(score, 100.0)
     
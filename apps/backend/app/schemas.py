@@ -23,6 +23,12 @@ class FingerprintRequest(BaseModel):
     hash: str = Field(..., min_length=32, max_length=32)
     components: FingerprintComponents
 
+class FingerprintImportRecord(FingerprintRequest):
+    """One historical fingerprint in a bulk import file"""
+    visit_count: int = Field(1, ge=1)
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+
 class FingerprintResponse(BaseModel):
     hash: str
     risk_score: float
@@ -33,9 +39,42 @@ class FingerprintResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class FingerprintSubmitResponse(FingerprintResponse):
+    credits_used: int = 0
+    credits_remaining: int = 0
+
+class FingerprintLookupResponse(FingerprintResponse):
+    last_seen: Optional[datetime] = None
+
 class RiskScoreResponse(BaseModel):
     hash: str
     risk_score: float
     is_bot: bool
     confidence: float
     factors: dict
+
+class TokenResponse(BaseModel):
+    token: str
+    expires_at: int  # unix time
+    expires_in: int  # seconds
+
+class VisitRecord(BaseModel):
+    seen_at: datetime
+    ip: Optional[str] = None
+    api_key_id: int
+
+class InterarrivalStats(BaseModel):
+    visits: int
+    first: Optional[datetime] = None
+    last: Optional[datetime] = None
+    mean_seconds: Optional[float] = None
+    median_seconds: Optional[float] = None
+    min_seconds: Optional[float] = None
+    max_seconds: Optional[float] = None
+    stdev_seconds: Optional[float] = None
+    coefficient_of_variation: Optional[float] = None
+
+class VisitTimelineResponse(BaseModel):
+    hash: str
+    visits: list[VisitRecord]
+    interarrival: InterarrivalStats
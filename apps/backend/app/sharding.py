@@ -0,0 +1,371 @@
+"""
+Hash-prefix sharding of fingerprints
+FINGERPRINT_SHARDS names extra databases for the fingerprints table. The
+fingerprint_shard_ranges table on the main database splits the hash space at
+start prefixes, each range owned by one shard; anything never assigned stays
+on 'main'. Users, credits and keys always live on the main database. Each
+process caches the range map for FINGERPRINT_SHARD_MAP_TTL seconds, which is
+also how long a move waits for every process to see a change. Without any
+FINGERPRINT_SHARDS none of this runs and fingerprints use db.session.
+"""
+import bisect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from flask import current_app
+from flask.globals import app_ctx
+from sqlalchemy import and_, create_engine, delete, func, literal_column, or_, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from .models import Fingerprint, FingerprintShardRange, db
+
+MAIN_SHARD = 'main'
+# Range states: writes continue while 'moving', are refused while 'frozen'
+MOVING = 'moving'
+FROZEN = 'frozen'
+# A move re-copies rows changed up to this long before its copy started
+CATCH_UP_MARGIN = timedelta(seconds=5)
+
+class ShardUnavailable(Exception):
+    """The hash's range is being moved and cannot take this write right now"""
+
+class ShardMap:
+    """Ranges as sorted (start, shard, state) tuples covering every hash"""
+
+    def __init__(self, ranges):
+        ranges = sorted(ranges)
+        if not ranges or ranges[0][0] != '':
+            ranges.insert(0, ('', MAIN_SHARD, None))
+        self.ranges = ranges
+        self.starts = [start for start, _, _ in ranges]
+
+    def find(self, hash):
+        """(shard, state) of the range holding a hash"""
+        _, shard, state = self.ranges[bisect.bisect_right(self.starts, hash) - 1]
+        return shard, state
+
+    def spans(self):
+        """(start, end, shard, state) per range; end is None for the last one"""
+        ends = self.starts[1:] + [None]
+        return [(start, end, shard, state) for (start, shard, state), end in zip(self.ranges, ends)]
+
+    def owners(self):
+        """{shard: [(start, end), ...]} for every shard that owns a range"""
+        owners = {}
+        for start, end, shard, _ in self.spans():
+            owners.setdefault(shard, []).append((start, end))
+        return owners
+
+def range_clause(spans, dialect):
+    """WHERE clause for hashes in any of the (start, end) spans"""
+    # Byte order on PostgreSQL, to match Python's string comparison in ShardMap
+    column = Fingerprint.hash.collate('C') if dialect == 'postgresql' else Fingerprint.hash
+    parts = []
+    for start, end in spans:
+        bounds = []
+        if start:
+            bounds.append(column >= start)
+        if end is not None:
+            bounds.append(column < end)
+        parts.append(and_(*bounds) if bounds else true())
+    return or_(*parts)
+
+def _estimated_rows(conn, clause):
+    """The planner's row estimate for fingerprints matching clause, or None before the first ANALYZE"""
+    analyzed = conn.exec_driver_sql(
+        "SELECT reltuples >= 0 FROM pg_class "
+        "WHERE relkind = 'r' AND relname = 'fingerprints' AND pg_table_is_visible(oid)"
+    ).scalar()
+    if not analyzed:
+        return None
+    stmt = select(literal_column('1')).select_from(Fingerprint.__table__).where(clause)
+    sql = stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def _app_ctx_id():
+    return id(app_ctx._get_current_object())
+
+class FingerprintShards:
+    """Shard engines, per-app-context shard sessions and the cached range map"""
+
+    def __init__(self, urls, map_ttl=5.0, engine_options=None):
+        self.engines = {
+            name: create_engine(url, **(engine_options or {}))
+            for name, url in urls.items()
+        }
+        self.map_ttl = map_ttl
+        self._sessions = {
+            name: scoped_session(sessionmaker(bind=engine), scopefunc=_app_ctx_id)
+            for name, engine in self.engines.items()
+        }
+        self._map = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def sharded(self):
+        return bool(self.engines)
+
+    def engine(self, name):
+        if name == MAIN_SHARD:
+            return db.engine
+        if name not in self.engines:
+            raise ValueError(f"Unknown fingerprint shard: {name}")
+        return self.engines[name]
+
+    def session(self, name):
+        """db.session for 'main', else the app context's session on that shard"""
+        if name == MAIN_SHARD:
+            return db.session
+        self.engine(name)
+        return self._sessions[name]()
+
+    def map(self, refresh=False):
+        """The range map, reloaded from the main database every map_ttl seconds"""
+        if not self.sharded:
+            return ShardMap([])
+        now = time.monotonic()
+        with self._lock:
+            if refresh or self._map is None or now - self._loaded_at >= self.map_ttl:
+                # Own connection: always the primary, outside the request's transaction
+                with db.engine.connect() as conn:
+                    rows = conn.execute(select(
+                        FingerprintShardRange.start,
+                        FingerprintShardRange.shard,
+                        FingerprintShardRange.state
+                    )).all()
+                self._map = ShardMap([tuple(row) for row in rows])
+                self._loaded_at = now
+            return self._map
+
+    def route(self, hash, write=False):
+        """Session for the shard holding a hash; frozen ranges refuse writes"""
+        if not self.sharded:
+            return db.session
+        shard, state = self.map().find(hash)
+        if write and state == FROZEN:
+            raise ShardUnavailable(hash)
+        return self.session(shard)
+
+    def group_rows(self, rows):
+        """{shard: rows} for bulk writes; refuses ranges that are being moved"""
+        if not self.sharded:
+            return {MAIN_SHARD: rows}
+        shard_map = self.map()
+        groups = {}
+        for row in rows:
+            shard, state = shard_map.find(row['hash'])
+            if state is not None:
+                raise ShardUnavailable(row['hash'])
+            groups.setdefault(shard, []).append(row)
+        return groups
+
+    def scatter(self, fn):
+        """{shard: fn(engine, clause)} over the owning shards, run in parallel"""
+        owners = self.map().owners()
+        jobs = []
+        for name, spans in owners.items():
+            engine = self.engine(name)
+            jobs.append((name, engine, range_clause(spans, engine.dialect.name)))
+        if len(jobs) == 1:
+            name, engine, clause = jobs[0]
+            return {name: fn(engine, clause)}
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [(name, pool.submit(fn, engine, clause)) for name, engine, clause in jobs]
+            return {name: future.result() for name, future in futures}
+
+    def count(self, estimate=False):
+        """
+        Fingerprints across all shards (planner estimates on PostgreSQL if asked)
+        Each shard counts only its own ranges, so rows copied by a move in
+        progress are not counted twice, estimated or not.
+        """
+        def count_rows(engine, clause):
+            with engine.connect() as conn:
+                if estimate and engine.dialect.name == 'postgresql':
+                    rows = _estimated_rows(conn, clause)
+                    if rows is not None:
+                        return rows
+                return conn.execute(
+                    select(func.count()).select_from(Fingerprint).where(clause)
+                ).scalar()
+        return sum(self.scatter(count_rows).values())
+
+    def stream(self, stmt, batch_size):
+        """Row batches of a fingerprint SELECT, one shard after another"""
+        for name, spans in self.map().owners().items():
+            engine = self.engine(name)
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                    stmt.where(range_clause(spans, engine.dialect.name))
+                )
+                yield from result.partitions()
+
+    def create_tables(self):
+        """Create the fingerprints table on every shard"""
+        for engine in self.engines.values():
+            Fingerprint.__table__.create(engine, checkfirst=True)
+
+    def remove(self, exc=None):
+        for registry in self._sessions.values():
+            registry.remove()
+
+    def dispose(self):
+        for engine in self.engines.values():
+            engine.dispose(close=False)
+
+def fingerprint_session(hash, write=False):
+    """Session to read (or write) the fingerprint with this hash"""
+    return current_app.extensions['fingerprint_shards'].route(hash, write=write)
+
+def _upsert(engine):
+    """INSERT ... ON CONFLICT (hash) DO UPDATE overwriting every column but id"""
+    table = Fingerprint.__table__
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(table)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table)
+    else:
+        raise ValueError(f"Moving fingerprints is not supported on {dialect}")
+    return stmt.on_conflict_do_update(
+        index_elements=['hash'],
+        set_={column.name: stmt.excluded[column.name]
+              for column in table.columns if column.name not in ('id', 'hash')}
+    )
+
+def _copy_rows(source, target, where, batch_size):
+    """Upsert matching rows from source into target in id order; returns the count"""
+    table = Fingerprint.__table__
+    columns = [column for column in table.columns if column.name != 'id']
+    upsert = _upsert(target)
+    last_id = 0
+    copied = 0
+    while True:
+        # A short read per batch, so writers on the source are never held up
+        with source.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, *columns)
+                .where(where, table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+        if not rows:
+            return copied
+        with target.begin() as conn:
+            conn.execute(upsert, [
+                {column.name: row._mapping[column.name] for column in columns} for row in rows
+            ])
+        known = current_app.extensions.get('known_hashes')
+        if known is not None:
+            known.add_many([row.hash for row in rows])
+        last_id = rows[-1].id
+        copied += len(rows)
+
+def _delete_rows(engine, where, batch_size):
+    table = Fingerprint.__table__
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(select(table.c.id).where(where).limit(batch_size)).scalars().all()
+            if not ids:
+                return deleted
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+        deleted += len(ids)
+
+def _set_range(start, **values):
+    row = db.session.get(FingerprintShardRange, start)
+    for key, value in values.items():
+        setattr(row, key, value)
+    db.session.commit()
+
+def _split(shards, at):
+    """Make sure a range starts exactly at `at` (and that '' is stored)"""
+    shard_map = shards.map(refresh=True)
+    if db.session.get(FingerprintShardRange, '') is None:
+        db.session.add(FingerprintShardRange(start='', shard=MAIN_SHARD))
+    if at not in shard_map.starts:
+        shard, state = shard_map.find(at)
+        db.session.add(FingerprintShardRange(start=at, shard=shard, state=state))
+    db.session.commit()
+
+def _merge_ranges():
+    """Drop range boundaries between neighbours with the same shard and state"""
+    previous = None
+    for row in db.session.scalars(select(FingerprintShardRange).order_by(FingerprintShardRange.start)):
+        if previous is not None and (row.shard, row.state) == (previous.shard, previous.state):
+            db.session.delete(row)
+        else:
+            previous = row
+    db.session.commit()
+
+def move_range(start, end, target, batch_size=1000, keep_source=False, settle=None, echo=print):
+    """
+    Move fingerprints with start <= hash < end (end None: to the last hash) to `target`
+    For each range in the way owned by another shard: mark it moving and copy
+    its rows while writes carry on at the source; freeze it, wait for every
+    process to notice, and copy the rows changed since the copy started; then
+    point it at the target and, once every process has switched, delete the
+    source rows. Writes are refused only while a range is frozen. Returns the
+    number of rows copied.
+    """
+    shards = current_app.extensions['fingerprint_shards']
+    if not shards.sharded:
+        raise ValueError("No FINGERPRINT_SHARDS are configured")
+    if end is not None and end <= start:
+        raise ValueError("end must sort after start")
+    target_engine = shards.engine(target)
+    settle = shards.map_ttl + 1 if settle is None else settle
+
+    _split(shards, start)
+    if end is not None:
+        _split(shards, end)
+
+    copied = 0
+    for span_start, span_end, source, _ in shards.map(refresh=True).spans():
+        if span_start < start or (end is not None and (span_end is None or span_end > end)):
+            continue
+        if source == target:
+            continue
+        source_engine = shards.engine(source)
+        where = range_clause([(span_start, span_end)], source_engine.dialect.name)
+        label = f"[{span_start!r}, {span_end!r}) {source} -> {target}"
+
+        with source_engine.connect() as conn:
+            since = conn.execute(select(func.now())).scalar() - CATCH_UP_MARGIN
+        _set_range(span_start, state=MOVING)
+        # Bulk imports into the range stop once every process sees it moving
+        time.sleep(settle)
+        rows = _copy_rows(source_engine, target_engine, where, batch_size)
+        echo(f"{label}: copied {rows} rows")
+
+        _set_range(span_start, state=FROZEN)
+        time.sleep(settle)
+        changed = func.coalesce(Fingerprint.last_seen, Fingerprint.first_seen) >= since
+        caught_up = _copy_rows(source_engine, target_engine, and_(where, changed), batch_size)
+        _set_range(span_start, shard=target, state=None)
+        echo(f"{label}: caught up {caught_up} rows, range switched")
+        copied += rows
+
+        if not keep_source:
+            time.sleep(settle)
+            echo(f"{label}: deleted {_delete_rows(source_engine, where, batch_size)} source rows")
+
+    _merge_ranges()
+    shards.map(refresh=True)
+    return copied
+
+def init_sharding(app):
+    """Create the app's fingerprint shards from FINGERPRINT_SHARDS"""
+    shards = FingerprintShards(
+        app.config.get('FINGERPRINT_SHARDS') or {},
+        map_ttl=app.config.get('FINGERPRINT_SHARD_MAP_TTL', 5.0),
+        engine_options=app.config.get('SQLALCHEMY_ENGINE_OPTIONS')
+    )
+    app.extensions['fingerprint_shards'] = shards
+    app.teardown_appcontext(shards.remove)
+    return shards
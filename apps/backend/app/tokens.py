@@ -0,0 +1,269 @@
+"""
+Signed API tokens
+POST /api/token exchanges an API key for a token carrying the user id, key id,
+plan and the key's limit overrides, signed with HMAC-SHA256 and valid for
+API_TOKEN_TTL seconds. Clients send it in X-API-Key like a key, and
+require_api_key verifies it in memory: no query for the key or the user and no
+last_used write (last_used is updated when a token is minted). Opaque keys keep
+working as before. Plan and limit changes reach a client with its next token.
+
+Disabling or deleting a key, or deactivating a user, writes a token_revocations
+row (the ORM events below; turning it back on deletes the row). A background
+thread in each process reloads the rows younger than a token's lifetime every
+API_TOKEN_REVOCATION_SYNC_INTERVAL seconds and tokens of the listed keys and
+users are refused, so a revocation reaches every process within one interval.
+While the list is older than API_TOKEN_REVOCATION_MAX_AGE (before the first
+pass, or while the database is unavailable to the thread), each token is
+checked against the database instead, so that age bounds the window.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, insert, inspect, select
+
+from .models import APIKey, TokenRevocation, User, db
+
+API_TOKEN_MODES = ('on', 'off')
+TOKEN_PREFIX = 'sft1.'
+# Revocations are kept this many seconds past a token's lifetime, for clock skew between hosts
+REVOCATION_MARGIN = 60
+
+class TokenError(Exception):
+    """A malformed, forged, expired or revoked token"""
+
+def is_token(value):
+    """Signed token rather than an opaque key (keys are URL-safe base64, without dots)"""
+    return value.startswith(TOKEN_PREFIX)
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+class TokenUser:
+    """A token's user, in place of User on request.current_user"""
+    __slots__ = ('id', 'plan_name', 'is_active')
+
+    def __init__(self, id, plan_name):
+        self.id = id
+        self.plan_name = plan_name
+        self.is_active = True
+
+class TokenKey:
+    """A token's API key, in place of APIKey on request.api_key"""
+    __slots__ = ('id', 'user_id', 'rate_limit', 'max_concurrent', 'expires')
+
+    def __init__(self, id, user_id, rate_limit, max_concurrent, expires):
+        self.id = id
+        self.user_id = user_id
+        self.rate_limit = rate_limit
+        self.max_concurrent = max_concurrent
+        self.expires = expires
+
+class APITokens:
+    """Mints and verifies signed tokens, and keeps this process's revocation list"""
+
+    def __init__(self, app, secret, ttl=900, sync_interval=5.0, max_age=30.0):
+        self.app = app
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+        self._secret = secret
+        self._revoked = frozenset()
+        self._synced_at = None
+        self.minted = 0
+        self.verified = 0
+        self.rejected = 0
+        self.database_checks = 0
+        self.errors = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def _sign(self, body):
+        return _b64encode(hmac.new(self._secret, body.encode('utf-8'), hashlib.sha256).digest())
+
+    def mint(self, api_key, user, now=None):
+        """(token, expiry as unix time) for an active key and its user"""
+        now = int(time.time() if now is None else now)
+        expires = now + self.ttl
+        claims = {
+            'u': user.id,
+            'k': api_key.id,
+            'p': user.plan_name,
+            'r': api_key.rate_limit,
+            'c': api_key.max_concurrent,
+            'iat': now,
+            'exp': expires,
+        }
+        body = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        self.minted += 1
+        return f"{TOKEN_PREFIX}{body}.{self._sign(body)}", expires
+
+    def verify(self, token, now=None):
+        """(TokenUser, TokenKey) for a valid token; raises TokenError"""
+        self.start()
+        try:
+            principal = self._check(token, now)
+        except TokenError:
+            self.rejected += 1
+            raise
+        self.verified += 1
+        return principal
+
+    def _check(self, token, now):
+        body, _, signature = token[len(TOKEN_PREFIX):].partition('.')
+        if not hmac.compare_digest(signature.encode('utf-8'), self._sign(body).encode('ascii')):
+            raise TokenError("Invalid API token")
+        claims = json.loads(_b64decode(body))
+        if claims['exp'] <= (time.time() if now is None else now):
+            raise TokenError("API token expired")
+
+        user_id, key_id = claims['u'], claims['k']
+        if self.fresh():
+            if ('key', key_id) in self._revoked or ('user', user_id) in self._revoked:
+                raise TokenError("API token revoked")
+        elif not self._active_in_database(user_id, key_id):
+            raise TokenError("API token revoked")
+        return (
+            TokenUser(user_id, claims['p']),
+            TokenKey(key_id, user_id, claims['r'], claims['c'], claims['exp'])
+        )
+
+    def _active_in_database(self, user_id, key_id):
+        self.database_checks += 1
+        return db.session.execute(
+            select(APIKey.id)
+            .join(User, User.id == APIKey.user_id)
+            .where(APIKey.id == key_id, APIKey.is_active.is_(True), User.is_active.is_(True))
+        ).first() is not None
+
+    # Revocation list
+
+    def fresh(self):
+        """Whether the revocation list is recent enough to trust"""
+        return self._synced_at is not None and time.monotonic() - self._synced_at <= self.max_age
+
+    def revoke(self, subject, subject_id):
+        """Refuse a key's or user's tokens in this process right away (others follow on sync)"""
+        with self._lock:
+            self._revoked = self._revoked | {(subject, subject_id)}
+
+    def sync(self):
+        """Reload the revocations that can still match an unexpired token; returns how many"""
+        started = time.monotonic()
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.ttl + REVOCATION_MARGIN)
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(TokenRevocation.subject, TokenRevocation.subject_id)
+                .where(TokenRevocation.revoked_at >= since)
+            ).all()
+        with self._lock:
+            self._revoked = frozenset((subject, subject_id) for subject, subject_id in rows)
+            self._synced_at = started
+        return len(rows)
+
+    # Background thread, started lazily so each forked server process runs its own
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self.run, name='token-revocations', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        while not self._stopping:
+            try:
+                with self.app.app_context():
+                    self.sync()
+            except Exception as e:
+                self.errors += 1
+                self.app.logger.error(f"Token revocation sync error: {e}")
+            self._wake.wait(self.sync_interval)
+
+    def stats(self):
+        """Configuration and counters for the metrics endpoint"""
+        return {
+            'mode': 'on',
+            'ttl': self.ttl,
+            'sync_interval': self.sync_interval,
+            'max_age': self.max_age,
+            'fresh': self.fresh(),
+            'revocations': len(self._revoked),
+            'minted': self.minted,
+            'verified': self.verified,
+            'rejected': self.rejected,
+            'database_checks': self.database_checks,
+            'errors': self.errors,
+        }
+
+def api_tokens():
+    """The app's APITokens, or None when API_TOKENS is off"""
+    return current_app.extensions.get('api_tokens')
+
+# Revocations, written in the flush that disables a key or user
+
+SUBJECTS = {APIKey: 'key', User: 'user'}
+
+def _set_revoked(connection, subject, subject_id, revoked):
+    table = TokenRevocation.__table__
+    connection.execute(
+        delete(table).where(table.c.subject == subject, table.c.subject_id == subject_id)
+    )
+    if not revoked:
+        return
+    connection.execute(insert(table).values(
+        subject=subject, subject_id=subject_id, revoked_at=datetime.now(timezone.utc)
+    ))
+    tokens = current_app.extensions.get('api_tokens') if has_app_context() else None
+    if tokens is not None:
+        tokens.revoke(subject, subject_id)
+
+@event.listens_for(APIKey, 'after_update')
+@event.listens_for(User, 'after_update')
+def _active_changed(mapper, connection, target):
+    if inspect(target).attrs.is_active.history.has_changes():
+        _set_revoked(connection, SUBJECTS[mapper.class_], target.id, not target.is_active)
+
+@event.listens_for(APIKey, 'after_delete')
+@event.listens_for(User, 'after_delete')
+def _deleted(mapper, connection, target):
+    _set_revoked(connection, SUBJECTS[mapper.class_], target.id, True)
+
+def init_api_tokens(app):
+    """Create the app's token signer from the API_TOKEN_* settings"""
+    mode = app.config.get('API_TOKENS', 'on')
+    if mode not in API_TOKEN_MODES:
+        raise ValueError(f"API_TOKENS must be one of {', '.join(API_TOKEN_MODES)}")
+    tokens = None
+    if mode == 'on':
+        secret = app.config.get('API_TOKEN_SECRET') or app.config['SECRET_KEY']
+        # Derived, so tokens and session cookies never share a signing key
+        key = hmac.new(secret.encode('utf-8'), b'sixfinger-api-tokens', hashlib.sha256).digest()
+        tokens = APITokens(
+            app,
+            key,
+            ttl=app.config.get('API_TOKEN_TTL', 900),
+            sync_interval=app.config.get('API_TOKEN_REVOCATION_SYNC_INTERVAL', 5.0),
+            max_age=app.config.get('API_TOKEN_REVOCATION_MAX_AGE', 30.0)
+        )
+    app.extensions['api_tokens'] = tokens
+    return tokens
@@ -0,0 +1,204 @@
+"""Materialized per-user usage counters and time-bucketed rollups"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import APIKey, DailyUsage, UsageCounter, UsageRollup, db
+
+def _upsert_increment(model, keys, increments):
+    """
+    Atomically add `increments` to the row identified by `keys`, creating it if missing
+    Uses INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite
+    """
+    table = model.__table__
+    dialect = db.session.get_bind(mapper=model).dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + value for name, value in increments.items()}
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback: update in place, insert on first use
+    result = db.session.execute(
+        update(table)
+        .where(*[table.c[name] == value for name, value in keys.items()])
+        .values({name: table.c[name] + value for name, value in increments.items()})
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(**keys, **increments))
+
+# Usage page ranges: (span, bucket resolution)
+USAGE_RANGES = {
+    '1h': (timedelta(hours=1), 'minute'),
+    '24h': (timedelta(days=1), 'hour'),
+    '7d': (timedelta(days=7), 'day'),
+    '30d': (timedelta(days=30), 'day'),
+    '90d': (timedelta(days=90), 'day'),
+}
+
+def minute_bucket(when):
+    """Truncate a datetime to its minute bucket"""
+    return when.replace(second=0, microsecond=0)
+
+def record_usage(user_id, cost, api_key_id=None, endpoint=None, when=None):
+    """Count one API call against the user's rollups and counters; runs inside the debit transaction"""
+    when = when or datetime.utcnow()
+    _upsert_increment(
+        UsageRollup,
+        {
+            'user_id': user_id,
+            'api_key_id': api_key_id or 0,
+            'endpoint': endpoint or '',
+            'bucket': minute_bucket(when)
+        },
+        {'calls': 1, 'credits_used': cost}
+    )
+    _upsert_increment(UsageCounter, {'user_id': user_id}, {'api_calls': 1})
+    _upsert_increment(
+        DailyUsage,
+        {'user_id': user_id, 'day': when.date()},
+        {'api_calls': 1, 'credits_used': cost}
+    )
+
+def refund_usage(user_id, cost, api_key_id=None, endpoint=None, when=None):
+    """Take back the credits of a call counted by record_usage; the call itself stays counted"""
+    when = when or datetime.utcnow()
+    _upsert_increment(
+        UsageRollup,
+        {
+            'user_id': user_id,
+            'api_key_id': api_key_id or 0,
+            'endpoint': endpoint or '',
+            'bucket': minute_bucket(when)
+        },
+        {'credits_used': -cost}
+    )
+    _upsert_increment(DailyUsage, {'user_id': user_id, 'day': when.date()}, {'credits_used': -cost})
+
+def adjust_active_keys(user_id, delta):
+    """Add `delta` to the user's active API key count"""
+    if delta:
+        _upsert_increment(UsageCounter, {'user_id': user_id}, {'active_keys': delta})
+
+def refresh_active_keys(user_id):
+    """Recount the user's active API keys (for edits where the delta is unknown)"""
+    count = APIKey.query.filter_by(user_id=user_id, is_active=True).count()
+    counter = db.session.get(UsageCounter, user_id)
+    if counter:
+        counter.active_keys = count
+    else:
+        db.session.add(UsageCounter(user_id=user_id, api_calls=0, active_keys=count))
+
+def get_usage_stats(user_id):
+    """Return the user's usage counters as a dict (zeros if none recorded yet)"""
+    counter = db.session.get(UsageCounter, user_id)
+    return {
+        "api_calls": counter.api_calls if counter else 0,
+        "active_keys": counter.active_keys if counter else 0
+    }
+
+class UsagePoint:
+    """One bucket of a usage series"""
+    __slots__ = ('date', 'api_calls', 'credits_used')
+    
+    def __init__(self, date, api_calls, credits_used):
+        self.date = date
+        self.api_calls = api_calls
+        self.credits_used = credits_used
+
+def get_usage_series(user_id, start, end=None, resolution='minute'):
+    """
+    Usage totals per bucket in [start, end), oldest first
+    'minute' and 'hour' read the minute rollups, 'day' reads the daily counters.
+    Returns rows with `date`, `api_calls` and `credits_used` attributes.
+    """
+    end = end or datetime.utcnow()
+    
+    if resolution == 'day':
+        return db.session.query(
+            DailyUsage.day.label('date'),
+            DailyUsage.api_calls.label('api_calls'),
+            DailyUsage.credits_used.label('credits_used')
+        ).filter(
+            DailyUsage.user_id == user_id,
+            DailyUsage.day >= start.date(),
+            DailyUsage.day <= end.date()
+        ).order_by(DailyUsage.day).all()
+    
+    rows = db.session.query(
+        UsageRollup.bucket.label('date'),
+        func.sum(UsageRollup.calls).label('api_calls'),
+        func.sum(UsageRollup.credits_used).label('credits_used')
+    ).filter(
+        UsageRollup.user_id == user_id,
+        UsageRollup.bucket >= minute_bucket(start),
+        UsageRollup.bucket < end
+    ).group_by(UsageRollup.bucket).order_by(UsageRollup.bucket).all()
+    
+    if resolution == 'minute':
+        return rows
+    
+    # Fold minute buckets into hours
+    hours = {}
+    for row in rows:
+        hour = row.date.replace(minute=0)
+        calls, credits_used = hours.get(hour, (0, 0))
+        hours[hour] = (calls + row.api_calls, credits_used + row.credits_used)
+    return [
+        UsagePoint(hour, calls, credits_used)
+        for hour, (calls, credits_used) in sorted(hours.items())
+    ]
+
+def rebuild_usage_counters(user_id=None):
+    """
+    Rebuild counters from the usage rollups and API keys table
+    Rebuilds every user when user_id is None; returns the number of counter rows written
+    """
+    def scoped(query, column):
+        return query.filter(column == user_id) if user_id is not None else query
+
+    scoped(DailyUsage.query, DailyUsage.user_id).delete(synchronize_session=False)
+    scoped(UsageCounter.query, UsageCounter.user_id).delete(synchronize_session=False)
+
+    day = func.date(UsageRollup.bucket)
+    daily = scoped(db.session.query(
+        UsageRollup.user_id,
+        day,
+        func.sum(UsageRollup.calls),
+        func.sum(UsageRollup.credits_used)
+    ), UsageRollup.user_id).group_by(UsageRollup.user_id, day)
+
+    counters = {}
+    for row_user_id, row_day, calls, credits_used in daily:
+        if isinstance(row_day, str):
+            # SQLite returns date() as text
+            row_day = datetime.strptime(row_day, '%Y-%m-%d').date()
+        db.session.add(DailyUsage(
+            user_id=row_user_id,
+            day=row_day,
+            api_calls=calls,
+            credits_used=credits_used or 0
+        ))
+        counters.setdefault(row_user_id, {'api_calls': 0, 'active_keys': 0})
+        counters[row_user_id]['api_calls'] += calls
+
+    active_keys = scoped(db.session.query(
+        APIKey.user_id,
+        func.count(APIKey.id)
+    ).filter_by(is_active=True), APIKey.user_id).group_by(APIKey.user_id)
+
+    for row_user_id, count in active_keys:
+        counters.setdefault(row_user_id, {'api_calls': 0, 'active_keys': 0})
+        counters[row_user_id]['active_keys'] = count
+
+    for row_user_id, values in counters.items():
+        db.session.add(UsageCounter(user_id=row_user_id, **values))
+
+    db.session.commit()
+    return len(counters)
@@ -0,0 +1,102 @@
+"""
+Per-process cache of session users for Flask-Login's user loader
+Users are cached with their credits row for USER_CACHE_TTL seconds as plain
+column snapshots. A hit is rebuilt and merged into the request's session
+without a query, so current_user behaves like a loaded instance (changes to
+it are saved on commit). ORM updates and deletes of users or credits drop
+the entry in the process that made them; other processes see the change
+once their entry expires.
+"""
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import Credit, User, db
+
+def _columns(model):
+    return [attr.key for attr in model.__mapper__.column_attrs]
+
+def _snapshot(instance):
+    return {key: getattr(instance, key) for key in _columns(type(instance))}
+
+def _detached(model, values):
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return instance
+
+class UserCache:
+    """TTL cache of user_id -> (user columns, credit columns or None)"""
+
+    def __init__(self, ttl=10.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        """User with credits loaded, attached to the current session; None if missing"""
+        entry = self._get(user_id)
+        if entry is not None:
+            user_values, credit_values = entry
+            user = _detached(User, user_values)
+            credit = _detached(Credit, credit_values) if credit_values else None
+            set_committed_value(user, 'credits', credit)
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(User, user_id, options=[joinedload(User.credits)])
+        if user is not None and self.ttl > 0:
+            credit_values = _snapshot(user.credits) if user.credits else None
+            self._put(user_id, (_snapshot(user), credit_values))
+        return user
+
+    def invalidate(self, user_id=None):
+        """Drop one user, or everyone when user_id is None"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def _get(self, user_id):
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry
+
+    def _put(self, user_id, entry):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # Oldest insertion first
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[user_id] = (time.monotonic() + self.ttl, entry)
+
+def _invalidate(user_id):
+    if has_app_context():
+        cache = current_app.extensions.get('user_cache')
+        if cache is not None:
+            cache.invalidate(user_id)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    _invalidate(target.id)
+
+@event.listens_for(Credit, 'after_update')
+@event.listens_for(Credit, 'after_delete')
+def _credit_changed(mapper, connection, target):
+    _invalidate(target.user_id)
+
+def init_user_cache(app):
+    """Create the app's user cache (USER_CACHE_TTL = 0 disables it)"""
+    cache = UserCache(ttl=app.config.get('USER_CACHE_TTL', 10.0))
+    app.extensions['user_cache'] = cache
+    return cache
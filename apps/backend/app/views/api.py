@@ -1,11 +1,49 @@
 """API endpoints for fingerprint analysis"""
 from flask import Blueprint, request, jsonify, current_app
-from ..models import Fingerprint, db
-from ..risk_scoring import calculate_risk_score
-from ..auth import require_api_key, require_credits
-from ..schemas import FingerprintRequest, FingerprintResponse, RiskScoreResponse
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.orm import undefer_group
+from ..components import parse_components
+from ..models import APIKey, Fingerprint, db
+from ..risk_model import score_fingerprint
+from ..auth import refund_credits, require_api_key, require_credits
+from ..bloom import known_hashes
+from ..coalesce import submit_coalescer
+from ..heavy_hitters import heavy_hitters
+from ..ratelimit import get_remote_address
+from ..replicas import reading_from_replica, replica_reads, use_primary
+from ..sharding import ShardUnavailable, fingerprint_session
+from ..tokens import TokenKey, api_tokens
+from ..visits import interarrival_stats, recent_visits, unpack_ip, visit_log
+from ..wire import WireFormatError, binary_response, match_request_format, parse_request
+from ..schemas import (
+    FingerprintRequest,
+    FingerprintSubmitResponse,
+    FingerprintLookupResponse,
+    RiskScoreResponse,
+    TokenResponse,
+    VisitRecord,
+    VisitTimelineResponse,
+)
 
 api_bp = Blueprint('api_blueprint', __name__)
+# Answer MessagePack/CBOR requests in kind (app.wire)
+api_bp.after_request(match_request_format)
+
+def model_response(model, status=200):
+    """Serialize a pydantic model straight to a response in the request's format"""
+    return binary_response(model, status) or current_app.response_class(
+        model.model_dump_json(),
+        status=status,
+        mimetype='application/json'
+    )
+
+def validation_error_response(error):
+    """Structured 422 response for a failed schema validation"""
+    return jsonify({
+        "error": "Validation failed",
+        "details": error.errors(include_url=False, include_context=False, include_input=False)
+    }), 422
 
 @api_bp.route('/fingerprint', methods=['POST'])
 @require_api_key
@@ -15,80 +53,150 @@ def submit_fingerprint():
     Submit a fingerprint for analysis
     Requires API key and deducts 1 credit
     """
+    # Parse and validate the raw body in a single pass (JSON, MessagePack or CBOR)
     try:
-        data = request.get_json()
-        
-        # Validate request
-        if not data or 'hash' not in data or 'components' not in data:
-            return jsonify({"error": "Invalid request format"}), 400
-        
-        fingerprint_hash = data['hash']
-        components = data['components']
-        
-        # Validate hash length
-        if len(fingerprint_hash) != 32:
-            return jsonify({"error": "Hash must be 32 characters"}), 400
-        
+        payload = parse_request(FingerprintRequest)
+    except WireFormatError as e:
+        # Rejected bodies are not billed
+        refund_credits()
+        return jsonify({"error": str(e)}), e.status
+    except ValidationError as e:
+        refund_credits()
+        return validation_error_response(e)
+    
+    fingerprint_hash = payload.hash
+    components = payload.components
+    window_visits = None
+    tracker = heavy_hitters()
+    if tracker is not None:
+        counts = tracker.record(
+            hash=fingerprint_hash,
+            api_key=str(request.api_key.id),
+            ip=get_remote_address()
+        )
+        if current_app.config.get('HEAVY_HITTERS_SCORING'):
+            window_visits = counts['hash']
+    try:
+        session = fingerprint_session(fingerprint_hash, write=True)
+    except ShardUnavailable:
+        # Nothing was stored: the retry pays instead
+        refund_credits()
+        response = jsonify({"error": "Fingerprint storage is being rebalanced, retry shortly"})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    components_dict = components.model_dump()
+    parsed = parse_components(components_dict)
+    
+    def write(count):
+        """Store `count` submits of this hash in one transaction"""
         # Check if fingerprint exists
-        fp = Fingerprint.query.filter_by(hash=fingerprint_hash).first()
+        fp = session.scalars(select(Fingerprint).filter_by(hash=fingerprint_hash)).first()
         
         if fp:
             # Update existing fingerprint
-            fp.visit_count += 1
-            
-            # Recalculate risk score
-            risk_score, is_bot, _ = calculate_risk_score(components, fp.visit_count)
-            fp.risk_score = risk_score
-            fp.is_bot = is_bot
+            fp.visit_count += count
+            if fp.missing_components is None:
+                fp.set_parsed_components(parsed)
         else:
             # Create new fingerprint
-            risk_score, is_bot, _ = calculate_risk_score(components, 1)
-            
             fp = Fingerprint(
                 hash=fingerprint_hash,
-                risk_score=risk_score,
-                is_bot=is_bot,
-                visit_count=1,
-                canvas=components.get("canvas"),
-                webgl=components.get("webgl"),
-                audio=components.get("audio"),
-                fonts=components.get("fonts"),
-                hardware=components.get("hardware"),
-                screen=components.get("screen"),
-                browser=components.get("browser"),
-                timezone=components.get("timezone"),
-                plugins=components.get("plugins"),
-                touch=components.get("touch"),
-                battery=components.get("battery"),
-                network=components.get("network"),
-                media=components.get("media"),
-                color_depth=components.get("colorDepth"),
-                do_not_track=components.get("doNotTrack")
+                visit_count=count,
+                canvas=components.canvas,
+                webgl=components.webgl,
+                audio=components.audio,
+                fonts=components.fonts,
+                hardware=components.hardware,
+                screen=components.screen,
+                browser=components.browser,
+                timezone=components.timezone,
+                plugins=components.plugins,
+                touch=components.touch,
+                battery=components.battery,
+                network=components.network,
+                media=components.media,
+                color_depth=components.colorDepth,
+                do_not_track=components.doNotTrack,
+                **parsed
             )
-            db.session.add(fp)
+            session.add(fp)
         
-        db.session.commit()
+        # Score at the new visit count
+        fp.risk_score, fp.is_bot, _ = score_fingerprint(
+            components_dict, fp.visit_count, window_visits, parsed=parsed
+        )
+        session.commit()
+        return fp.visit_count, fp.first_seen, fp.risk_score, fp.is_bot
+    
+    try:
+        # Concurrent submits of this hash share one write (app.coalesce)
+        coalescer = submit_coalescer()
+        if coalescer is not None:
+            stored, count, position = coalescer.submit(fingerprint_hash, write)
+        else:
+            stored, count, position = write(1), 1, 1
+        total, first_seen, risk_score, is_bot = stored
+        
+        # This submit's own visit, as if the batch had been written one by one
+        visit_count = total - count + position
+        if visit_count != total:
+            risk_score, is_bot, _ = score_fingerprint(
+                components_dict, visit_count, window_visits, parsed=parsed
+            )
         
-        # Return response with default values if decorator fails
-        response = {
-            "hash": fp.hash,
-            "risk_score": fp.risk_score,
-            "is_bot": fp.is_bot,
-            "visit_count": fp.visit_count,
-            "first_seen": fp.first_seen.isoformat() if fp.first_seen else None,
-            "credits_used": getattr(request, 'credits_used', 0),
-            "credits_remaining": getattr(request, 'credits_remaining', 0)
-        }
+        known = known_hashes()
+        if known is not None:
+            known.add(fingerprint_hash)
         
-        return jsonify(response), 200
+        log = visit_log()
+        if log is not None:
+            log.record(fingerprint_hash, request.api_key.id, get_remote_address())
+        
+        response = FingerprintSubmitResponse(
+            hash=fingerprint_hash,
+            risk_score=risk_score,
+            is_bot=is_bot,
+            visit_count=visit_count,
+            first_seen=first_seen,
+            credits_used=getattr(request, 'credits_used', 0),
+            credits_remaining=getattr(request, 'credits_remaining', 0)
+        )
+        
+        return model_response(response)
         
     except Exception as e:
         current_app.logger.error(f"Error processing fingerprint: {e}")
-        db.session.rollback()
+        session.rollback()
         return jsonify({"error": "Internal server error"}), 500
 
+def find_fingerprint(hash, components=False):
+    """
+    Fingerprint by hash, or None
+    Hashes the filter has never seen are answered without a query; a replica
+    miss is retried on the primary (it may be new). The compressed component
+    columns are loaded in the same query only if `components` is set.
+    """
+    known = known_hashes()
+    verdict = known.check(hash) if known is not None else None
+    if verdict is False:
+        return None
+    
+    session = fingerprint_session(hash)
+    stmt = select(Fingerprint).filter_by(hash=hash)
+    if components:
+        stmt = stmt.options(undefer_group("compressed_components"))
+    fp = session.scalars(stmt).first()
+    if fp is None and session is db.session and reading_from_replica():
+        with use_primary():
+            fp = session.scalars(stmt).first()
+    if fp is None and verdict:
+        known.record_false_positive()
+    return fp
+
 @api_bp.route('/fingerprint/<hash>', methods=['GET'])
 @require_api_key
+@replica_reads
 def get_fingerprint(hash):
     """
     Get fingerprint information by hash
@@ -97,24 +205,16 @@ def get_fingerprint(hash):
     if len(hash) != 32:
         return jsonify({"error": "Hash must be 32 characters"}), 400
     
-    fp = Fingerprint.query.filter_by(hash=hash).first()
+    fp = find_fingerprint(hash)
     
     if not fp:
         return jsonify({"error": "Fingerprint not found"}), 404
     
-    response = {
-        "hash": fp.hash,
-        "risk_score": fp.risk_score,
-        "is_bot": fp.is_bot,
-        "visit_count": fp.visit_count,
-        "first_seen": fp.first_seen.isoformat() if fp.first_seen else None,
-        "last_seen": fp.last_seen.isoformat() if fp.last_seen else None
-    }
-    
-    return jsonify(response), 200
+    return model_response(FingerprintLookupResponse.model_validate(fp))
 
 @api_bp.route('/risk-score/<hash>', methods=['GET'])
 @require_api_key
+@replica_reads
 def get_risk_score(hash):
     """
     Get detailed risk score analysis for a fingerprint
@@ -123,40 +223,77 @@ def get_risk_score(hash):
     if len(hash) != 32:
         return jsonify({"error": "Hash must be 32 characters"}), 400
     
-    fp = Fingerprint.query.filter_by(hash=hash).first()
+    fp = find_fingerprint(hash, components=True)
     
     if not fp:
         return jsonify({"error": "Fingerprint not found"}), 404
     
     # Get components
-    components_dict = {
-        "canvas": fp.canvas,
-        "webgl": fp.webgl,
-        "audio": fp.audio,
-        "fonts": fp.fonts,
-        "hardware": fp.hardware,
-        "screen": fp.screen,
-        "browser": fp.browser,
-        "timezone": fp.timezone,
-        "plugins": fp.plugins,
-        "touch": fp.touch,
-        "battery": fp.battery,
-        "network": fp.network,
-        "media": fp.media,
-        "colorDepth": fp.color_depth,
-        "doNotTrack": fp.do_not_track
-    }
-    
-    risk_score, is_bot, factors = calculate_risk_score(components_dict, fp.visit_count)
+    components_dict = fp.components_dict()
+    
+    risk_score, is_bot, factors = score_fingerprint(
+        components_dict, fp.visit_count, explain=True, parsed=fp.parsed_components()
+    )
     
     confidence = min(risk_score / 100.0, 1.0)
     
-    response = {
-        "hash": fp.hash,
-        "risk_score": risk_score,
-        "is_bot": is_bot,
-        "confidence": confidence,
-        "factors": factors
-    }
+    response = RiskScoreResponse(
+        hash=fp.hash,
+        risk_score=risk_score,
+        is_bot=is_bot,
+        confidence=confidence,
+        factors=factors
+    )
+    
+    return model_response(response)
+
+@api_bp.route('/fingerprint/<hash>/visits', methods=['GET'])
+@require_api_key
+@replica_reads
+def get_fingerprint_visits(hash):
+    """
+    Recent visits of a fingerprint and the time between them
+    The timeline lists visits made through the caller's own API keys; the
+    inter-arrival statistics cover the latest `limit` visits through any key.
+    Requires API key (no credit cost for lookup)
+    """
+    if len(hash) != 32:
+        return jsonify({"error": "Hash must be 32 characters"}), 400
+    limit = request.args.get('limit', 100, type=int)
+    if not 1 <= limit <= 1000:
+        return jsonify({"error": "limit must be between 1 and 1000"}), 400
+    
+    own_keys = db.session.scalars(
+        select(APIKey.id).filter_by(user_id=request.current_user.id)
+    ).all()
+    own = recent_visits(hash, limit, api_key_ids=own_keys)
+    recent = recent_visits(hash, limit)
+    if not recent:
+        return jsonify({"error": "No visits recorded for this fingerprint"}), 404
+    
+    response = VisitTimelineResponse(
+        hash=hash,
+        visits=[
+            VisitRecord(seen_at=v.seen_at, ip=unpack_ip(v.ip), api_key_id=v.api_key_id)
+            for v in own
+        ],
+        interarrival=interarrival_stats([v.seen_at for v in recent])
+    )
+    return model_response(response)
+
+@api_bp.route('/token', methods=['POST'])
+@require_api_key
+def create_token():
+    """
+    Exchange an API key for a short-lived signed token (app.tokens)
+    Send the token in X-API-Key until it expires, then mint another.
+    Requires an API key, not a token (no credit cost)
+    """
+    tokens = api_tokens()
+    if tokens is None:
+        return jsonify({"error": "API tokens are disabled"}), 404
+    if isinstance(request.api_key, TokenKey):
+        return jsonify({"error": "Mint tokens with an API key, not a token"}), 400
     
-    return jsonify(response), 200
+    token, expires = tokens.mint(request.api_key, request.current_user)
+    return model_response(TokenResponse(token=token, expires_at=expires, expires_in=tokens.ttl))
@@ -4,8 +4,9 @@ from flask_login import login_required, current_user
 from ..models import Credit, Transaction, APIKey, Fingerprint, db
 from ..auth import generate_api_key
 from ..forms import APIKeyForm
-from sqlalchemy import func
-from datetime import timedelta, datetime
+from ..replicas import replica_reads
+from ..usage import USAGE_RANGES, adjust_active_keys, get_usage_series, get_usage_stats
+from datetime import datetime
 
 dashboard_bp = Blueprint('dashboard_blueprint', __name__)
 
@@ -13,8 +14,8 @@ dashboard_bp = Blueprint('dashboard_blueprint', __name__)
 @login_required
 def index():
     """Main dashboard"""
-    # Get user's credit info
-    credit = Credit.query.filter_by(user_id=current_user.id).first()
+    # Get user's credit info (loaded with the user, see app.user_cache)
+    credit = current_user.credits
     
     if not credit:
         credit = Credit(user_id=current_user.id, balance=0, total_purchased=0, total_used=0)
@@ -26,21 +27,15 @@ def index():
         user_id=current_user.id
     ).order_by(Transaction.created_at.desc()).limit(10).all()
     
-    # Get API keys
-    api_keys = APIKey.query.filter_by(user_id=current_user.id).all()
-    
-    # Get usage statistics
-    total_api_calls = Transaction.query.filter_by(
-        user_id=current_user.id,
-        transaction_type='usage'
-    ).count()
+    # Get usage statistics (materialized counters)
+    stats = get_usage_stats(current_user.id)
     
     return render_template(
         'dashboard/index.html',
         credit=credit,
         recent_transactions=recent_transactions,
-        api_keys=api_keys,
-        total_api_calls=total_api_calls
+        active_api_keys=stats['active_keys'],
+        total_api_calls=stats['api_calls']
     )
 
 @dashboard_bp.route('/api-keys', methods=['GET', 'POST'])
@@ -58,6 +53,7 @@ def api_keys():
             is_active=True
         )
         db.session.add(new_key)
+        adjust_active_keys(current_user.id, 1)
         db.session.commit()
         
         return render_template('dashboard/api_key_created.html', api_key=new_key)
@@ -73,6 +69,8 @@ def delete_api_key(key_id):
     api_key = APIKey.query.filter_by(id=key_id, user_id=current_user.id).first()
     
     if api_key:
+        if api_key.is_active:
+            adjust_active_keys(current_user.id, -1)
         db.session.delete(api_key)
         db.session.commit()
         return jsonify({"message": "API key deleted"}), 200
@@ -87,6 +85,7 @@ def toggle_api_key(key_id):
     
     if api_key:
         api_key.is_active = not api_key.is_active
+        adjust_active_keys(current_user.id, 1 if api_key.is_active else -1)
         db.session.commit()
         return jsonify({
             "message": "API key updated",
@@ -97,38 +96,54 @@ def toggle_api_key(key_id):
 
 @dashboard_bp.route('/usage', methods=['GET'])
 @login_required
+@replica_reads
 def usage():
     """View detailed usage statistics"""
-    # Get usage by day (last 30 days) - PostgreSQL compatible
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    usage_data = db.session.query(
-        func.date(Transaction.created_at).label('date'),
-        func.sum(Transaction.amount).label('credits_used')
-    ).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'usage',
-        Transaction.created_at >= thirty_days_ago
-    ).group_by(func.date(Transaction.created_at)).all()
-    
-    return render_template('dashboard/usage.html', usage_data=usage_data)
+    usage_range = request.args.get('range', '30d')
+    if usage_range not in USAGE_RANGES:
+        usage_range = '30d'
+    
+    span, resolution = USAGE_RANGES[usage_range]
+    usage_data = get_usage_series(current_user.id, datetime.utcnow() - span, resolution=resolution)
+    
+    return render_template(
+        'dashboard/usage.html',
+        usage_data=usage_data,
+        usage_range=usage_range,
+        usage_ranges=USAGE_RANGES
+    )
 
 # API endpoints
+@dashboard_bp.route('/api/usage', methods=['GET'])
+@login_required
+def api_usage():
+    """Get bucketed usage for a range (API endpoint)"""
+    usage_range = request.args.get('range', '30d')
+    if usage_range not in USAGE_RANGES:
+        return jsonify({"error": f"range must be one of {', '.join(USAGE_RANGES)}"}), 400
+    
+    span, resolution = USAGE_RANGES[usage_range]
+    series = get_usage_series(current_user.id, datetime.utcnow() - span, resolution=resolution)
+    
+    return jsonify({
+        "range": usage_range,
+        "resolution": resolution,
+        "buckets": [
+            {
+                "start": point.date,
+                "api_calls": point.api_calls,
+                "credits_used": point.credits_used
+            }
+            for point in series
+        ]
+    }), 200
+
 @dashboard_bp.route('/api/stats', methods=['GET'])
 @login_required
 def api_stats():
     """Get dashboard statistics (API endpoint)"""
     credit = Credit.query.filter_by(user_id=current_user.id).first()
-    
-    total_api_calls = Transaction.query.filter_by(
-        user_id=current_user.id,
-        transaction_type='usage'
-    ).count()
-    
-    active_api_keys = APIKey.query.filter_by(
-        user_id=current_user.id,
-        is_active=True
-    ).count()
+    stats = get_usage_stats(current_user.id)
     
     return jsonify({
         "credits": {
@@ -136,6 +151,6 @@ def api_stats():
             "total_purchased": credit.total_purchased if credit else 0,
             "total_used": credit.total_used if credit else 0
         },
-        "api_calls": total_api_calls,
-        "active_keys": active_api_keys
+        "api_calls": stats['api_calls'],
+        "active_keys": stats['active_keys']
     }), 200
@@ -0,0 +1,83 @@
+"""Streaming export endpoints"""
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from flask_login import login_required, current_user
+from ..auth import admin_required
+from ..export import (
+    EXPORT_FORMATS,
+    export_stream,
+    stream_fingerprint_rows,
+    fingerprint_export_query,
+    parse_timestamp,
+    usage_export_query,
+)
+
+export_bp = Blueprint('export_blueprint', __name__)
+
+def export_options():
+    """Parse the shared export query parameters; raises ValueError if invalid"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    
+    try:
+        since = parse_timestamp(request.args.get('since'))
+        until = parse_timestamp(request.args.get('until'))
+    except ValueError:
+        raise ValueError("since/until must be ISO 8601 timestamps")
+    
+    compress = (
+        request.args.get('gzip') == '1'
+        # Quality-aware: "gzip;q=0" refuses gzip
+        or request.accept_encodings['gzip'] > 0
+    )
+    return fmt, since, until, compress
+
+def export_response(stmt, fmt, compress, filename, **options):
+    """Stream an export as a download"""
+    response = current_app.response_class(
+        stream_with_context(export_stream(stmt, fmt, compress=compress, **options)),
+        mimetype=EXPORT_FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@export_bp.route('/fingerprints', methods=['GET'])
+@admin_required
+def export_fingerprints():
+    """
+    Export fingerprints as NDJSON or CSV (admin only)
+    Filters: since/until on first_seen, is_bot=true|false
+    """
+    try:
+        fmt, since, until, compress = export_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    is_bot = request.args.get('is_bot')
+    if is_bot not in (None, 'true', 'false'):
+        return jsonify({"error": "is_bot must be true or false"}), 400
+    
+    stmt = fingerprint_export_query(
+        since=since,
+        until=until,
+        is_bot=None if is_bot is None else is_bot == 'true'
+    )
+    return export_response(stmt, fmt, compress, 'fingerprints', stream=stream_fingerprint_rows)
+
+@export_bp.route('/usage', methods=['GET'])
+@login_required
+def export_usage():
+    """
+    Export the current user's usage rollups as NDJSON or CSV
+    Filters: since/until on the minute bucket
+    """
+    try:
+        fmt, since, until, compress = export_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    stmt = usage_export_query(current_user.id, since=since, until=until)
+    return export_response(stmt, fmt, compress, 'usage')
@@ -3,8 +3,10 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from flask_login import login_required, current_user
 from ..models import Credit, Transaction, db
 from ..forms import CreditPurchaseForm
-from ..payments import create_checkout_session, handle_successful_payment, verify_webhook_signature
-import stripe
+from ..payments import create_checkout_session, verify_webhook_signature
+from ..webhooks import enqueue_event, notify_webhook_worker
+from ..pagination import keyset_page
+from ..replicas import replica_reads
 
 payment_bp = Blueprint('payment_blueprint', __name__)
 
@@ -12,7 +14,7 @@ payment_bp = Blueprint('payment_blueprint', __name__)
 @login_required
 def credits():
     """View credit balance and purchase options"""
-    credit = Credit.query.filter_by(user_id=current_user.id).first()
+    credit = current_user.credits
     
     if not credit:
         # Create credit record if it doesn't exist
@@ -73,8 +75,12 @@ def cancel():
 
 @payment_bp.route('/webhook', methods=['POST'])
 def webhook():
-    """Stripe webhook handler"""
-    payload = request.data
+    """
+    Stripe webhook handler
+    Stores the verified event in the inbox and acknowledges it straight away;
+    the webhook worker applies it, once per event id (see app.webhooks).
+    """
+    payload = request.get_data()
     sig_header = request.headers.get('Stripe-Signature')
     
     # Verify webhook signature
@@ -83,30 +89,32 @@ def webhook():
     if not event:
         return jsonify({"error": "Invalid signature"}), 400
     
-    # Handle the event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        
-        # Handle successful payment
-        success = handle_successful_payment(session)
-        
-        if success:
-            return jsonify({"status": "success"}), 200
-        else:
-            return jsonify({"error": "Failed to process payment"}), 500
+    created = enqueue_event(event['id'], event['type'], payload.decode('utf-8'))
+    notify_webhook_worker()
     
-    # Return success for other events
-    return jsonify({"status": "received"}), 200
+    # Stripe redelivers until it sees a 2xx, so duplicates are acknowledged too
+    return jsonify({"status": "received" if created else "duplicate"}), 200
 
 @payment_bp.route('/history', methods=['GET'])
 @login_required
 def history():
     """View transaction history"""
-    transactions = Transaction.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Transaction.created_at.desc()).limit(50).all()
-    
-    return render_template('payment/history.html', transactions=transactions)
+    try:
+        transactions, next_cursor = keyset_page(
+            Transaction.query.filter_by(user_id=current_user.id),
+            [Transaction.created_at, Transaction.id],
+            cursor=request.args.get('cursor'),
+            limit=50
+        )
+    except ValueError:
+        return redirect(url_for('payment_blueprint.history'))
+    
+    return render_template(
+        'payment/history.html',
+        transactions=transactions,
+        next_cursor=next_cursor,
+        is_first_page=not request.args.get('cursor')
+    )
 
 # API endpoints
 @payment_bp.route('/api/balance', methods=['GET'])
@@ -130,14 +138,24 @@ def api_balance():
 
 @payment_bp.route('/api/transactions', methods=['GET'])
 @login_required
+@replica_reads
 def api_transactions():
-    """Get transaction history (API endpoint)"""
+    """
+    Get transaction history (API endpoint)
+    Pages newest first; pass `next_cursor` back as `cursor` for the next page
+    """
     limit = request.args.get('limit', 50, type=int)
-    limit = min(limit, 100)  # Max 100 transactions
-    
-    transactions = Transaction.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Transaction.created_at.desc()).limit(limit).all()
+    limit = max(1, min(limit, 100))  # Max 100 transactions per page
+    
+    try:
+        transactions, next_cursor = keyset_page(
+            Transaction.query.filter_by(user_id=current_user.id),
+            [Transaction.created_at, Transaction.id],
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
     
     return jsonify({
         "transactions": [
@@ -146,8 +164,9 @@ def api_transactions():
                 "amount": t.amount,
                 "type": t.transaction_type,
                 "description": t.description,
-                "created_at": t.created_at.isoformat()
+                "created_at": t.created_at
             }
             for t in transactions
-        ]
+        ],
+        "next_cursor": next_cursor
     }), 200
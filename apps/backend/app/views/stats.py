@@ -0,0 +1,59 @@
+"""Operational statistics for admins"""
+from flask import Blueprint, jsonify, request
+from ..auth import admin_required
+from ..bloom import known_hashes
+from ..coalesce import submit_coalescer
+from ..heavy_hitters import DIMENSIONS, heavy_hitters
+from ..tokens import api_tokens
+
+stats_bp = Blueprint('stats_blueprint', __name__)
+
+@stats_bp.route('/bloom', methods=['GET'])
+@admin_required
+def bloom_stats():
+    """Size, configured and observed false positive rates, and counters of the hash filter"""
+    known = known_hashes()
+    if known is None:
+        return jsonify({"mode": "off"})
+    return jsonify(known.stats())
+
+@stats_bp.route('/coalescing', methods=['GET'])
+@admin_required
+def coalescing_stats():
+    """Submits, writes and submits per write of this process's fingerprint submit coalescing"""
+    coalescer = submit_coalescer()
+    if coalescer is None:
+        return jsonify({"mode": "off"})
+    return jsonify(coalescer.stats())
+
+@stats_bp.route('/tokens', methods=['GET'])
+@admin_required
+def token_stats():
+    """Signed token counters and the state of this process's revocation list"""
+    tokens = api_tokens()
+    if tokens is None:
+        return jsonify({"mode": "off"})
+    return jsonify(tokens.stats())
+
+@stats_bp.route('/top', methods=['GET'])
+@admin_required
+def top():
+    """Heaviest keys of a dimension (hash, api_key, ip) over the recent window"""
+    tracker = heavy_hitters()
+    if tracker is None:
+        return jsonify({"mode": "off"})
+    dimension = request.args.get('dimension', 'hash')
+    if dimension not in DIMENSIONS:
+        return jsonify({"error": f"dimension must be one of {', '.join(DIMENSIONS)}"}), 400
+    k = request.args.get('k', tracker.k, type=int)
+    if not 1 <= k <= tracker.k:
+        return jsonify({"error": f"k must be between 1 and {tracker.k}"}), 400
+    items, events, processes = tracker.top(dimension, k)
+    return jsonify({
+        **tracker.stats(),
+        "dimension": dimension,
+        "events": events,
+        "processes": processes,
+        "error_bound": tracker.error_bound(events),
+        "items": [{"key": key, "count": count} for key, count in items],
+    })
@@ -0,0 +1,290 @@
+"""
+Append-only log of fingerprint visits
+submit_fingerprint appends (hash key, time, API key id, packed IP) to an
+in-process buffer; a background thread in each process writes it out in
+multi-row inserts of up to VISIT_LOG_BATCH_SIZE rows every
+VISIT_LOG_FLUSH_INTERVAL seconds, so the request path never waits on the log.
+A visit is readable up to one interval after its submit. If the database
+falls behind, the buffer stops at VISIT_LOG_MAX_BUFFER rows and further
+visits are dropped (and counted) rather than slowing submits down.
+
+On PostgreSQL the table is partitioned by day of seen_at. The same thread
+creates partitions VISIT_PARTITIONS_AHEAD days ahead and drops the ones past
+VISIT_RETENTION_DAYS, which is a cheap DROP TABLE instead of a large DELETE.
+Other databases delete expired rows.
+"""
+import hashlib
+import ipaddress
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, insert, select, text
+
+from .models import FingerprintVisit, db
+
+VISIT_LOG_MODES = ('thread', 'off')
+VISIT_PARTITIONS_AHEAD = 3
+PARTITION_PATTERN = re.compile(r'^fingerprint_visits_(\d{8})$')
+
+def hash_key(hash):
+    """Signed 64-bit key of a fingerprint hash (8 bytes instead of 32 per row)"""
+    return int.from_bytes(hashlib.blake2b(hash.encode(), digest_size=8).digest(), 'big', signed=True)
+
+def pack_ip(address):
+    try:
+        return ipaddress.ip_address(address).packed
+    except ValueError:
+        return None
+
+def unpack_ip(packed):
+    return str(ipaddress.ip_address(bytes(packed))) if packed else None
+
+# Partitions (PostgreSQL)
+
+def partition_name(day):
+    return f"fingerprint_visits_{day:%Y%m%d}"
+
+def ensure_partitions(engine, today=None, ahead=VISIT_PARTITIONS_AHEAD):
+    """Create daily partitions from today through `ahead` days on; returns how many were new"""
+    if engine.dialect.name != 'postgresql':
+        return 0
+    today = today or datetime.now(timezone.utc).date()
+    created = 0
+    with engine.begin() as conn:
+        existing = set(_partitions(conn))
+        for offset in range(ahead + 1):
+            day = today + timedelta(days=offset)
+            if day in existing:
+                continue
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF fingerprint_visits "
+                f"FOR VALUES FROM ('{day.isoformat()} 00:00:00+00') "
+                f"TO ('{(day + timedelta(days=1)).isoformat()} 00:00:00+00')"
+            ))
+            created += 1
+    return created
+
+def _partitions(conn):
+    """Day -> partition name of the existing partitions"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'fingerprint_visits'"
+    )).scalars()
+    days = {}
+    for name in names:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            days[datetime.strptime(match.group(1), '%Y%m%d').date()] = name
+    return days
+
+def drop_expired(engine, retention_days, today=None):
+    """Remove visits older than the retention; returns partitions dropped (PostgreSQL) or rows deleted"""
+    today = today or datetime.now(timezone.utc).date()
+    cutoff = today - timedelta(days=retention_days)
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            expired = [name for day, name in _partitions(conn).items() if day < cutoff]
+            for name in expired:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            return len(expired)
+        cutoff_time = datetime(cutoff.year, cutoff.month, cutoff.day, tzinfo=timezone.utc)
+        table = FingerprintVisit.__table__
+        return conn.execute(delete(table).where(table.c.seen_at < cutoff_time)).rowcount
+
+# Reads
+
+def recent_visits(hash, limit=100, api_key_ids=None):
+    """A fingerprint's latest visits, newest first, optionally seen by the given keys only"""
+    table = FingerprintVisit.__table__
+    stmt = (
+        select(table.c.seen_at, table.c.api_key_id, table.c.ip)
+        .where(table.c.hash_key == hash_key(hash))
+        .order_by(table.c.seen_at.desc())
+        .limit(limit)
+    )
+    if api_key_ids is not None:
+        stmt = stmt.where(table.c.api_key_id.in_(api_key_ids))
+    return db.session.execute(stmt).all()
+
+def interarrival_stats(times):
+    """
+    Statistics of the seconds between consecutive visits (times in any order)
+    A low coefficient of variation means visits arrive like clockwork, as
+    from a scheduler rather than a person.
+    """
+    times = sorted(times)
+    gaps = [(later - earlier).total_seconds() for earlier, later in zip(times, times[1:])]
+    stats = {
+        'visits': len(times),
+        'first': times[0] if times else None,
+        'last': times[-1] if times else None,
+        'mean_seconds': None,
+        'median_seconds': None,
+        'min_seconds': None,
+        'max_seconds': None,
+        'stdev_seconds': None,
+        'coefficient_of_variation': None,
+    }
+    if gaps:
+        mean = statistics.fmean(gaps)
+        stdev = statistics.pstdev(gaps)
+        stats.update(
+            mean_seconds=mean,
+            median_seconds=statistics.median(gaps),
+            min_seconds=min(gaps),
+            max_seconds=max(gaps),
+            stdev_seconds=stdev,
+            coefficient_of_variation=stdev / mean if mean else None
+        )
+    return stats
+
+# Writes
+
+class VisitLog:
+    """The process's visit buffer and the background thread that writes and maintains the log"""
+
+    def __init__(self, app, batch_size=1000, flush_interval=1.0, max_buffer=100_000,
+                 retention_days=30, maintenance_interval=3600.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention_days = retention_days
+        self.maintenance_interval = maintenance_interval
+        self._buffer = deque()
+        self._maintained_at = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def record(self, hash, api_key_id, ip, when=None):
+        """Queue one visit; never blocks on the database"""
+        self.start()
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append({
+            'hash_key': hash_key(hash),
+            'seen_at': when or datetime.now(timezone.utc),
+            'api_key_id': api_key_id or 0,
+            'ip': pack_ip(ip) if ip else None,
+        })
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write every buffered visit, one multi-row insert per batch; returns how many"""
+        written = 0
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                try:
+                    self._insert(batch)
+                except Exception:
+                    # Put the batch back for the next pass, within the buffer bound
+                    room = max(0, self.max_buffer - len(self._buffer))
+                    self._buffer.extendleft(reversed(batch[:room]))
+                    self.dropped += len(batch) - min(len(batch), room)
+                    raise
+                written += len(batch)
+                self.written += len(batch)
+        return written
+
+    def _insert(self, batch):
+        engine = db.engine
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(FingerprintVisit.__table__), batch)
+        except Exception:
+            # A visit dated past the last partition (e.g. after downtime): create it and retry once
+            if engine.dialect.name != 'postgresql' or not ensure_partitions(engine):
+                raise
+            with engine.begin() as conn:
+                conn.execute(insert(FingerprintVisit.__table__), batch)
+
+    def maintain(self):
+        """Create upcoming partitions and drop expired ones"""
+        engine = db.engine
+        created = ensure_partitions(engine)
+        removed = drop_expired(engine, self.retention_days)
+        self._maintained_at = time.monotonic()
+        return created, removed
+
+    # Background thread, started lazily so each forked server process runs its own
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self.run, name='visit-log', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the thread after it writes what is buffered"""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        while True:
+            stopping = self._stopping
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    if (self._maintained_at is None
+                            or time.monotonic() - self._maintained_at >= self.maintenance_interval):
+                        self.maintain()
+                    self.flush()
+            except Exception as e:
+                self.errors += 1
+                self.app.logger.error(f"Visit log error: {e}")
+            if stopping:
+                return
+            self._wake.wait(self.flush_interval)
+
+    def stats(self):
+        return {
+            'buffered': len(self._buffer),
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+        }
+
+def visit_log():
+    """The app's VisitLog, or None when VISIT_LOG is off"""
+    return current_app.extensions.get('visit_log')
+
+def init_visits(app):
+    """Create the app's visit log from the VISIT_LOG_* settings"""
+    mode = app.config.get('VISIT_LOG', 'thread')
+    if mode not in VISIT_LOG_MODES:
+        raise ValueError(f"VISIT_LOG must be one of {', '.join(VISIT_LOG_MODES)}")
+    log = None
+    if mode == 'thread':
+        log = VisitLog(
+            app,
+            batch_size=app.config.get('VISIT_LOG_BATCH_SIZE', 1000),
+            flush_interval=app.config.get('VISIT_LOG_FLUSH_INTERVAL', 1.0),
+            max_buffer=app.config.get('VISIT_LOG_MAX_BUFFER', 100_000),
+            retention_days=app.config.get('VISIT_RETENTION_DAYS', 30)
+        )
+    app.extensions['visit_log'] = log
+    return log
@@ -0,0 +1,183 @@
+"""
+Stripe webhook inbox
+Verified events are stored keyed by Stripe event id and acknowledged at once;
+a background worker applies each one exactly once.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from .models import WebhookEvent, db
+from .payments import handle_successful_payment
+
+# Event type -> handler called with the event's data object inside the
+# worker's transaction; other event types are marked 'ignored'
+WEBHOOK_HANDLERS = {
+    'checkout.session.completed': handle_successful_payment,
+}
+
+# Retry delay after the n-th failed attempt: 2**n seconds, capped
+MAX_RETRY_DELAY = 3600
+
+def enqueue_event(event_id, event_type, payload):
+    """Store a verified event in the inbox; returns False if it was already received"""
+    table = WebhookEvent.__table__
+    values = {
+        'id': event_id,
+        'type': event_type,
+        'payload': payload,
+        'status': 'pending',
+        'attempts': 0,
+        'available_at': datetime.utcnow(),
+    }
+    dialect = db.session.get_bind(mapper=WebhookEvent).dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        result = db.session.execute(
+            insert(table).values(**values).on_conflict_do_nothing(index_elements=['id'])
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    try:
+        db.session.execute(table.insert().values(**values))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+def process_event(event_id, max_attempts=5):
+    """
+    Apply one pending event
+    The claim, the handler's writes and the final status commit together, so
+    an event is applied at most once even with several workers; failures roll
+    back and are retried with backoff until max_attempts.
+    Returns the new status, or None if the event was not pending.
+    """
+    claimed = db.session.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id == event_id, WebhookEvent.status == 'pending')
+        .values(status='processing')
+    ).rowcount
+    if claimed != 1:
+        db.session.rollback()
+        return None
+
+    event = db.session.get(WebhookEvent, event_id)
+    try:
+        handler = WEBHOOK_HANDLERS.get(event.type)
+        if handler:
+            handler(json.loads(event.payload)['data']['object'])
+        event.status = 'processed' if handler else 'ignored'
+        event.processed_at = datetime.utcnow()
+        event.last_error = None
+        db.session.commit()
+        return event.status
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error processing webhook event {event_id}: {e}")
+        return _record_failure(event_id, e, max_attempts)
+
+def _record_failure(event_id, error, max_attempts):
+    event = db.session.get(WebhookEvent, event_id)
+    event.attempts += 1
+    event.last_error = str(error)[:2000]
+    if event.attempts >= max_attempts:
+        event.status = 'failed'
+    else:
+        delay = min(2 ** event.attempts, MAX_RETRY_DELAY)
+        event.available_at = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.commit()
+    return event.status
+
+def process_pending_events(limit=100, max_attempts=5):
+    """Apply up to `limit` due events, oldest first; returns how many were handled"""
+    event_ids = db.session.scalars(
+        select(WebhookEvent.id)
+        .where(WebhookEvent.status == 'pending', WebhookEvent.available_at <= datetime.utcnow())
+        .order_by(WebhookEvent.available_at)
+        .limit(limit)
+    ).all()
+    db.session.commit()
+
+    handled = 0
+    for event_id in event_ids:
+        if process_event(event_id, max_attempts) is not None:
+            handled += 1
+    return handled
+
+class WebhookWorker:
+    """
+    Background thread that drains the inbox
+    Woken by notify() when an event arrives, and polls every poll_interval
+    seconds for retries. Started lazily, so each forked server process runs its own.
+    """
+
+    def __init__(self, app, poll_interval=5.0, max_attempts=5, batch_size=100):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self.run, name='webhook-worker', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """Worker loop; runs in the background thread, or in the foreground from the CLI"""
+        while not self._stopping:
+            self._wake.clear()
+            handled = 0
+            try:
+                with self.app.app_context():
+                    handled = process_pending_events(self.batch_size, self.max_attempts)
+                    db.session.remove()
+            except Exception as e:
+                self.app.logger.error(f"Webhook worker error: {e}")
+
+            # Keep draining while there is a backlog
+            if handled < self.batch_size:
+                self._wake.wait(self.poll_interval)
+
+def notify_webhook_worker():
+    """Wake this process's webhook worker, if it runs in-process"""
+    worker = current_app.extensions.get('webhook_worker')
+    if worker is not None:
+        worker.notify()
+
+def init_webhooks(app):
+    """Create the in-process webhook worker unless WEBHOOK_WORKER is 'off'"""
+    worker = None
+    if app.config.get('WEBHOOK_WORKER', 'thread') == 'thread':
+        worker = WebhookWorker(
+            app,
+            poll_interval=app.config.get('WEBHOOK_POLL_INTERVAL', 5.0),
+            max_attempts=app.config.get('WEBHOOK_MAX_ATTEMPTS', 5)
+        )
+    app.extensions['webhook_worker'] = worker
+    return worker
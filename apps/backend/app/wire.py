@@ -0,0 +1,175 @@
+"""
+Binary wire formats for the fingerprint API
+Clients may send MessagePack or CBOR instead of JSON (picked by Content-Type),
+optionally compressed with gzip or zstd (Content-Encoding). Responses use the
+request's format. JSON stays the default and keeps its single-pass pydantic
+parse; binary bodies decode to Python objects first and validate with
+model_validate.
+"""
+import io
+import threading
+import zlib
+
+from flask import current_app, request
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - optional dependency
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Content-Type -> wire format; anything else is read as JSON, as before
+MEDIA_TYPES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "application/cbor": "cbor",
+}
+# Wire format -> response Content-Type
+RESPONSE_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "cbor": "application/cbor",
+}
+
+# Raised by the decoders for malformed or too deeply nested bodies. msgpack's
+# ExtraData/FormatError/StackError are ValueErrors; CBORDecodeError is not from
+# cbor2 6 on.
+_DECODE_ERRORS = (ValueError, TypeError, EOFError, RecursionError)
+if msgpack is not None:
+    _DECODE_ERRORS += (msgpack.exceptions.UnpackException,)
+if cbor2 is not None:
+    _DECODE_ERRORS += (cbor2.CBORDecodeError,)
+
+# ZstdDecompressor contexts are reusable but not thread-safe
+_zstd = threading.local()
+
+class WireFormatError(Exception):
+    """A body that cannot be decoded; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _available(fmt):
+    return {"json": True, "msgpack": msgpack is not None, "cbor": cbor2 is not None}[fmt]
+
+def request_format():
+    """Wire format of the current request's body, from its Content-Type"""
+    return MEDIA_TYPES.get(request.mimetype, "json")
+
+def decompress(data, encoding, limit):
+    """Undo a Content-Encoding, refusing bodies that inflate past `limit` bytes"""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return data
+    if encoding in ("gzip", "x-gzip"):
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(data, limit + 1)
+        except zlib.error:
+            raise WireFormatError("Malformed gzip body")
+        if not inflater.eof and len(body) <= limit:
+            raise WireFormatError("Truncated gzip body")
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise WireFormatError("zstd bodies are not supported by this server", 415)
+        body = _zstd_decompress(data, limit)
+    else:
+        raise WireFormatError(f"Unsupported Content-Encoding: {encoding}", 415)
+    if len(body) > limit:
+        raise WireFormatError("Decompressed body is too large", 413)
+    return body
+
+def _zstd_decompress(data, limit):
+    if not hasattr(_zstd, "context"):
+        _zstd.context = zstandard.ZstdDecompressor()
+    try:
+        size = zstandard.frame_content_size(data)
+        if 0 <= size <= limit:
+            # One-shot when the frame header declares its size
+            return _zstd.context.decompress(data)
+        if size > limit:
+            raise WireFormatError("Decompressed body is too large", 413)
+        # Size unknown (streamed frame): read up to just past the limit
+        chunks, total = [], 0
+        with _zstd.context.stream_reader(io.BytesIO(data)) as reader:
+            while total <= limit:
+                chunk = reader.read(64 * 1024)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                total += len(chunk)
+        return b"".join(chunks)
+    except zstandard.ZstdError:
+        raise WireFormatError("Malformed zstd body")
+
+def decode(data, fmt):
+    """Python object from a MessagePack or CBOR body"""
+    if not _available(fmt):
+        raise WireFormatError(f"{fmt} bodies are not supported by this server", 415)
+    try:
+        if fmt == "msgpack":
+            return msgpack.unpackb(data, raw=False)
+        return cbor2.loads(data)
+    except _DECODE_ERRORS:
+        raise WireFormatError(f"Malformed {fmt} body")
+
+def encode(obj, fmt):
+    """Serialize plain data (JSON types only) to MessagePack or CBOR"""
+    if fmt == "msgpack":
+        return msgpack.packb(obj)
+    return cbor2.dumps(obj)
+
+def parse_request(model):
+    """
+    Validate the current request body as a pydantic model, whatever its format
+    Raises WireFormatError for undecodable bodies and ValidationError as usual.
+    """
+    fmt = request_format()
+    data = request.get_data(cache=False)
+    if request.content_encoding:
+        limit = current_app.config.get('WIRE_MAX_DECODED_BYTES', 1024 * 1024)
+        data = decompress(data, request.content_encoding, limit)
+    if fmt == "json":
+        return model.model_validate_json(data)
+    return model.model_validate(decode(data, fmt))
+
+def binary_response(obj, status=200):
+    """
+    Response in the request's binary format, or None for JSON requests
+    obj is a pydantic model or plain data.
+    """
+    fmt = request_format()
+    if fmt == "json" or not _available(fmt):
+        return None
+    if hasattr(obj, "model_dump"):
+        obj = obj.model_dump(mode="json")
+    return current_app.response_class(encode(obj, fmt), status=status, mimetype=RESPONSE_TYPES[fmt])
+
+def match_request_format(response):
+    """
+    after_request hook: re-encode JSON responses for binary requests
+    Covers the responses built with jsonify (errors from the auth decorators
+    and the views); views on the hot path build binary responses directly.
+    """
+    if response.mimetype == "application/json" and request_format() != "json" and not response.direct_passthrough:
+        data = response.get_json(silent=True)
+        converted = binary_response(data, response.status_code) if data is not None else None
+        if converted is not None:
+            converted.headers.extend(
+                (key, value) for key, value in response.headers.items()
+                if key not in ("Content-Type", "Content-Length")
+            )
+            return converted
+    return response
@@ -0,0 +1,7 @@
+"""WSGI entry point for production servers (gunicorn app.wsgi:app)"""
+from .main import create_app, warm_app
+
+app = create_app()
+
+if app.config.get('WARM_ON_BOOT'):
+    warm_app(app)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark the known-hash filter against the lookup query it saves
+
+Fills a filter (and a SQLite fingerprints table) with random hashes, then
+probes hashes that are not stored. Reports the per-probe cost of the filter
+(local, and in Redis with a simulated round trip) next to the indexed
+query, and the observed false positive rate.
+
+Usage: python -m bench.bench_bloom [stored] [probes] [latency_ms]
+"""
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+
+from app.bloom import BloomFilter, RedisBits
+from app.fake_redis import FakeRedis
+from app.models import Fingerprint
+
+def timed(probes, fn):
+    timings = []
+    hits = 0
+    for key in probes:
+        start = time.perf_counter()
+        hits += bool(fn(key))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6, hits
+
+def run(stored, probes, latency_ms):
+    hashes = [uuid.uuid4().hex for _ in range(stored)]
+    unknown = [uuid.uuid4().hex for _ in range(probes)]
+
+    engine = create_engine("sqlite://")
+    Fingerprint.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Fingerprint.__table__), [{'hash': h} for h in hashes])
+
+    local = BloomFilter(stored, 0.01)
+    local.add_many(hashes)
+    redis = FakeRedis()
+    shared = BloomFilter(stored, 0.01, bits=lambda size: RedisBits(redis, 'bench', size))
+    shared.add_many(hashes)
+    redis.latency = latency_ms / 1000
+
+    print(f"{stored} stored hashes, {probes} probes of unknown hashes, "
+          f"filter {local.size // 8 // 1024} KiB with {local.hashes} hash functions")
+
+    with engine.connect() as conn:
+        query_us, _ = timed(unknown, lambda h: conn.execute(
+            select(Fingerprint.id).where(Fingerprint.hash == h)).first())
+    print(f"{'indexed query (sqlite)':>28}: p50 {query_us:8.1f} us")
+
+    local_us, local_hits = timed(unknown, local.__contains__)
+    print(f"{'local filter':>28}: p50 {local_us:8.1f} us, false positives {local_hits / probes:.2%}")
+    redis_us, _ = timed(unknown[:max(1, probes // 10)], shared.__contains__)
+    print(f"{f'redis filter ({latency_ms} ms rtt)':>28}: p50 {redis_us:8.1f} us")
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20000,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+    )
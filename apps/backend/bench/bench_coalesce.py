@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark a burst of submits for one hash, with and without coalescing
+
+Simulates the write path: a write takes a pooled connection (POOL_SIZE of
+them), then the row lock, and holds both for `write_ms`. Threads submit the
+same hash at once, each writing on its own (queueing on the row lock, as
+before) or through SubmitCoalescer. Reports the burst's duration, writes,
+and the most connections held at once.
+
+Usage: python -m bench.bench_coalesce [threads] [write_ms]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.coalesce import SubmitCoalescer
+
+POOL_SIZE = 15
+
+class Database:
+    """A connection pool and one row lock"""
+
+    def __init__(self, write_seconds):
+        self.write_seconds = write_seconds
+        self.pool = threading.BoundedSemaphore(POOL_SIZE)
+        self.row_lock = threading.Lock()
+        self.visit_count = 0
+        self.writes = 0
+        self.held = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def write(self, count):
+        with self.pool:
+            with self._lock:
+                self.held += 1
+                self.peak = max(self.peak, self.held)
+            with self.row_lock:
+                time.sleep(self.write_seconds)
+                self.visit_count += count
+                self.writes += 1
+                total = self.visit_count
+            with self._lock:
+                self.held -= 1
+        return total
+
+def burst(label, threads, write_seconds, coalescer):
+    db = Database(write_seconds)
+    submit = (lambda: coalescer.submit('hash', db.write)) if coalescer else (lambda: db.write(1))
+    workers = [threading.Thread(target=submit) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    assert db.visit_count == threads
+    print(f"{label:>12}: {elapsed * 1000:8.1f} ms, {db.writes:5} writes, "
+          f"{db.peak:3} of {POOL_SIZE} connections held at peak")
+
+def run(threads, write_ms):
+    print(f"{threads} concurrent submits of one hash, {write_ms} ms per write")
+    burst('per submit', threads, write_ms / 1000, None)
+    coalescer = SubmitCoalescer()
+    burst('coalesced', threads, write_ms / 1000, coalescer)
+    print(f"{'':>12}  {coalescer.stats()['coalescing_ratio']:.1f} submits per write")
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    )
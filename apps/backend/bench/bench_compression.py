@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark compressed component storage (app.compression)
+
+For synthetic canvas/fonts/browser/plugins values: total stored bytes plain,
+with zstd alone, and with a dictionary trained on a separate sample, plus the
+cost of decompressing one value on read.
+
+Usage: python -m bench.bench_compression [rows]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from app.compression import CompressionDictionaries, train_dictionary
+
+FONTS = ["Arial", "Verdana", "Georgia", "Impact", "Courier New", "Helvetica", "Tahoma",
+         "Trebuchet MS", "Times New Roman", "Palatino", "Garamond", "Bookman", "Comic Sans MS",
+         "Calibri", "Cambria", "Consolas", "Segoe UI", "Lucida Console", "Menlo", "Monaco"]
+PLUGINS = ["PDF Viewer", "Chrome PDF Viewer", "Chromium PDF Viewer", "Microsoft Edge PDF Viewer",
+           "WebKit built-in PDF", "Native Client"]
+
+def values(rng, column):
+    if column == "canvas":
+        return "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAASwAAACWCAYAAABkW7XSAAA" + "".join(
+            rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/") for _ in range(600)
+        )
+    if column == "fonts":
+        return ",".join(sorted(rng.sample(FONTS, rng.randint(8, 20))))
+    if column == "browser":
+        return (f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                f"Chrome/{rng.randint(110, 130)}.0.{rng.randint(0, 6000)}.{rng.randint(0, 200)} Safari/537.36"
+                f"_Win32_{rng.choice(['en-US', 'de-DE', 'fr-FR', 'tr-TR'])}")
+    return ",".join(rng.sample(PLUGINS, rng.randint(3, 6)))
+
+def run(rows):
+    rng = random.Random(0)
+    print(f"{'column':>8} {'plain':>10} {'zstd':>10} {'zstd+dict':>10} {'read us':>8}")
+    for column in ("canvas", "fonts", "browser", "plugins"):
+        sample = [values(rng, column) for _ in range(2000)]
+        stored = [values(rng, column) for _ in range(rows)]
+        plain = CompressionDictionaries(None, min_bytes=64)
+        trained = CompressionDictionaries(None, min_bytes=64)
+        trained.register(1, column, train_dictionary(sample, 16 * 1024))
+
+        sizes = []
+        for registry in (plain, trained):
+            sizes.append(sum(len(registry.compress(column, value)) for value in stored))
+        encoded = trained.compress(column, stored[0])
+        best = min(timeit.repeat(lambda: trained.decompress(encoded), number=10000, repeat=5))
+        total = sum(len(value.encode()) for value in stored)
+        print(f"{column:>8} {total:>10,} {sizes[0]:>10,} {sizes[1]:>10,} {best / 10000 * 1e6:8.2f}")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark heavy hitter tracking on skewed traffic
+
+Feeds Zipf-distributed hashes, API keys and IPs through a HeavyHitters
+window, and reports the cost added to each submit, the fixed memory, the
+cost of merging another process's snapshot, and how the reported top 10
+hashes compare with exact counts.
+
+Usage: python -m bench.bench_heavy_hitters [events] [distinct] [width]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.heavy_hitters import CountMinSketch, HeavyHitters
+
+def zipf_keys(rng, events, distinct, prefix):
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    return [f"{prefix}-{i}" for i in rng.choices(range(distinct), weights, k=events)]
+
+def run(events, distinct, width):
+    rng = random.Random(1)
+    hashes = zipf_keys(rng, events, distinct, 'hash')
+    keys = zipf_keys(rng, events, 200, 'key')
+    ips = zipf_keys(rng, events, distinct, 'ip')
+    tracker = HeavyHitters(app=None, window=300, buckets=10, width=width, depth=4, k=50)
+
+    timings = []
+    for hash, key, ip in zip(hashes, keys, ips):
+        start = time.perf_counter()
+        tracker.record(hash=hash, api_key=key, ip=ip)
+        timings.append(time.perf_counter() - start)
+    print(f"{events} events over {distinct} hashes, width {width} x depth 4, "
+          f"{tracker.stats()['memory_bytes'] // 1024} KiB")
+    print(f"{'record (3 dimensions)':>24}: p50 {statistics.median(timings) * 1e6:8.1f} us")
+
+    other = CountMinSketch(width, 4)
+    sketch = tracker.dimensions['hash'].total.copy()
+    start = time.perf_counter()
+    sketch.merge(other)
+    print(f"{'merge one snapshot':>24}: {(time.perf_counter() - start) * 1e3:8.2f} ms")
+
+    items, total, _ = tracker.top('hash', 10)
+    exact = Counter(hashes)
+    exact_top = {key for key, _ in exact.most_common(10)}
+    overshoot = max(count - exact[key] for key, count in items)
+    print(f"{'top 10 recall':>24}: {len(exact_top & {key for key, _ in items}) / 10:.0%}, "
+          f"largest overcount {overshoot} (bound {tracker.error_bound(total)})")
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50000,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 2048
+    )
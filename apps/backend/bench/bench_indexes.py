@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Before/after benchmark for the workload indexes (migration 005_workload_indexes)
+
+Builds the schema without the new indexes, loads synthetic data, then prints
+the query plan and median latency of each hot query before and after the
+indexes are created. Uses BENCH_DATABASE_URL when set (PostgreSQL: EXPLAIN
+ANALYZE), otherwise a temporary SQLite file (EXPLAIN QUERY PLAN). The bench
+creates and drops its own tables, so it refuses a database that already has
+tables, or the app's DATABASE_URL.
+
+Usage: python -m bench.bench_indexes [fingerprint_rows]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy as sa
+
+from app.models import db
+
+NEW_INDEXES = {
+    'ix_transactions_user_created',
+    'ix_api_keys_user_id',
+    'ix_fingerprints_bot_id',
+    'ix_fingerprints_risk_score',
+}
+
+HOT_QUERIES = {
+    'transaction history page': (
+        "SELECT * FROM transactions WHERE user_id = :user_id "
+        "ORDER BY created_at DESC, id DESC LIMIT 51",
+        {'user_id': 7}
+    ),
+    'api key lookup': (
+        "SELECT * FROM api_keys WHERE key = :key AND is_active",
+        {'key': 'key-000500'}
+    ),
+    'user api keys': (
+        "SELECT count(*) FROM api_keys WHERE user_id = :user_id AND is_active",
+        {'user_id': 7}
+    ),
+    'admin bots page': (
+        "SELECT * FROM fingerprints WHERE is_bot ORDER BY id DESC LIMIT 20",
+        {}
+    ),
+    'admin risk filter': (
+        "SELECT * FROM fingerprints WHERE risk_score >= :score ORDER BY risk_score LIMIT 20",
+        {'score': 95.0}
+    ),
+}
+
+def new_indexes():
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in NEW_INDEXES:
+                yield index
+
+def load(conn, fingerprints):
+    rng = random.Random(42)
+    users = 200
+    now = datetime(2026, 1, 1)
+
+    conn.execute(db.metadata.tables['users'].insert(), [
+        {'id': i, 'email': f'u{i}@example.com', 'username': f'u{i}',
+         'password_hash': 'x', 'is_admin': False, 'is_active': True}
+        for i in range(1, users + 1)
+    ])
+    conn.execute(db.metadata.tables['api_keys'].insert(), [
+        {'user_id': rng.randint(1, users), 'key': f'key-{i:06d}', 'name': 'k',
+         'is_active': rng.random() < 0.8, 'created_at': now}
+        for i in range(1000)
+    ])
+    conn.execute(db.metadata.tables['transactions'].insert(), [
+        {'user_id': rng.randint(1, users), 'amount': 100, 'transaction_type': 'purchase',
+         'created_at': now + timedelta(seconds=i)}
+        for i in range(fingerprints // 2)
+    ])
+
+    batch = []
+    for i in range(fingerprints):
+        score = rng.random() * 100
+        batch.append({'hash': f'{i:032x}', 'risk_score': score, 'is_bot': score >= 98,
+                      'visit_count': 1, 'first_seen': now})
+        if len(batch) == 10000:
+            conn.execute(db.metadata.tables['fingerprints'].insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(db.metadata.tables['fingerprints'].insert(), batch)
+
+def measure(conn, label, runs=30):
+    postgres = conn.dialect.name == 'postgresql'
+    if postgres:
+        conn.execute(sa.text("ANALYZE"))
+
+    print(f"\n=== {label} ===")
+    for name, (sql, params) in HOT_QUERIES.items():
+        explain = "EXPLAIN ANALYZE " if postgres else "EXPLAIN QUERY PLAN "
+        plan = [" ".join(str(c) for c in row) for row in conn.execute(sa.text(explain + sql), params)]
+
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            conn.execute(sa.text(sql), params).fetchall()
+            timings.append(time.perf_counter() - start)
+
+        print(f"{name:>26}: {statistics.median(timings) * 1000:8.3f} ms")
+        for line in plan:
+            print(f"{'':>28}{line}")
+
+def run(fingerprints):
+    url = os.environ.get('BENCH_DATABASE_URL')
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        url = f"sqlite:///{tmp.name}"
+    elif url == os.environ.get('DATABASE_URL'):
+        sys.exit("BENCH_DATABASE_URL must not be the app's DATABASE_URL")
+
+    engine = sa.create_engine(url)
+    if sa.inspect(engine).get_table_names():
+        engine.dispose()
+        sys.exit("Refusing to benchmark in a database that already has tables; use an empty one")
+    try:
+        with engine.begin() as conn:
+            db.metadata.create_all(conn)
+            for index in new_indexes():
+                index.drop(conn)
+            load(conn, fingerprints)
+
+        with engine.begin() as conn:
+            measure(conn, "before")
+            for index in new_indexes():
+                index.create(conn)
+            measure(conn, "after")
+    finally:
+        # Only the tables created above
+        with engine.begin() as conn:
+            db.metadata.drop_all(conn)
+        engine.dispose()
+        if tmp:
+            os.unlink(tmp.name)
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
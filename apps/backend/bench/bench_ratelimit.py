@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark the two-tier rate limiter against a Redis round trip per request
+
+Simulates several worker processes (one TwoTierStore each) sharing one Redis.
+Reports per-hit latency while under the limit, and how far the admitted
+count overshoots a limit that the hits exceed. Uses REDIS_URL when set,
+otherwise FakeRedis with a simulated round trip latency.
+
+Usage: python -m bench.bench_ratelimit [hits] [latency_ms]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.fake_redis import FakeRedis
+from app.ratelimit import RateLimit, TwoTierStore, storage_from_url
+
+WORKERS = 4
+UNDER_LIMIT = RateLimit(10 ** 9, 60)
+OVER_LIMIT = RateLimit(1000, 60)
+
+def hit_all(label, redis, hits, sync_batch, limit):
+    workers = [TwoTierStore(redis, sync_batch=sync_batch, sync_interval=1.0) for _ in range(WORKERS)]
+    timings = []
+    admitted = 0
+    for i in range(hits):
+        start = time.perf_counter()
+        allowed, _, _ = workers[i % WORKERS].hit(f"bench-{label}-{limit.key}", limit)
+        timings.append(time.perf_counter() - start)
+        admitted += allowed
+    return sorted(timings), admitted
+
+def scenario(label, redis, hits, sync_batch):
+    timings, _ = hit_all(label, redis, hits, sync_batch, UNDER_LIMIT)
+    _, admitted = hit_all(label, redis, hits, sync_batch, OVER_LIMIT)
+    print(f"{label:>22}: p50 {statistics.median(timings) * 1e6:8.1f} us, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1] * 1e6:8.1f} us, "
+          f"mean {statistics.fmean(timings) * 1e6:8.1f} us; "
+          f"admitted {admitted} for limit {OVER_LIMIT.amount}")
+
+def run(hits, latency_ms):
+    url = os.environ.get('REDIS_URL')
+    redis = storage_from_url(url, timeout=1.0) if url else FakeRedis(latency=latency_ms / 1000)
+    print(f"{WORKERS} workers, {hits} hits on one key, "
+          f"{'Redis at ' + url if url else f'FakeRedis with {latency_ms} ms round trips'}")
+
+    # The store logs through current_app when Redis errors
+    with Flask(__name__).app_context():
+        scenario('round trip per hit', redis, hits, sync_batch=1)
+        for batch in (10, 50):
+            scenario(f'batched x{batch}', redis, hits, sync_batch=batch)
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    )
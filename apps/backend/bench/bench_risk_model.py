@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark risk scoring: hand-weighted rules against the learned model
+
+Trains a model on synthetic labeled components, then times per-request
+scoring (rules, model) and batch scoring as the importer does it, and
+prints both classifiers' false positive rates on held-out rows.
+
+Usage: python -m bench.bench_risk_model [rows]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.risk_model import train
+from app.risk_scoring import calculate_risk_score
+
+HUMAN = {
+    "canvas": "data:image/png;base64,a", "webgl": "Intel Inc.~ANGLE", "audio": "48000_2048",
+    "fonts": "Arial,Georgia,Verdana", "hardware": "cores:8_mem:8_gpu:Intel",
+    "screen": "1920x1080_1920x1040_24", "browser": "Mozilla/5.0", "timezone": "Europe/Berlin_-60",
+    "plugins": "Chrome PDF Plugin", "touch": "0_false", "battery": "true_90",
+    "network": "4g_10_50", "media": "audioinput,videoinput", "colorDepth": "24_1", "doNotTrack": "unknown",
+}
+# Components a headless browser tends to report, each present at random
+BOT_TRAITS = {
+    "webgl": "Google Inc.~SwiftShader", "fonts": "", "hardware": "cores:2_mem:unknown_gpu:x",
+    "screen": "800x600_800x600_24", "browser": "HeadlessChrome/120", "plugins": "none",
+    "battery": "unsupported", "media": "", "network": "unsupported",
+}
+# Human quirks that look like bot traits to the rules
+HUMAN_QUIRKS = {
+    "battery": "unsupported", "network": "unsupported", "plugins": "none",
+    "screen": "1024x768_1024x738_24", "doNotTrack": "1", "media": "unsupported",
+}
+
+def labeled(rows, seed=1):
+    rng = random.Random(seed)
+    components, visits, labels = [], [], []
+    for _ in range(rows):
+        bot = rng.random() < 0.2
+        traits, share = (BOT_TRAITS, 0.6) if bot else (HUMAN_QUIRKS, 0.35)
+        row = dict(HUMAN, **{k: v for k, v in traits.items() if rng.random() < share})
+        row["hardware"] = row["hardware"].replace("cores:8", f"cores:{rng.choice([4, 8, 16])}")
+        components.append(row)
+        visits.append(rng.randint(1, 40))
+        labels.append(bot)
+    return components, visits, labels
+
+def per_call(items, fn):
+    timings = []
+    for components, visits in items:
+        start = time.perf_counter()
+        fn(components, visits)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+def run(rows):
+    components, visits, labels = labeled(rows)
+    start = time.perf_counter()
+    model, report = train(components, visits, labels)
+    print(f"trained on {rows} rows in {time.perf_counter() - start:.2f}s, threshold {report['threshold']:.4f}")
+    for name in ('rules', 'model'):
+        metrics = report[name]
+        print(f"{name:>24}: precision {metrics['precision']:.3f}, recall {metrics['recall']:.3f}, "
+              f"false positive rate {metrics['false_positive_rate']:.3f}")
+
+    items = list(zip(components, visits))[:5000]
+    print(f"{'rules per request':>24}: p50 {per_call(items, calculate_risk_score):6.1f} us")
+    print(f"{'model per request':>24}: p50 {per_call(items, model.score):6.1f} us")
+    start = time.perf_counter()
+    model.score_batch(components, visits)
+    print(f"{'model batch':>24}: {(time.perf_counter() - start) / rows * 1e6:6.1f} us per row")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
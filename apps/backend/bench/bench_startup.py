@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start time of the app factory in a fresh interpreter
+
+Reports import + create_app() wall time for the lazy (default) and eager
+admin modes, and for a warmed boot as done by a preloading gunicorn master.
+
+Usage: python -m bench.bench_startup [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "from app.config import get_config\n"
+    "from app.main import create_app, warm_app\n"
+    "get_config().ADMIN_LAZY_VIEWS = {lazy}\n"
+    "app = create_app()\n"
+    "if {warm}: warm_app(app)\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+# name -> (ADMIN_LAZY_VIEWS, warm_app)
+MODES = {
+    "lazy": (True, False),
+    "eager": (False, False),
+    "warmed": (True, True),
+}
+
+def boot_time(lazy, warm):
+    env = dict(
+        os.environ,
+        SECRET_KEY=os.environ.get("SECRET_KEY", "bench"),
+        DATABASE_URL=os.environ.get("DATABASE_URL", "sqlite://"),
+        FLASK_ENV="production",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", BOOT.format(lazy=lazy, warm=warm)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def run(runs):
+    for name, (lazy, warm) in MODES.items():
+        times = [boot_time(lazy, warm) for _ in range(runs)]
+        print(f"{name:>8}: median {statistics.median(times) * 1000:7.1f} ms over {runs} runs")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark API authentication: opaque key lookups against signed tokens
+
+Sends the same free lookup (GET /api/fingerprint/<unknown hash>) to a SQLite
+file database, authenticated once with an opaque key (a key query, a
+last_used commit and a user query per request) and once with a token minted
+from it (verified in memory). Reports time and SQL statements per request.
+
+Usage: python -m bench.bench_tokens [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+
+from sqlalchemy import event
+
+from app.config import TestingConfig
+from app.main import create_app
+from app.models import APIKey, User, db
+
+def run(requests):
+    path = os.path.join(tempfile.mkdtemp(), 'tokens.db')
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        RATELIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        tokens = app.extensions['api_tokens']
+        tokens.start = lambda: None
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench-password')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(APIKey(user_id=user.id, key='bench-api-key', name='bench'))
+        db.session.commit()
+        tokens.sync()
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        client = app.test_client()
+        token = client.post('/api/token', headers={'X-API-Key': 'bench-api-key'}).get_json()['token']
+
+        print(f"{requests} lookups")
+        for label, credential in (('opaque key', 'bench-api-key'), ('signed token', token)):
+            headers = {'X-API-Key': credential}
+            statements.clear()
+            start = time.perf_counter()
+            for _ in range(requests):
+                client.get(f"/api/fingerprint/{'0' * 32}", headers=headers)
+                db.session.remove()
+            elapsed = time.perf_counter() - start
+            print(f"{label:>14}: {elapsed / requests * 1e6:8.1f} us per request, "
+                  f"{len(statements) / requests:4.1f} statements per request")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark request parsing and response serialization for POST /api/fingerprint
+
+Compares the legacy path (json.loads, manual key checks, .get() per component,
+json.dumps of a hand-built dict) with the pydantic path used by the API
+(model_validate_json straight from bytes, model_dump_json for the response).
+
+Usage: python -m bench.bench_validation [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas import FingerprintRequest, FingerprintSubmitResponse
+
+COMPONENT_KEYS = [
+    "canvas", "webgl", "audio", "fonts", "hardware", "screen", "browser",
+    "timezone", "plugins", "touch", "battery", "network", "media",
+    "colorDepth", "doNotTrack"
+]
+
+PAYLOAD = json.dumps({
+    "hash": "a1b2c3d4e5f6g7h8i9j0k1l2m3n4o5p6",
+    "components": {
+        "canvas": "data:image/png;base64," + "A" * 4096,
+        "webgl": "Intel Inc.~ANGLE (Intel, Intel(R) UHD Graphics 620)",
+        "audio": "48000_2048",
+        "fonts": ",".join(f"Font {i}" for i in range(120)),
+        "hardware": "cores:8_mem:8_gpu:Intel",
+        "screen": "1920x1080_1920x1040_24",
+        "browser": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+        "timezone": "America/New_York_300",
+        "plugins": ",".join(f"Plugin {i}" for i in range(10)),
+        "touch": "0_false",
+        "battery": "true_100",
+        "network": "4g_10_50",
+        "media": "audioinput,videoinput",
+        "colorDepth": "24_2",
+        "doNotTrack": "unknown"
+    }
+}).encode()
+
+FIRST_SEEN = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def legacy_path():
+    data = json.loads(PAYLOAD)
+    if not data or 'hash' not in data or 'components' not in data:
+        raise ValueError("Invalid request format")
+    if len(data['hash']) != 32:
+        raise ValueError("Hash must be 32 characters")
+    components = data['components']
+    columns = {key: components.get(key) for key in COMPONENT_KEYS}
+    return json.dumps({
+        "hash": data['hash'],
+        "risk_score": 12.0,
+        "is_bot": False,
+        "visit_count": 1,
+        "first_seen": FIRST_SEEN.isoformat(),
+        "credits_used": 1,
+        "credits_remaining": 99
+    }), columns
+
+def pydantic_path():
+    payload = FingerprintRequest.model_validate_json(PAYLOAD)
+    components = payload.components.model_dump()
+    return FingerprintSubmitResponse(
+        hash=payload.hash,
+        risk_score=12.0,
+        is_bot=False,
+        visit_count=1,
+        first_seen=FIRST_SEEN,
+        credits_used=1,
+        credits_remaining=99
+    ).model_dump_json(), components
+
+def run(iterations):
+    for name, fn in [("legacy", legacy_path), ("pydantic", pydantic_path)]:
+        best = min(timeit.repeat(fn, number=iterations, repeat=5))
+        print(f"{name:>10}: {best / iterations * 1e6:8.2f} us/request")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark visit log ingest: buffered batches against a row per submit
+
+Writes the same visits to a SQLite file database, once with an insert and
+commit per visit (what logging in the request would cost) and once through
+VisitLog's buffer and multi-row batches. Reports the time added to each
+submit and the sustained rows per second of each.
+
+Usage: python -m bench.bench_visits [visits] [batch_size]
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+
+from sqlalchemy import insert
+
+from app.config import TestingConfig
+from app.main import create_app
+from app.models import FingerprintVisit, db
+from app.visits import hash_key, pack_ip
+
+def run(visits, batch_size):
+    path = os.path.join(tempfile.mkdtemp(), 'visits.db')
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        VISIT_LOG = "thread"
+        VISIT_LOG_BATCH_SIZE = batch_size
+        VISIT_LOG_MAX_BUFFER = visits
+
+    app = create_app(BenchConfig)
+    hashes = [uuid.uuid4().hex for _ in range(1000)]
+    with app.app_context():
+        log = app.extensions['visit_log']
+        log.start = lambda: None
+        table = FingerprintVisit.__table__
+
+        start = time.perf_counter()
+        for i in range(visits):
+            with db.engine.begin() as conn:
+                conn.execute(insert(table), {
+                    'hash_key': hash_key(hashes[i % 1000]), 'seen_at': datetime.now(timezone.utc),
+                    'api_key_id': 1, 'ip': pack_ip('203.0.113.7'),
+                })
+        direct = time.perf_counter() - start
+        print(f"{visits} visits, batches of {batch_size}")
+        print(f"{'insert per submit':>20}: {direct / visits * 1e6:8.1f} us per submit, "
+              f"{visits / direct:10,.0f} rows/s")
+
+        start = time.perf_counter()
+        for i in range(visits):
+            log.record(hashes[i % 1000], 1, '203.0.113.7')
+        recorded = time.perf_counter() - start
+        start = time.perf_counter()
+        log.flush()
+        flushed = time.perf_counter() - start
+        print(f"{'buffered':>20}: {recorded / visits * 1e6:8.1f} us per submit, "
+              f"{visits / flushed:10,.0f} rows/s written in the background")
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    )
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Stripe webhook path with a local signing stand-in
+
+Delivers N signed checkout.session.completed events to /payment/webhook
+through the Flask test client. 10% of them are redelivered, as Stripe does
+after a timeout, and 5% reuse another event's payment intent. The benchmark
+reports acknowledgement latency and the time the worker takes to drain the
+inbox, then checks that every payment was credited exactly once.
+Uses BENCH_DATABASE_URL when set, otherwise a temporary SQLite file. The
+bench creates and drops its own tables, so it refuses a database that already
+has tables, or the app's DATABASE_URL.
+
+Usage: python -m bench.bench_webhooks [events]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+
+from app.config import Config
+from app.main import create_app
+from app.models import Credit, Transaction, User, WebhookEvent, db
+from app.webhooks import process_pending_events
+
+from bench.stripe_standin import StripeStandIn, checkout_completed_event, client_sender
+
+SECRET = 'whsec_bench'
+CREDITS = 1000
+
+def run(events):
+    url = os.environ.get('BENCH_DATABASE_URL')
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        url = f"sqlite:///{tmp.name}"
+    elif url == os.environ.get('DATABASE_URL'):
+        sys.exit("BENCH_DATABASE_URL must not be the app's DATABASE_URL")
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = url
+        STRIPE_WEBHOOK_SECRET = SECRET
+        WEBHOOK_WORKER = 'off'
+        RATELIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    rng = random.Random(42)
+    try:
+        with app.app_context():
+            if db.inspect(db.engine).get_table_names():
+                sys.exit("Refusing to benchmark in a database that already has tables; use an empty one")
+            db.create_all()
+            users = 50
+            for i in range(users):
+                db.session.add(User(email=f"u{i}@example.com", username=f"u{i}", password_hash='x'))
+            db.session.commit()
+            user_ids = [u.id for u in User.query.all()]
+
+            stand_in = StripeStandIn(SECRET, client_sender(app.test_client()))
+            intents, acks = [], []
+            for _ in range(events):
+                payment_intent = None
+                if intents and rng.random() < 0.05:
+                    payment_intent = rng.choice(intents)
+                event = checkout_completed_event(rng.choice(user_ids), CREDITS, payment_intent=payment_intent)
+                intents.append(event['data']['object']['payment_intent'])
+
+                deliveries = 2 if rng.random() < 0.1 else 1
+                for _ in range(deliveries):
+                    status, elapsed = stand_in.deliver(event)[-1]
+                    assert status == 200, status
+                    acks.append(elapsed)
+
+            start = time.perf_counter()
+            while process_pending_events():
+                pass
+            drain = time.perf_counter() - start
+
+            unique_payments = len(set(intents))
+            credited = db.session.query(db.func.sum(Credit.total_purchased)).scalar() or 0
+            inbox = WebhookEvent.query.filter_by(status='processed').count()
+
+            acks.sort()
+            print(f"deliveries: {len(acks)} ({len(acks) - events} redelivered)")
+            print(f"ack latency: p50 {statistics.median(acks) * 1000:.2f} ms, "
+                  f"p99 {acks[int(len(acks) * 0.99) - 1] * 1000:.2f} ms")
+            print(f"worker drain: {drain:.2f}s ({events / drain:,.0f} events/s, "
+                  f"{drain / events * 1000:.2f} ms/event)")
+            print(f"inbox processed: {inbox}/{events}, purchase rows: "
+                  f"{Transaction.query.count()}/{unique_payments}")
+            assert credited == unique_payments * CREDITS, "payments credited more than once"
+            print("every payment credited exactly once")
+            # Only the tables created above
+            db.drop_all()
+    finally:
+        if tmp:
+            os.unlink(tmp.name)
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark fingerprint request bodies by wire format and Content-Encoding
+
+For JSON, MessagePack and CBOR, plain, gzip and zstd: bytes on the wire and
+the server-side cost of decompressing, decoding and validating one body
+(app.wire, the path POST /api/fingerprint takes).
+
+Usage: python -m bench.bench_wire [iterations]
+"""
+import gzip
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas import FingerprintRequest
+from app.wire import cbor2, decode, decompress, msgpack, zstandard
+from bench.bench_validation import PAYLOAD
+
+LIMIT = 1024 * 1024
+
+def bodies():
+    data = json.loads(PAYLOAD)
+    formats = {"json": PAYLOAD}
+    if msgpack is not None:
+        formats["msgpack"] = msgpack.packb(data)
+    if cbor2 is not None:
+        formats["cbor"] = cbor2.dumps(data)
+    for fmt, body in formats.items():
+        yield fmt, "identity", body
+        yield fmt, "gzip", gzip.compress(body, compresslevel=6)
+        if zstandard is not None:
+            yield fmt, "zstd", zstandard.ZstdCompressor(level=3).compress(body)
+
+def parse(fmt, encoding, body):
+    data = decompress(body, encoding, LIMIT)
+    if fmt == "json":
+        return FingerprintRequest.model_validate_json(data)
+    return FingerprintRequest.model_validate(decode(data, fmt))
+
+def run(iterations):
+    print(f"{'format':>8} {'encoding':>9} {'bytes':>8} {'us/request':>11}")
+    for fmt, encoding, body in bodies():
+        best = min(timeit.repeat(lambda: parse(fmt, encoding, body), number=iterations, repeat=5))
+        print(f"{fmt:>8} {encoding:>9} {len(body):>8} {best / iterations * 1e6:11.2f}")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
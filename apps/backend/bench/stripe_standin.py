@@ -0,0 +1,99 @@
+"""
+Local stand-in for Stripe's webhook sender
+
+Builds checkout.session.completed events, signs them the way Stripe does
+(Stripe-Signature: t=<timestamp>,v1=<HMAC-SHA256 of "<timestamp>.<payload">)
+and delivers them like Stripe: anything but a 2xx within the timeout is
+delivered again.
+"""
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+def sign_payload(payload, secret, timestamp=None):
+    """Stripe-Signature header value for a payload (bytes)"""
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def checkout_completed_event(user_id, credits, package='starter', payment_intent=None, event_id=None):
+    """A checkout.session.completed event as Stripe would send it"""
+    return {
+        'id': event_id or f"evt_{uuid.uuid4().hex}",
+        'object': 'event',
+        'type': 'checkout.session.completed',
+        'created': int(time.time()),
+        'data': {
+            'object': {
+                'id': f"cs_{uuid.uuid4().hex}",
+                'object': 'checkout.session',
+                'payment_intent': payment_intent or f"pi_{uuid.uuid4().hex}",
+                'payment_status': 'paid',
+                'client_reference_id': str(user_id),
+                'metadata': {
+                    'user_id': str(user_id),
+                    'package': package,
+                    'credits': str(credits),
+                },
+            }
+        },
+    }
+
+class StripeStandIn:
+    """
+    Signs and delivers events through `send(payload, headers) -> status code`
+    `send` should raise TimeoutError when the endpoint is slower than `timeout`.
+    """
+
+    def __init__(self, secret, send, timeout=10.0, max_attempts=3):
+        self.secret = secret
+        self.send = send
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    def deliver(self, event):
+        """Deliver one event, retrying like Stripe; returns [(status, seconds), ...]"""
+        payload = json.dumps(event).encode()
+        attempts = []
+        for _ in range(self.max_attempts):
+            headers = {
+                'Content-Type': 'application/json',
+                'Stripe-Signature': sign_payload(payload, self.secret),
+            }
+            start = time.perf_counter()
+            try:
+                status = self.send(payload, headers)
+            except TimeoutError:
+                status = None
+            elapsed = time.perf_counter() - start
+            if status is not None and elapsed > self.timeout:
+                status = None
+            attempts.append((status, elapsed))
+            if status is not None and 200 <= status < 300:
+                break
+        return attempts
+
+def client_sender(client, path='/payment/webhook'):
+    """`send` callable posting through a Flask test client"""
+    def send(payload, headers):
+        return client.post(path, data=payload, headers=headers).status_code
+    return send
+
+def url_sender(url, timeout=10.0):
+    """`send` callable posting to a running server"""
+    import urllib.error
+    import urllib.request
+
+    def send(payload, headers):
+        request = urllib.request.Request(url, data=payload, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError as e:
+            raise TimeoutError(str(e))
+    return send
@@ -0,0 +1,53 @@
+"""
+Gunicorn configuration
+Preloads the app in the master so workers share its memory copy-on-write,
+then gives every worker fresh database connection pools.
+
+Usage: gunicorn -c gunicorn.conf.py app.wsgi:app
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+# More than one makes them gthread workers, whose concurrent submits of a hash
+# share a write (app.coalesce)
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Warm admin scaffolding and templates in the master when preloading
+if preload_app:
+    os.environ.setdefault('WARM_ON_BOOT', '1')
+
+def post_fork(server, worker):
+    """Never share pooled connections across processes; start per-worker threads"""
+    from app.database import dispose_engines
+    from app.wsgi import app
+    dispose_engines(app)
+
+    webhook_worker = app.extensions.get('webhook_worker')
+    if webhook_worker is not None:
+        webhook_worker.start()
+
+    known_hashes = app.extensions.get('known_hashes')
+    if known_hashes is not None:
+        known_hashes.start()
+
+    tracker = app.extensions.get('heavy_hitters')
+    if tracker is not None and tracker.shared:
+        tracker.start()
+
+    visit_log = app.extensions.get('visit_log')
+    if visit_log is not None:
+        visit_log.start()
+
+    api_tokens = app.extensions.get('api_tokens')
+    if api_tokens is not None:
+        api_tokens.start()
+
+
+def worker_exit(server, worker):
+    """Write out buffered visits before the process goes away"""
+    from app.wsgi import app
+    visit_log = app.extensions.get('visit_log')
+    if visit_log is not None:
+        visit_log.stop(timeout=10)
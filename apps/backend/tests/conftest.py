@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+# Config reads these at import time
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from app.main import create_app
+from app.config import TestingConfig
+from app.models import db, User, Credit, APIKey
+
+@pytest.fixture
+def app():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def user(app):
+    user = User(username="tester", email="tester@example.com", is_active=True)
+    user.set_password("password123")
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Credit(user_id=user.id, balance=100, total_purchased=100, total_used=0))
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def api_key(user):
+    key = APIKey(user_id=user.id, key="test-api-key", name="Test key", is_active=True)
+    db.session.add(key)
+    db.session.commit()
+    return key
+
+@pytest.fixture
+def api_headers(api_key):
+    return {"X-API-Key": api_key.key}
+
+@pytest.fixture
+def sample_fingerprint():
+    return {
+        "hash": "a1b2c3d4e5f6g7h8i9j0k1l2m3n4o5p6",
+        "components": {
+            "canvas": "data:image/png;base64,mock",
+            "webgl": "Intel Inc.~ANGLE",
+            "audio": "48000_2048",
+            "fonts": "Arial,Verdana",
+            "hardware": "cores:8_mem:8_gpu:Intel",
+            "screen": "1920x1080_1920x1040_24",
+            "browser": "Mozilla/5.0",
+            "timezone": "America/New_York_300",
+            "plugins": "Chrome PDF Plugin",
+            "touch": "0_false",
+            "battery": "true_100",
+            "network": "4g_10_50",
+            "media": "audioinput,videoinput",
+            "colorDepth": "24_2",
+            "doNotTrack": "unknown"
+        }
+    }
@@ -0,0 +1,51 @@
+import time
+
+from app.admin_stats import AdminStatsProvider
+from app.models import db, Fingerprint
+
+def add_fingerprint(hash_):
+    db.session.add(Fingerprint(hash=hash_.ljust(32, "0"), risk_score=0.0, visit_count=1))
+    db.session.commit()
+
+def test_snapshot_is_cached_until_ttl(app, user):
+    provider = AdminStatsProvider(ttl=300)
+    first = provider.get()
+    assert first.values["user_count"] == 1
+    assert first.exact  # SQLite has no planner estimates
+    
+    add_fingerprint("a")
+    assert provider.get() is first
+    assert provider.get().values["fingerprint_count"] == 0
+
+def test_exact_on_demand(app, user):
+    provider = AdminStatsProvider(ttl=300)
+    provider.get()
+    add_fingerprint("b")
+    
+    snapshot = provider.get(exact=True)
+    assert snapshot.values["fingerprint_count"] == 1
+    assert provider.get() is snapshot
+
+def test_stale_snapshot_refreshes_in_background(app, user):
+    provider = AdminStatsProvider(ttl=0)
+    stale = provider.get()
+    add_fingerprint("c")
+    
+    # The stale snapshot is served while a refresh runs
+    assert provider.get() is stale
+    deadline = time.time() + 5
+    while provider.get() is stale and time.time() < deadline:
+        time.sleep(0.01)
+    assert provider.get().values["fingerprint_count"] == 1
+
+def test_admin_index_shows_staleness(client, user):
+    user.is_admin = True
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+    
+    response = client.get("/admin/")
+    assert response.status_code == 200
+    assert b"updated 0s ago" in response.data
+    assert client.get("/admin/?exact=1").status_code == 200
@@ -1,112 +1,95 @@
-import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import sys
-import os
+from app.models import Credit, DailyUsage
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-
-from app.main import app
-from app.database import Base, get_db
-
-# Test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base.metadata.drop_all(bind=engine)
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-
-client = TestClient(app)
-
-@pytest.fixture
-def sample_fingerprint():
-    return {
-        "hash": "a1b2c3d4e5f6g7h8i9j0k1l2m3n4o5p6",
-        "components": {
-            "canvas": "data:image/png;base64,mock",
-            "webgl": "Intel Inc.~ANGLE",
-            "audio": "48000_2048",
-            "fonts": "Arial,Verdana",
-            "hardware": "cores:8_mem:8_gpu:Intel",
-            "screen": "1920x1080_1920x1040_24",
-            "browser": "Mozilla/5.0",
-            "timezone": "America/New_York_300",
-            "plugins": "Chrome PDF Plugin",
-            "touch": "0_false",
-            "battery": "true_100",
-            "network": "4g_10_50",
-            "media": "audioinput,videoinput",
-            "colorDepth": "24_2",
-            "doNotTrack": "unknown"
-        }
-    }
-
-def test_read_root():
+def test_read_root(client):
     response = client.get("/")
     assert response.status_code == 200
-    assert "name" in response.json()
-    assert "version" in response.json()
+    assert "name" in response.json
+    assert "version" in response.json
 
-def test_health_check():
+def test_health_check(client):
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "healthy"}
+    assert response.json == {"status": "healthy"}
 
-def test_submit_fingerprint(sample_fingerprint):
-    response = client.post("/api/fingerprint", json=sample_fingerprint)
+def test_submit_fingerprint(client, api_headers, sample_fingerprint):
+    response = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
     assert response.status_code == 200
-    data = response.json()
+    data = response.json
     assert data["hash"] == sample_fingerprint["hash"]
     assert "risk_score" in data
     assert "is_bot" in data
     assert data["visit_count"] == 1
+    assert data["credits_used"] == 1
+    assert data["credits_remaining"] == 99
+
+def test_submit_fingerprint_requires_api_key(client, sample_fingerprint):
+    response = client.post("/api/fingerprint", json=sample_fingerprint)
+    assert response.status_code == 401
+
+def test_submit_fingerprint_invalid_hash(client, api_headers, sample_fingerprint):
+    sample_fingerprint["hash"] = "short"
+    response = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    assert response.status_code == 422
+    assert response.json["details"][0]["loc"] == ["hash"]
+
+def test_submit_fingerprint_non_string_component(client, api_headers, sample_fingerprint):
+    sample_fingerprint["components"]["hardware"] = 8
+    response = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    assert response.status_code == 422
+    assert response.json["details"][0]["loc"] == ["components", "hardware"]
+
+def test_submit_fingerprint_malformed_json(client, api_headers):
+    response = client.post(
+        "/api/fingerprint",
+        data=b"{not json",
+        headers={**api_headers, "Content-Type": "application/json"}
+    )
+    assert response.status_code == 422
+    assert response.json["details"][0]["type"] == "json_invalid"
+
+def test_rejected_bodies_are_not_billed(client, user, api_headers):
+    json_headers = {**api_headers, "Content-Type": "application/json"}
+    assert client.post("/api/fingerprint", json={"hash": 1}, headers=api_headers).status_code == 422
+    assert client.post("/api/fingerprint", data=b"x", headers={**json_headers, "Content-Encoding": "gzip"}).status_code == 400
+
+    credit = Credit.query.filter_by(user_id=user.id).one()
+    assert (credit.balance, credit.total_used) == (100, 0)
+    assert DailyUsage.query.filter_by(user_id=user.id).one().credits_used == 0
 
-def test_get_fingerprint(sample_fingerprint):
+def test_get_fingerprint(client, api_headers, sample_fingerprint):
     # First submit
-    client.post("/api/fingerprint", json=sample_fingerprint)
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
     
     # Then get
-    response = client.get(f"/api/fingerprint/{sample_fingerprint['hash']}")
+    response = client.get(f"/api/fingerprint/{sample_fingerprint['hash']}", headers=api_headers)
     assert response.status_code == 200
-    data = response.json()
+    data = response.json
     assert data["hash"] == sample_fingerprint["hash"]
+    assert "last_seen" in data
 
-def test_get_risk_score(sample_fingerprint):
+def test_get_risk_score(client, api_headers, sample_fingerprint):
     # First submit
-    client.post("/api/fingerprint", json=sample_fingerprint)
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
     
     # Then get risk score
-    response = client.get(f"/api/risk-score/{sample_fingerprint['hash']}")
+    response = client.get(f"/api/risk-score/{sample_fingerprint['hash']}", headers=api_headers)
     assert response.status_code == 200
-    data = response.json()
+    data = response.json
     assert "risk_score" in data
     assert "is_bot" in data
     assert "confidence" in data
     assert "factors" in data
 
-def test_fingerprint_visit_count(sample_fingerprint):
-    # Use a different hash to avoid conflicts with other tests
+def test_fingerprint_visit_count(client, api_headers, sample_fingerprint):
     sample_fingerprint["hash"] = "unique_visit_count_test_hash_32c"
     
     # Submit twice
-    response1 = client.post("/api/fingerprint", json=sample_fingerprint)
-    response2 = client.post("/api/fingerprint", json=sample_fingerprint)
+    response1 = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    response2 = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
     
-    assert response1.json()["visit_count"] == 1
-    assert response2.json()["visit_count"] == 2
+    assert response1.json["visit_count"] == 1
+    assert response2.json["visit_count"] == 2
 
-def test_get_nonexistent_fingerprint():
-    response = client.get("/api/fingerprint/nonexistenthash12345678901234")
+def test_get_nonexistent_fingerprint(client, api_headers):
+    response = client.get("/api/fingerprint/nonexistenthash12345678901234567", headers=api_headers)
     assert response.status_code == 404
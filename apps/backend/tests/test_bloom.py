@@ -0,0 +1,132 @@
+import pytest
+from sqlalchemy import event
+
+from app.bloom import MAX_SYNC_GAPS, BloomFilter, KnownHashes, _merge_gaps, bloom_parameters
+from app.config import TestingConfig
+from app.fake_redis import FakeRedis
+from app.main import create_app
+from app.models import db, Fingerprint
+
+@pytest.fixture
+def app():
+    class BloomConfig(TestingConfig):
+        BLOOM_FILTER = "local"
+        BLOOM_CAPACITY = 10000
+
+    app = create_app(BloomConfig)
+    with app.app_context():
+        # Sync by hand instead of from the background thread
+        app.extensions["known_hashes"].start = lambda: None
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def queries(app):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", listener)
+
+def test_parameters_and_false_positive_rate():
+    assert bloom_parameters(1_000_000, 0.01) == (9585059, 7)
+
+    bloom = BloomFilter(5000, 0.01)
+    bloom.add_many([f"known-{i}" for i in range(5000)])
+    assert all(f"known-{i}" in bloom for i in range(5000))
+    false_positives = sum(f"unknown-{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+    assert 0.005 < bloom.false_positive_rate() < 0.02
+
+def test_unknown_hash_answered_without_query(app, client, api_headers, queries):
+    known = app.extensions["known_hashes"]
+    db.session.add(Fingerprint(hash="s" * 32))
+    db.session.commit()
+
+    # Before the first pass every lookup goes to the database
+    assert client.get(f"/api/fingerprint/{'0' * 32}", headers=api_headers).status_code == 404
+    assert known.sync() == 1
+
+    queries.clear()
+    assert client.get(f"/api/fingerprint/{'0' * 32}", headers=api_headers).status_code == 404
+    assert not any("FROM fingerprints" in sql for sql in queries)
+    assert client.get(f"/api/fingerprint/{'s' * 32}", headers=api_headers).status_code == 200
+    assert known.misses == 1
+
+def test_submitted_hash_known_before_next_pass(app, client, api_headers, sample_fingerprint):
+    app.extensions["known_hashes"].sync()
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+
+    hash = sample_fingerprint["hash"]
+    assert client.get(f"/api/risk-score/{hash}", headers=api_headers).status_code == 200
+
+def test_stats_endpoint(app, client, user):
+    user.is_admin = True
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+
+    stats = client.get("/api/stats/bloom").get_json()
+    assert stats["mode"] == "local"
+    assert stats["capacity"] == 10000
+    assert stats["memory_bytes"] == (bloom_parameters(10000, 0.01)[0] + 7) // 8
+
+def test_shared_filter_across_processes(app):
+    redis = FakeRedis()
+    first = KnownHashes(app, 1000, 0.01, redis=redis)
+    second = KnownHashes(app, 1000, 0.01, redis=redis)
+    first.start = second.start = lambda: None
+    db.session.add(Fingerprint(hash="s" * 32))
+    db.session.commit()
+
+    first.sync()
+    second.sync()
+    assert second.ready
+    assert second.check("s" * 32) is True
+
+    first.add("t" * 32)
+    assert second.check("t" * 32) is True
+    assert second.check("u" * 32) is False
+
+    # Redis down: lookups fail open
+    redis.down = True
+    assert second.check("u" * 32) is None
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_row_committed_late_is_found(app, shared):
+    known = KnownHashes(app, 1000, 0.01, redis=FakeRedis() if shared else None)
+    known.start = lambda: None
+    db.session.add(Fingerprint(id=5000, hash="l" * 32))
+    db.session.commit()
+    known.sync()
+
+    # Its id was allocated before 5000's, its transaction committed after
+    db.session.add(Fingerprint(id=100, hash="e" * 32))
+    db.session.commit()
+    assert known.sync() == 1
+    assert known.check("e" * 32) is True
+
+    # Filled ids are no longer re-read
+    assert known.sync() == 0
+
+def test_skipped_ids_are_bounded():
+    gaps = _merge_gaps([[i * 10, i * 10 + 5] for i in range(MAX_SYNC_GAPS + 5)])
+    assert len(gaps) == MAX_SYNC_GAPS
+    assert gaps[0][0] == 0 and gaps[-1][1] == (MAX_SYNC_GAPS + 4) * 10 + 5
+
+def test_shared_filter_is_rebuilt(app):
+    redis = FakeRedis()
+    known = KnownHashes(app, 1000, 0.01, redis=redis, rebuild_interval=3600)
+    known.start = lambda: None
+    db.session.add(Fingerprint(hash="s" * 32))
+    db.session.commit()
+    known.sync()
+    known.add("x" * 32)
+    assert known.check("x" * 32) is True
+
+    # Due: stale bits (here a hash never stored) are dropped, stored rows kept
+    redis.set(f"{known.prefix}:built", 0)
+    known.sync()
+    assert known.check("x" * 32) is False
+    assert known.check("s" * 32) is True
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from app.coalesce import SubmitCoalescer
+from app.models import db, Credit, Fingerprint
+
+def test_concurrent_submits_share_one_write():
+    coalescer = SubmitCoalescer()
+    started, release = threading.Event(), threading.Event()
+    writes = []
+    total = [0]
+
+    def write(count):
+        writes.append(count)
+        if len(writes) == 1:
+            started.set()
+            release.wait(5)
+        total[0] += count
+        return total[0]
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(coalescer.submit("h", write)))
+    first.start()
+    started.wait(5)
+    # Queued behind the write in flight
+    others = [threading.Thread(target=lambda: results.append(coalescer.submit("h", write))) for _ in range(5)]
+    for thread in others:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while coalescer.submits < 6 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert coalescer.submits == 6
+    release.set()
+    for thread in [first, *others]:
+        thread.join(5)
+
+    assert writes == [1, 5]
+    assert sorted(results) == [(1, 1, 1), *[(6, 5, position) for position in range(1, 6)]]
+    stats = coalescer.stats()
+    assert (stats["submits"], stats["writes"], stats["coalesced"]) == (6, 2, 4)
+    assert stats["coalescing_ratio"] == 3.0 and stats["largest_batch"] == 5
+    assert stats["in_flight"] == 0
+
+def test_errors_reach_every_caller_and_free_the_key():
+    coalescer = SubmitCoalescer()
+
+    def fail(count):
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        coalescer.submit("h", fail)
+    assert coalescer.submit("h", lambda count: "ok") == ("ok", 1, 1)
+    assert coalescer.stats()["errors"] == 1
+
+def test_batched_submit_responses(app, client, user, api_headers, sample_fingerprint):
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    coalescer = app.extensions["submit_coalescer"]
+    submit = coalescer.submit
+    # This request is the second of a batch of three
+    coalescer.submit = lambda key, write: (write(3), 3, 2)
+
+    response = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data["visit_count"] == 3
+    assert data["credits_remaining"] == 98
+    assert db.session.scalars(db.select(Fingerprint.visit_count)).one() == 4
+
+    coalescer.submit = submit
+    response = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    assert response.get_json()["visit_count"] == 5
+    assert Credit.query.filter_by(user_id=user.id).one().total_used == 3
@@ -0,0 +1,96 @@
+import io
+import json
+
+from sqlalchemy import select
+
+from app.components import MISSING_COMPONENTS, missing_names, parse_components
+from app.importer import import_fingerprints
+from app.models import db, COMPONENT_COLUMNS, Fingerprint
+from app.risk_scoring import calculate_risk_score
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+def columns(components):
+    return {COMPONENT_COLUMNS[name]: value for name, value in components.items()}
+
+def test_parse_components(sample_fingerprint):
+    assert parse_components(sample_fingerprint["components"]) == {
+        "cpu_cores": 8, "device_memory": 8.0, "screen_width": 1920, "screen_height": 1080,
+        "max_touch_points": 0, "tz_offset": 300, "missing_components": 0,
+    }
+
+    parsed = parse_components({
+        "hardware": "cores:unknown_mem:0.5_gpu:x", "screen": "garbage", "webgl": "unsupported",
+        "plugins": "none", "timezone": "UTC", "touch": "",
+    })
+    assert (parsed["cpu_cores"], parsed["device_memory"], parsed["screen_width"]) == (None, 0.5, None)
+    assert (parsed["max_touch_points"], parsed["tz_offset"]) == (None, None)
+    # Absent media and fonts count as missing, as the collector sends "" for them
+    assert missing_names(parsed["missing_components"]) == ["webgl", "media", "fonts", "plugins", "hardware"]
+
+def test_out_of_range_values_are_not_parsed(client, api_headers, sample_fingerprint):
+    components = {"hardware": "cores:99999_mem:8_gpu:x", "touch": "70000_true", "timezone": "x_1e9",
+                  "screen": "99999x1080_1920x1080_24"}
+    parsed = parse_components(components)
+    assert (parsed["cpu_cores"], parsed["max_touch_points"], parsed["tz_offset"]) == (None, None, None)
+    assert parsed["screen_width"] is None
+    assert parse_components({"hardware": "cores:-4_mem:8_gpu:x", "timezone": "x_-660"})["tz_offset"] == -660
+
+    sample_fingerprint["components"].update(components)
+    response = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    assert response.status_code == 200
+    fp = db.session.scalars(select(Fingerprint)).one()
+    assert (fp.cpu_cores, fp.max_touch_points, fp.tz_offset, fp.screen_width) == (None, None, None, None)
+    assert fp.device_memory == 8.0
+
+def test_rules_score_the_same_from_parsed_columns(sample_fingerprint):
+    components = dict(sample_fingerprint["components"], webgl="error", screen="800x600_800x600_24")
+    parsed = parse_components(components)
+    assert calculate_risk_score(components, 1, parsed=parsed) == calculate_risk_score(components, 1)
+
+def test_submit_stores_parsed_columns(client, api_headers, sample_fingerprint):
+    sample_fingerprint["components"]["battery"] = "unsupported"
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+
+    fp = db.session.scalars(select(Fingerprint)).one()
+    assert (fp.cpu_cores, fp.screen_width, fp.screen_height, fp.tz_offset) == (8, 1920, 1080, 300)
+    assert fp.missing_components == MISSING_COMPONENTS["battery"][0]
+    assert client.get(f"/api/risk-score/{fp.hash}", headers=api_headers).status_code == 200
+
+def test_import_and_backfill_fill_the_columns(app, sample_fingerprint):
+    components = sample_fingerprint["components"]
+    line = json.dumps({"hash": "i" * 32, "components": components})
+    import_fingerprints(io.StringIO(line + "\n"), workers=1)
+    # A row stored before the columns existed
+    db.session.add(Fingerprint(hash="l" * 32, visit_count=1, **columns(components)))
+    db.session.commit()
+
+    legacy = db.session.scalars(select(Fingerprint).filter_by(hash="l" * 32)).one()
+    assert legacy.missing_components is None
+    assert legacy.parsed_components() == parse_components(components)
+
+    result = app.test_cli_runner().invoke(args=["backfill-components", "--batch-size", "1"])
+    assert result.exit_code == 0, result.output
+    assert "main: filled 1 fingerprints." in result.output
+    db.session.expire_all()
+    for fp in db.session.scalars(select(Fingerprint)):
+        assert (fp.cpu_cores, fp.max_touch_points, fp.missing_components) == (8, 0, 0)
+
+def test_admin_filters_on_parsed_columns(client, user, sample_fingerprint):
+    user.is_admin = True
+    components = sample_fingerprint["components"]
+    for name, webgl in (("a", "ANGLE"), ("b", "unsupported")):
+        row = dict(components, webgl=webgl)
+        db.session.add(Fingerprint(hash=name * 32, visit_count=1, **columns(row), **parse_components(row)))
+    db.session.commit()
+    login(client, user)
+
+    view = next(v for v in client.application.extensions["admin"][0]._views if v.name == "Fingerprints")
+    view.ensure_cache()
+    index = next(i for i, f in enumerate(view._filters) if f.column.key == "missing_components")
+    response = client.get(f"/admin/fingerprint/?flt0_{index}={MISSING_COMPONENTS['webgl'][0]}")
+    assert response.status_code == 200
+    assert b"b" * 32 in response.data and b"a" * 32 not in response.data
@@ -0,0 +1,92 @@
+import io
+import json
+import random
+
+import pytest
+from sqlalchemy import LargeBinary, inspect, select, type_coerce
+
+zstandard = pytest.importorskip("zstandard")
+
+from app.compression import is_compressed
+from app.importer import import_fingerprints
+from app.models import db, COMPRESSED_COLUMNS, Fingerprint
+
+FONTS = ["Arial", "Verdana", "Georgia", "Impact", "Courier New", "Helvetica", "Tahoma",
+         "Trebuchet MS", "Times New Roman", "Palatino", "Garamond", "Bookman", "Comic Sans MS"]
+
+def long_components(rng):
+    return {
+        "canvas": "data:image/png;base64," + "iVBORw0KGgoAAAANSUhEUgAA" * 12 + "%08x" % rng.getrandbits(32),
+        "fonts": ",".join(rng.sample(FONTS, 10) * 3),
+        "browser": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                   f"Chrome/{rng.randint(100, 130)}.0.0.0 Safari/537.36 " * 3,
+        "plugins": "PDF Viewer,Chrome PDF Viewer,Chromium PDF Viewer,Microsoft Edge PDF Viewer," * 4,
+    }
+
+def add_fingerprints(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        db.session.add(Fingerprint(hash=f"{seed}{i:031d}", visit_count=1, **long_components(rng)))
+    db.session.commit()
+
+def stored(column, hash):
+    table = Fingerprint.__table__
+    return db.session.scalar(
+        select(type_coerce(table.c[column], LargeBinary)).where(table.c.hash == hash)
+    )
+
+def test_long_values_are_compressed_and_read_back(app):
+    components = long_components(random.Random(1))
+    db.session.add(Fingerprint(hash="c" * 32, canvas=components["canvas"], fonts="Arial"))
+    db.session.commit()
+
+    canvas = stored("canvas", "c" * 32)
+    assert is_compressed(canvas) and len(canvas) < len(components["canvas"]) / 2
+    # Short values stay plain
+    assert stored("fonts", "c" * 32) == b"Arial"
+
+    db.session.expire_all()
+    fp = db.session.scalars(select(Fingerprint)).one()
+    # Deferred until read
+    assert {"canvas", "fonts"} <= inspect(fp).unloaded
+    assert fp.canvas == components["canvas"]
+    assert fp.fonts == "Arial"
+
+def test_trained_dictionaries_keep_old_rows_readable(app):
+    add_fingerprints(60)
+    runner = app.test_cli_runner()
+    before = len(stored("fonts", f"0{0:031d}"))
+
+    result = runner.invoke(args=["train-compression-dictionaries", "--sample", "60", "--size", "1024"])
+    assert result.exit_code == 0, result.output
+    assert "fonts: version 2 from 60 values" in result.output
+    result = runner.invoke(args=["compress-components"])
+    assert result.exit_code == 0, result.output
+    registry = app.extensions["compression"]
+    first = stored("fonts", f"0{0:031d}")
+    assert registry.version_of(first) == registry.current_version("fonts") == 2
+    assert len(first) < before
+
+    # A newer dictionary: rows written with the old one still read back
+    runner.invoke(args=["train-compression-dictionaries", "--sample", "60", "--size", "1024", "--column", "fonts"])
+    assert registry.current_version("fonts") == 5
+    expected = long_components(random.Random(0))
+    db.session.expire_all()
+    fp = db.session.scalars(select(Fingerprint).filter_by(hash=f"0{0:031d}")).one()
+    assert fp.components_dict()["fonts"] == expected["fonts"]
+
+    result = runner.invoke(args=["compress-components", "--decompress"])
+    assert "main: rewrote 60 fingerprints" in result.output
+    assert not any(is_compressed(stored(column, f"0{0:031d}")) for column in COMPRESSED_COLUMNS)
+
+def test_submit_import_and_risk_score_with_compressed_columns(app, client, api_headers, sample_fingerprint):
+    components = dict(sample_fingerprint["components"], **long_components(random.Random(2)))
+    client.post("/api/fingerprint", json={"hash": "s" * 32, "components": components}, headers=api_headers)
+    import_fingerprints(io.StringIO(json.dumps({"hash": "i" * 32, "components": components}) + "\n"), workers=1)
+
+    for hash in ("s" * 32, "i" * 32):
+        assert is_compressed(stored("plugins", hash))
+    response = client.get(f"/api/risk-score/{'s' * 32}", headers=api_headers)
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert db.session.scalars(select(Fingerprint).filter_by(hash="i" * 32)).one().browser == components["browser"]
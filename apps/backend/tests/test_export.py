@@ -0,0 +1,87 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app.export import export_stream, fingerprint_export_query
+from app.models import db, Fingerprint
+from app.usage import record_usage
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+@pytest.fixture
+def fingerprints(app):
+    for i in range(5):
+        db.session.add(Fingerprint(
+            hash=f"{i:032d}", risk_score=90.0 if i % 2 else 10.0, is_bot=bool(i % 2),
+            visit_count=i + 1, first_seen=datetime(2026, 1, i + 1)
+        ))
+    db.session.commit()
+
+@pytest.fixture
+def admin(client, user):
+    user.is_admin = True
+    db.session.commit()
+    login(client, user)
+    return user
+
+def test_stream_batches_rows(fingerprints):
+    chunks = list(export_stream(fingerprint_export_query(), 'ndjson', batch_size=2))
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [r["visit_count"] for r in rows] == [1, 2, 3, 4, 5]
+    assert set(rows[0]) == {"hash", "risk_score", "is_bot", "visit_count", "first_seen", "last_seen"}
+
+def test_export_fingerprints_csv_with_filters(client, admin, fingerprints):
+    response = client.get("/export/fingerprints?format=csv&is_bot=true&since=2026-01-02")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [r["hash"] for r in rows] == [f"{1:032d}", f"{3:032d}"]
+
+def test_export_fingerprints_gzip(client, admin, fingerprints):
+    response = client.get("/export/fingerprints", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(response.get_data()).splitlines()
+    assert len(lines) == 5
+
+    response = client.get("/export/fingerprints", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in response.headers
+    assert len(response.get_data().splitlines()) == 5
+
+def test_export_fingerprints_requires_admin(client, user):
+    login(client, user)
+    assert client.get("/export/fingerprints").status_code == 403
+
+def test_export_rejects_bad_filters(client, admin):
+    assert client.get("/export/fingerprints?since=yesterday").status_code == 400
+    assert client.get("/export/fingerprints?format=xml").status_code == 400
+
+def test_export_usage_is_scoped_to_user(client, user):
+    record_usage(user.id, 1, api_key_id=1, endpoint="api_blueprint.submit_fingerprint",
+                 when=datetime(2026, 1, 1, 12, 0))
+    db.session.commit()
+    login(client, user)
+    
+    rows = [json.loads(line) for line in client.get("/export/usage").get_data().splitlines()]
+    assert rows == [{
+        "bucket": "2026-01-01T12:00:00",
+        "api_key_id": 1,
+        "endpoint": "api_blueprint.submit_fingerprint",
+        "calls": 1,
+        "credits_used": 1
+    }]
+
+def test_export_cli(app, fingerprints, tmp_path):
+    output = tmp_path / "fp.ndjson.gz"
+    result = app.test_cli_runner().invoke(
+        args=["export-fingerprints", "--not-bot", "--gzip", "-o", str(output)]
+    )
+    assert result.exit_code == 0, result.output
+    assert len(gzip.decompress(output.read_bytes()).splitlines()) == 3
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from app.config import TestingConfig
+from app.fake_redis import FakeRedis
+from app.heavy_hitters import CountMinSketch, HeavyHitters, SlidingTopK
+from app.main import create_app
+from app.models import db
+
+@pytest.fixture
+def app():
+    class ScoringConfig(TestingConfig):
+        HEAVY_HITTERS_SCORING = True
+
+    app = create_app(ScoringConfig)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def admin_client(client, user):
+    user.is_admin = True
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+    return client
+
+def test_sketch_never_underestimates_and_merges():
+    rng = random.Random(7)
+    keys = [f"key-{rng.randrange(5000)}" for _ in range(20000)]
+    first, second = CountMinSketch(512, 4), CountMinSketch(512, 4)
+    for i, key in enumerate(keys):
+        (first if i % 2 else second).add(key)
+
+    merged = first.copy().merge(second)
+    bound = 2.72 / 512 * len(keys)
+    for key in set(keys[:500]):
+        true = keys.count(key)
+        assert true <= merged.estimate(key) <= true + bound
+    restored = CountMinSketch.from_bytes(512, 4, merged.to_bytes())
+    assert restored.estimate(keys[0]) == merged.estimate(keys[0])
+    with pytest.raises(ValueError):
+        merged.merge(CountMinSketch(256, 4))
+
+def test_window_slides_and_keeps_top_k_bounded():
+    window = SlidingTopK(window=60, buckets=6, width=256, depth=4, k=3)
+    for i in range(200):
+        window.add(f"noise-{i}", now=1000)
+    for _ in range(50):
+        window.add("heavy", now=1000)
+    assert len(window.candidates) <= 6
+    assert window.estimate("heavy", now=1030) >= 50
+
+    # Once 1000 leaves the window, only later events count
+    for _ in range(5):
+        window.add("late", now=1065)
+    sketch, events, candidates = window.snapshot(now=1065)
+    assert events == 5
+    assert sketch.estimate("heavy") == 0
+    assert candidates == ["late"]
+
+def test_top_endpoint_reports_dominant_keys(app, admin_client, api_key, api_headers, sample_fingerprint):
+    for i in range(6):
+        hash = "a" * 32 if i < 4 else f"{i:032d}"
+        admin_client.post("/api/fingerprint", json={**sample_fingerprint, "hash": hash}, headers=api_headers)
+
+    top = admin_client.get("/api/stats/top?dimension=hash&k=2").get_json()
+    assert top["mode"] == "local"
+    assert top["events"] == 6
+    assert top["items"][0] == {"key": "a" * 32, "count": 4}
+    assert len(top["items"]) == 2
+    keys = admin_client.get("/api/stats/top?dimension=api_key").get_json()["items"]
+    assert keys == [{"key": str(api_key.id), "count": 6}]
+    assert admin_client.get("/api/stats/top?dimension=email").status_code == 400
+
+def test_burst_raises_risk_score(app, client, api_headers, sample_fingerprint):
+    scores = [
+        client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers).get_json()["risk_score"]
+        for _ in range(6)
+    ]
+    # Too few lifetime visits for "rapid_visits"; the sixth in the window is a burst
+    assert scores[0] == scores[4]
+    assert scores[5] == min(scores[0] + 12, 100)
+
+def test_counts_merge_across_processes(app):
+    redis = FakeRedis()
+    first = HeavyHitters(app, window=60, buckets=6, width=256, redis=redis)
+    second = HeavyHitters(app, window=60, buckets=6, width=256, redis=redis)
+    first.start = second.start = lambda: None
+    for _ in range(3):
+        first.record(hash="h", ip="10.0.0.1")
+    second.record(hash="h", ip="10.0.0.2")
+    first.publish()
+
+    items, events, processes = second.top("hash")
+    assert (items, events, processes) == ([("h", 4)], 4, 2)
+    assert second.top("ip")[0] == [("10.0.0.1", 3), ("10.0.0.2", 1)]
+
+    # A process that stopped publishing drops out once its snapshot expires
+    redis.flushall()
+    assert second.top("hash")[0] == [("h", 1)]
+
+def test_forked_workers_publish_separately(app, monkeypatch):
+    # Created in the master before the fork, as with gunicorn's preload_app
+    tracker = HeavyHitters(app, window=60, buckets=6, width=256, redis=FakeRedis())
+    tracker.start = lambda: None
+    master_id = tracker.worker_id
+
+    monkeypatch.setattr("os.getpid", lambda: 1001)
+    first_worker = tracker.worker_id
+    tracker.record(hash="h")
+    tracker.publish()
+
+    monkeypatch.setattr("os.getpid", lambda: 1002)
+    assert len({master_id, first_worker, tracker.worker_id}) == 3
+    assert tracker.top("hash")[2] == 2
@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+
+from app.importer import import_fingerprints
+from app.models import COMPONENT_COLUMNS, db, Fingerprint
+from app.risk_scoring import calculate_risk_score
+
+def record(i, **extra):
+    components = {name: "ok" for name in COMPONENT_COLUMNS}
+    components["webgl"] = "unsupported" if i % 2 else "ANGLE"
+    return {"hash": f"{i:032d}", "components": components, **extra}
+
+def ndjson(*records):
+    return io.StringIO("".join(json.dumps(r) + "\n" for r in records))
+
+def test_import_ndjson_scores_and_rejects(app):
+    fh = ndjson(record(1), record(2, visit_count=3), {"hash": "short"}, record(3))
+    fh = io.StringIO(fh.getvalue() + "not json\n")
+    report = import_fingerprints(fh, chunk_size=2, workers=1)
+
+    assert report.imported == 3
+    assert report.rejected == 2
+    assert [line for line, _ in report.errors] == [3, 5]
+
+    fp = Fingerprint.query.filter_by(hash=f"{1:032d}").one()
+    assert fp.webgl == "unsupported"
+    assert fp.risk_score == 15
+    assert Fingerprint.query.filter_by(hash=f"{2:032d}").one().visit_count == 3
+
+def test_import_merges_existing_and_repeated_hashes(app):
+    db.session.add(Fingerprint(hash=f"{1:032d}", visit_count=9, canvas="kept"))
+    db.session.commit()
+
+    fh = ndjson(
+        record(1, first_seen="2020-01-01T00:00:00Z"),
+        record(1, visit_count=2, last_seen="2026-02-01T00:00:00"),
+    )
+    report = import_fingerprints(fh, chunk_size=1, workers=1)
+
+    # One row per chunk upserted
+    assert report.fingerprints == 2
+    fp = Fingerprint.query.one()
+    assert fp.visit_count == 12
+    assert fp.canvas == "kept"
+    assert fp.first_seen.year == 2020
+    assert fp.last_seen.year == 2026
+    # Scored at the merged visit count, not the last file row's
+    assert (fp.risk_score, fp.is_bot) == calculate_risk_score(fp.components_dict(), 12)[:2]
+    assert fp.risk_score != calculate_risk_score(fp.components_dict(), 2)[0]
+
+def test_import_folds_hashes_repeated_in_a_chunk(app):
+    fh = ndjson(
+        record(1, visit_count=6, last_seen="2026-02-01T00:00:00"),
+        record(2),
+        record(1, visit_count=6, first_seen="2020-01-01T00:00:00Z"),
+    )
+    report = import_fingerprints(fh, chunk_size=10, workers=1, use_copy=False)
+
+    assert report.fingerprints == 2
+    fp = Fingerprint.query.filter_by(hash=f"{1:032d}").one()
+    assert fp.visit_count == 12
+    assert (fp.first_seen.year, fp.last_seen.year) == (2020, 2026)
+    assert (fp.risk_score, fp.is_bot) == calculate_risk_score(fp.components_dict(), 12)[:2]
+
+def test_import_csv_accepts_column_names(app):
+    buffer = io.StringIO()
+    columns = ["hash", "visit_count", *COMPONENT_COLUMNS.values()]
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    writer.writerow({"hash": f"{7:032d}", "visit_count": "", **{c: "x" for c in COMPONENT_COLUMNS.values()}})
+    writer.writerow({"hash": "bad", **{c: "x" for c in COMPONENT_COLUMNS.values()}})
+    buffer.seek(0)
+
+    report = import_fingerprints(buffer, fmt="csv", workers=1)
+    assert (report.imported, report.rejected) == (1, 1)
+    assert report.errors[0][0] == 3
+    assert Fingerprint.query.one().color_depth == "x"
+
+def test_import_command_with_process_pool(app, tmp_path):
+    path = tmp_path / "fingerprints.ndjson"
+    path.write_text("".join(json.dumps(record(i)) + "\n" for i in range(10)))
+
+    result = app.test_cli_runner().invoke(
+        args=["import-fingerprints", str(path), "--workers", "2", "--chunk-size", "3"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Imported 10 rows into 10 fingerprints, rejected 0" in result.output
+    assert Fingerprint.query.filter_by(is_bot=False).count() == 10
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.config import TestingConfig
+from app.json_provider import (
+    MsgspecProvider,
+    OrjsonProvider,
+    StdlibJSONProvider,
+    get_json_provider_class,
+    init_json_provider,
+)
+from app.main import create_app
+
+STAMP = datetime(2026, 1, 5, 12, 30, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("name", ["orjson", "stdlib"])
+def test_provider_datetime_is_iso_8601(name):
+    class Config(TestingConfig):
+        JSON_PROVIDER = name
+
+    app = create_app(Config)
+    assert app.json.loads(app.json.dumps({"at": STAMP})) == {"at": STAMP.isoformat()}
+    
+    with app.app_context():
+        response = app.json.response(at=STAMP, count=3)
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"at": STAMP.isoformat(), "count": 3}
+
+def test_auto_prefers_fast_encoder():
+    assert get_json_provider_class("auto") is OrjsonProvider
+    assert get_json_provider_class("stdlib") is StdlibJSONProvider
+
+def test_unknown_provider_rejected():
+    with pytest.raises(ValueError):
+        get_json_provider_class("yaml")
+
+@pytest.mark.parametrize("name, provider_class", [
+    ("orjson", OrjsonProvider),
+    ("msgspec", MsgspecProvider),
+    ("stdlib", StdlibJSONProvider),
+])
+def test_request_body_decoded_by_provider(app, client, user, monkeypatch, name, provider_class):
+    if name != "stdlib":
+        pytest.importorskip(name)
+    app.config["JSON_PROVIDER"] = name
+    provider = init_json_provider(app)
+    assert type(provider) is provider_class
+
+    decoded = []
+    loads = provider.loads
+    monkeypatch.setattr(provider, "loads", lambda s, **kwargs: decoded.append(s) or loads(s, **kwargs))
+    response = client.post(
+        "/auth/api/login",
+        json={"email": "tester@example.com", "password": "password123"}
+    )
+    assert response.status_code == 200
+    # The login view's request body, before the test reads the response
+    assert len(decoded) == 1 and b"password123" in decoded[0]
+    assert response.json["user"]["username"] == "tester"
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, Fingerprint, Transaction
+from app.pagination import decode_cursor, encode_cursor
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+@pytest.fixture
+def transactions(user):
+    # Two rows share a timestamp to exercise the id tie-breaker
+    base = datetime(2026, 1, 1, 12, 0)
+    stamps = [base, base, base + timedelta(minutes=1), base + timedelta(minutes=2), base + timedelta(minutes=3)]
+    for i, stamp in enumerate(stamps):
+        db.session.add(Transaction(
+            user_id=user.id, amount=100 + i, transaction_type="purchase", created_at=stamp
+        ))
+    db.session.commit()
+    return Transaction.query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).all()
+
+def test_cursor_round_trip():
+    stamp = datetime(2026, 1, 1, 12, 0, 5, 123)
+    cursor = encode_cursor([stamp, 42])
+    assert decode_cursor(cursor, [Transaction.created_at, Transaction.id]) == [stamp, 42]
+    
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor!", [Transaction.id])
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(["x"]), [Transaction.id])
+
+def test_api_transactions_pages_with_cursor(client, user, transactions):
+    login(client, user)
+    
+    seen = []
+    cursor = None
+    while True:
+        url = "/payment/api/transactions?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        page = client.get(url).json
+        seen.extend(t["id"] for t in page["transactions"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    
+    assert seen == [t.id for t in transactions]
+
+def test_api_transactions_rejects_bad_cursor(client, user):
+    login(client, user)
+    assert client.get("/payment/api/transactions?cursor=garbage").status_code == 400
+
+@pytest.mark.parametrize("values", [[[1, 2], 2], [None, 2], [1, 2], ["2026-01-01T12:00:00", "2"],
+                                    ["2026-01-01T12:00:00", True], ["2026-13-01", 2]])
+def test_api_transactions_rejects_malformed_cursor(client, user, values):
+    login(client, user)
+    cursor = encode_cursor(values)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, [Transaction.created_at, Transaction.id])
+    assert client.get(f"/payment/api/transactions?cursor={cursor}").status_code == 400
+
+def test_history_page_links_to_older(client, user, transactions):
+    login(client, user)
+    response = client.get("/payment/history")
+    assert response.status_code == 200
+    assert b"Older" not in response.data  # five rows fit on one page
+
+def test_admin_fingerprints_keyset_paging(client, user):
+    user.is_admin = True
+    for i in range(25):
+        db.session.add(Fingerprint(hash=f"{i:032d}", risk_score=0.0, visit_count=1))
+    db.session.commit()
+    login(client, user)
+    
+    first = client.get("/admin/fingerprint/")
+    assert first.status_code == 200
+    assert b"after=6" in first.data  # page size 20, newest first: ids 25..6
+    
+    second = client.get("/admin/fingerprint/?after=6")
+    assert second.status_code == 200
+    assert f"{4:032d}".encode() in second.data
+    assert f"{10:032d}".encode() not in second.data
+    
+    # Explicit column sort falls back to count-less offset paging
+    assert client.get("/admin/fingerprint/?sort=1&page=1").status_code == 200
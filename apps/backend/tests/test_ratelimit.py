@@ -0,0 +1,150 @@
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.fake_redis import FakeRedis
+from app.models import db, APIKey, Plan
+from app.ratelimit import CONCURRENCY_TTL, RateLimit, TwoTierStore, api_key_limits, parse_limit
+
+LIMIT = RateLimit(20, 60)
+NOW = 6000.0  # start of a window
+
+def test_parse_limit():
+    assert parse_limit("100/minute") == RateLimit(100, 60)
+    assert parse_limit("10 per second") == RateLimit(10, 1)
+    assert parse_limit("1000/5 minutes") == RateLimit(1000, 300)
+    with pytest.raises(ValueError):
+        parse_limit("lots")
+
+def test_local_bucket_limits_and_reports_remaining(app):
+    store = TwoTierStore(FakeRedis())
+    results = [store.hit("k", LIMIT, now=NOW) for _ in range(21)]
+    assert [allowed for allowed, _, _ in results] == [True] * 20 + [False]
+    assert results[0][1] == 19
+    assert results[0][2] == 60
+
+    # Tokens refill continuously, the window count resets at the boundary
+    assert store.hit("k", LIMIT, now=NOW + 30)[0] is False
+    assert store.hit("k", LIMIT, now=NOW + 60)[0] is True
+
+def test_batches_round_trips(app):
+    redis = FakeRedis()
+    store = TwoTierStore(redis, sync_batch=10, sync_interval=60)
+    for _ in range(20):
+        store.hit("k", LIMIT, now=NOW)
+    # First hit learns the global count, then one flush per batch
+    assert redis.round_trips == 2
+    store.sync(now=NOW)
+    assert redis.get(f"rl:20/60:k:{int(NOW // 60)}") == b"20"
+
+def test_global_limit_across_workers_within_tolerance(app):
+    redis = FakeRedis()
+    workers = [TwoTierStore(redis, sync_batch=2, sync_interval=60) for _ in range(3)]
+    admitted = 0
+    for i in range(300):
+        admitted += workers[i % 3].hit("k", LIMIT, now=NOW)[0]
+    assert LIMIT.amount <= admitted <= LIMIT.amount + 3 * 2
+
+def test_degrades_to_local_only_when_redis_is_down(app):
+    redis = FakeRedis()
+    redis.down = True
+    store = TwoTierStore(redis, sync_batch=1, retry_interval=0)
+
+    results = [store.hit("k", LIMIT, now=NOW)[0] for _ in range(21)]
+    assert results == [True] * 20 + [False]
+
+    # Back up: hits counted while degraded are flushed
+    redis.down = False
+    store.hit("k", LIMIT, now=NOW + 1)
+    assert not store.degraded
+    assert int(redis.get(f"rl:20/60:k:{int(NOW // 60)}")) == 20
+
+def test_requests_over_default_limit_get_429(client):
+    statuses = [client.get("/health").status_code for _ in range(101)]
+    assert statuses[:100] == [200] * 100
+    assert statuses[100] == 429
+    response = client.get("/health")
+    assert response.get_json() == {"error": "Rate limit exceeded"}
+    assert int(response.headers["Retry-After"]) >= 1
+
+def lookup(client, headers):
+    return client.get(f"/api/fingerprint/{'0' * 32}", headers=headers)
+
+def test_api_calls_limited_per_key_not_per_ip(app, client, user, api_key, api_headers):
+    app.config["RATELIMIT_DEFAULT"] = "2/minute"
+    app.config["API_RATE_LIMIT"] = "3/minute"
+    other = APIKey(user_id=user.id, key="other-api-key", name="other")
+    db.session.add(other)
+    db.session.commit()
+
+    responses = [lookup(client, api_headers) for _ in range(4)]
+    assert [r.status_code for r in responses] == [404, 404, 404, 429]
+    assert [r.headers["RateLimit-Remaining"] for r in responses] == ["2", "1", "0", "0"]
+    assert responses[0].headers["RateLimit-Limit"] == "3"
+    assert responses[0].headers["RateLimit-Policy"] == "3;w=60"
+
+    # Same IP, different key: its own budget
+    assert lookup(client, {"X-API-Key": "other-api-key"}).status_code == 404
+
+def test_plan_and_key_overrides(app, client, user, api_key, api_headers):
+    db.session.add(Plan(name="pro", rate_limit="5/minute", max_concurrent=4))
+    user.plan_name = "pro"
+    db.session.commit()
+    assert lookup(client, api_headers).headers["RateLimit-Limit"] == "5"
+
+    api_key.rate_limit = "7/minute"
+    db.session.commit()
+    assert lookup(client, api_headers).headers["RateLimit-Limit"] == "7"
+    assert api_key_limits(api_key, user) == (RateLimit(7, 60), 4)
+
+def test_limit_lookup_is_cached(app, user, api_key):
+    db.session.add(Plan(name="pro", rate_limit="5/minute", max_concurrent=0))
+    user.plan_name = "pro"
+    db.session.commit()
+    api_key_limits(api_key, user)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        for _ in range(10):
+            api_key_limits(api_key, user)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert statements == []
+
+def test_concurrency_cap(app, client, api_key, api_headers):
+    api_key.max_concurrent = 1
+    db.session.commit()
+    store = app.extensions["ratelimit"]
+
+    assert lookup(client, api_headers).status_code == 404
+    slot = store.acquire(f"key:{api_key.id}", 1)
+    assert slot is not None
+    response = lookup(client, api_headers)
+    assert response.status_code == 429
+    assert response.get_json() == {"error": "Too many concurrent requests"}
+
+    store.release(slot)
+    assert lookup(client, api_headers).status_code == 404
+    assert store.acquire(f"key:{api_key.id}", 1) is not None
+
+def test_leaked_slot_expires_while_key_stays_busy(app, monkeypatch):
+    clock = [NOW]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    # Two processes sharing Redis; the first is killed holding its slot
+    redis = FakeRedis()
+    killed, worker = TwoTierStore(redis), TwoTierStore(redis)
+    assert killed.acquire("key:1", 1) is not None
+
+    # Requests keep arriving, but the leaked slot is not renewed by them
+    for elapsed in (20, 40):
+        clock[0] = NOW + elapsed
+        assert worker.acquire("key:1", 1) is None
+    clock[0] = NOW + CONCURRENCY_TTL + 1
+    slot = worker.acquire("key:1", 1)
+    assert slot is not None
+    assert worker.acquire("key:1", 1) is None
+    worker.release(slot)
+    assert redis.zcard("rl:inflight:key:1") == 0
@@ -0,0 +1,76 @@
+import pytest
+from flask import current_app
+from sqlalchemy import insert, select
+
+from app.config import TestingConfig
+from app.main import create_app
+from app.models import db, Fingerprint, Transaction
+from app.replicas import route_reads_to_replica
+
+HASH = "f" * 32
+
+@pytest.fixture
+def app(tmp_path):
+    """Primary and one replica as two SQLite files (no replication between them)"""
+    class ReplicaConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        SQLALCHEMY_REPLICA_URIS = [f"sqlite:///{tmp_path / 'replica.db'}"]
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(app.extensions["replicas"].engines["replica_0"])
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def replica_insert(table, **values):
+    with current_app.extensions["replicas"].engines["replica_0"].begin() as conn:
+        conn.execute(insert(table).values(**values))
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+def test_lookups_read_from_replica(client, api_headers):
+    replica_insert(Fingerprint.__table__, hash=HASH, visit_count=3)
+    response = client.get(f"/api/fingerprint/{HASH}", headers=api_headers)
+    assert response.status_code == 200
+    assert response.get_json()["visit_count"] == 3
+
+def test_replica_miss_falls_back_to_primary(client, api_headers):
+    db.session.add(Fingerprint(hash=HASH, visit_count=1))
+    db.session.commit()
+    db.session.remove()
+    assert client.get(f"/api/fingerprint/{HASH}", headers=api_headers).status_code == 200
+
+def test_lagging_replica_is_skipped(app, client, api_headers):
+    router = app.extensions["replicas"]
+    router.max_lag = 1.0
+    router.lag_probe = lambda engine: 30.0
+    replica_insert(Fingerprint.__table__, hash=HASH, visit_count=3)
+    assert client.get(f"/api/fingerprint/{HASH}", headers=api_headers).status_code == 404
+
+def test_reads_after_a_write_use_primary(app, user):
+    user_id = user.id
+    with app.test_request_context():
+        route_reads_to_replica()
+        db.session.add(Transaction(user_id=user_id, amount=10, transaction_type="purchase"))
+        # Autoflush pins the request to the primary before the SELECT runs
+        assert db.session.scalars(select(Transaction)).all() != []
+        db.session.rollback()
+
+def test_user_sticks_to_primary_after_writing(client, user, api_key):
+    db.session.add(Transaction(user_id=user.id, amount=10, transaction_type="purchase"))
+    db.session.commit()
+    login(client, user)
+    key_id = api_key.id
+
+    db.session.remove()
+    assert client.get("/payment/api/transactions").get_json()["transactions"] == []
+
+    db.session.remove()
+    client.post(f"/dashboard/api-keys/{key_id}/toggle")
+    db.session.remove()
+    assert len(client.get("/payment/api/transactions").get_json()["transactions"]) == 1
@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.config import TestingConfig
+from app.features import FEATURE_NAMES, feature_matrix, feature_vector
+from app.main import create_app
+from app.models import db, COMPONENT_COLUMNS, Fingerprint
+from app.risk_model import RiskModel, train
+
+@pytest.fixture
+def app(tmp_path):
+    components, visits, labels = labeled(500)
+    path = tmp_path / "model.json"
+    train(components, visits, labels)[0].save(path)
+
+    class ModelConfig(TestingConfig):
+        RISK_MODEL_PATH = str(path)
+
+    app = create_app(ModelConfig)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def synthetic_components(rng, bot):
+    """Headless-looking bots; humans with ordinary, varied hardware (a few odd ones)"""
+    if bot:
+        return {
+            "canvas": "data:image/png;base64,x",
+            "webgl": rng.choice(["Google Inc.~SwiftShader", "unsupported", "Mesa~llvmpipe"]),
+            "audio": rng.choice(["48000_2048", "unsupported"]),
+            "fonts": rng.choice(["", "Arial"]),
+            "hardware": f"cores:{rng.choice([2, 4])}_mem:unknown_gpu:x",
+            "screen": rng.choice(["800x600_800x600_24", "1920x1080_1920x1080_24"]),
+            "browser": rng.choice(["HeadlessChrome/120", "Mozilla/5.0"]),
+            "timezone": "UTC_0",
+            "plugins": rng.choice(["none", "Chrome PDF Plugin"]),
+            "touch": "0_false",
+            "battery": "unsupported",
+            "network": "unsupported",
+            "media": rng.choice(["", "audioinput"]),
+            "colorDepth": "24_1",
+            "doNotTrack": "unknown",
+        }
+    return {
+        "canvas": "data:image/png;base64,y",
+        "webgl": rng.choice(["Intel Inc.~ANGLE", "NVIDIA~GeForce", "Apple~M1"]),
+        "audio": "48000_2048",
+        "fonts": ",".join(rng.sample(["Arial", "Verdana", "Georgia", "Impact", "Courier New"], rng.randint(2, 5))),
+        "hardware": f"cores:{rng.choice([4, 8, 12, 16])}_mem:{rng.choice([4, 8, 16])}_gpu:x",
+        "screen": rng.choice(["1920x1080_1920x1040_24", "1440x900_1440x875_24", "1024x768_1024x738_24"]),
+        "browser": "Mozilla/5.0",
+        "timezone": rng.choice(["America/New_York_300", "Europe/Berlin_-60"]),
+        "plugins": rng.choice(["Chrome PDF Plugin", "PDF Viewer,Chrome PDF Plugin", "none"]),
+        "touch": rng.choice(["0_false", "5_true"]),
+        "battery": rng.choice(["true_100", "unsupported"]),
+        "network": rng.choice(["4g_10_50", "unsupported"]),
+        "media": "audioinput,videoinput",
+        "colorDepth": rng.choice(["24_1", "24_2"]),
+        "doNotTrack": rng.choice(["unknown", "1"]),
+    }
+
+def labeled(n, seed=1):
+    rng = random.Random(seed)
+    labels = [rng.random() < 0.3 for _ in range(n)]
+    return [synthetic_components(rng, bot) for bot in labels], [rng.randint(1, 20) for _ in labels], labels
+
+def test_features_parse_components(sample_fingerprint):
+    features = dict(zip(FEATURE_NAMES, feature_vector(sample_fingerprint["components"], 1)))
+    assert features["cores"] == 8 and features["memory_gb"] == 8
+    assert (features["screen_width"], features["screen_taskbar"]) == (1920, 40)
+    assert features["timezone_offset_hours"] == 5
+    assert features["font_count"] == 2
+    assert features["webgl_missing"] == 0 and features["hardware_unknown"] == 0
+
+    broken = feature_vector({"hardware": "cores:unknown_mem:unknown_gpu:x", "screen": "garbage"}, 0)
+    assert dict(zip(FEATURE_NAMES, broken))["hardware_unknown"] == 1
+
+def test_batch_features_match_single_rows():
+    components, visits, _ = labeled(200)
+    matrix = feature_matrix(components, visits)
+    assert matrix.shape == (200, len(FEATURE_NAMES))
+    for i in (0, 57, 199):
+        assert matrix[i].tolist() == pytest.approx(feature_vector(components[i], visits[i]))
+
+def test_training_holds_false_positive_target_and_round_trips(tmp_path):
+    components, visits, labels = labeled(2000)
+    model, report = train(components, visits, labels, max_false_positive_rate=0.02)
+    assert report["model"]["false_positive_rate"] <= 0.02
+    assert report["model"]["recall"] > 0.9
+
+    path = tmp_path / "model.json"
+    model.save(path)
+    loaded = RiskModel.load(path)
+    assert loaded.score(components[0], visits[0]) == model.score(components[0], visits[0])
+    assert loaded.score_batch(components[:3], visits[:3]) == [
+        model.score(c, v)[:2] for c, v in zip(components[:3], visits[:3])
+    ]
+    with pytest.raises(ValueError):
+        RiskModel(model.weights[:-1], 0, model.mean[:-1], model.scale[:-1], features=FEATURE_NAMES[:-1])
+
+def test_submit_and_lookup_score_with_loaded_model(app, client, api_headers, sample_fingerprint):
+    model = app.extensions["risk_model"]
+    expected = model.score(sample_fingerprint["components"], 1)
+
+    submitted = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers).get_json()
+    assert (submitted["risk_score"], submitted["is_bot"]) == expected[:2]
+    response = client.get(f"/api/risk-score/{sample_fingerprint['hash']}", headers=api_headers)
+    assert response.get_json()["factors"]["model"] == model.metadata["trained_at"]
+
+def test_train_command(app, tmp_path):
+    components, visits, labels = labeled(300)
+    for i, (c, v) in enumerate(zip(components, visits)):
+        columns = {COMPONENT_COLUMNS[name]: value for name, value in c.items()}
+        db.session.add(Fingerprint(hash=f"{i:032d}", visit_count=v, **columns))
+    db.session.commit()
+    labels_csv = tmp_path / "labels.csv"
+    labels_csv.write_text(
+        "hash,is_bot\n" + "".join(f"{i:032d},{int(bot)}\n" for i, bot in enumerate(labels)) + f"{'z' * 32},1\n"
+    )
+
+    output = tmp_path / "trained.json"
+    result = app.test_cli_runner().invoke(args=["train-risk-model", str(labels_csv), "-o", str(output)])
+    assert result.exit_code == 0, result.output
+    assert "Trained on 300 of 301 labeled fingerprints" in result.output
+    assert RiskModel.load(output).threshold > 0
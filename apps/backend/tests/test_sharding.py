@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import func, select, update
+
+from app import sharding
+from app.config import TestingConfig
+from app.main import create_app
+from app.models import db, Credit, DailyUsage, Fingerprint, FingerprintShardRange
+from app.sharding import move_range
+
+LOW, MID, HIGH = "1" * 32, "9" * 32, "c" * 32
+
+@pytest.fixture
+def app(tmp_path):
+    """Main database and shards 'a' and 'b' as SQLite files"""
+    class ShardConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'main.db'}"
+        FINGERPRINT_SHARDS = {
+            "a": f"sqlite:///{tmp_path / 'a.db'}",
+            "b": f"sqlite:///{tmp_path / 'b.db'}",
+        }
+
+    app = create_app(ShardConfig)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def assign(app, *ranges):
+    for start, shard in ranges:
+        db.session.merge(FingerprintShardRange(start=start, shard=shard))
+    db.session.commit()
+    app.extensions["fingerprint_shards"].map(refresh=True)
+
+def submit(client, api_headers, sample_fingerprint, hash):
+    return client.post("/api/fingerprint", json={**sample_fingerprint, "hash": hash}, headers=api_headers)
+
+def hashes_on(app, shard):
+    engine = app.extensions["fingerprint_shards"].engine(shard)
+    with engine.connect() as conn:
+        return sorted(conn.execute(select(Fingerprint.hash)).scalars())
+
+def test_reads_and_writes_routed_by_prefix(app, client, api_headers, sample_fingerprint):
+    assign(app, ("", "a"), ("8", "b"))
+    for hash in (LOW, HIGH, HIGH):
+        assert submit(client, api_headers, sample_fingerprint, hash).status_code == 200
+
+    assert hashes_on(app, "a") == [LOW]
+    assert hashes_on(app, "b") == [HIGH]
+    assert hashes_on(app, "main") == []
+    response = client.get(f"/api/fingerprint/{HIGH}", headers=api_headers)
+    assert response.get_json()["visit_count"] == 2
+
+def test_counts_and_exports_gather_every_shard(app, client, api_headers, sample_fingerprint):
+    assign(app, ("", "a"), ("8", "b"))
+    for hash in (LOW, MID, HIGH):
+        submit(client, api_headers, sample_fingerprint, hash)
+
+    assert app.extensions["admin_stats"].refresh(exact=True).values["fingerprint_count"] == 3
+    result = app.test_cli_runner().invoke(args=["export-fingerprints"])
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 3
+
+def test_frozen_range_refuses_writes(app, client, user, api_headers, sample_fingerprint):
+    assign(app, ("", "a"))
+    db.session.get(FingerprintShardRange, "").state = "frozen"
+    db.session.commit()
+    app.extensions["fingerprint_shards"].map(refresh=True)
+
+    response = submit(client, api_headers, sample_fingerprint, LOW)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # Not billed, so the retry is charged once
+    credit = Credit.query.filter_by(user_id=user.id).one()
+    assert (credit.balance, credit.total_used) == (100, 0)
+    assert DailyUsage.query.filter_by(user_id=user.id).one().credits_used == 0
+
+def test_move_range_between_shards(app, client, api_headers, sample_fingerprint):
+    for hash in (LOW, MID, HIGH):
+        submit(client, api_headers, sample_fingerprint, hash)
+
+    assert move_range("8", None, "b", settle=0, echo=lambda line: None) == 2
+    assert hashes_on(app, "main") == [LOW]
+    assert hashes_on(app, "b") == [MID, HIGH]
+    ranges = db.session.scalars(select(FingerprintShardRange).order_by(FingerprintShardRange.start))
+    assert [(r.start, r.shard, r.state) for r in ranges] == [("", "main", None), ("8", "b", None)]
+
+    move_range("", None, "a", settle=0, echo=lambda line: None)
+    assert hashes_on(app, "a") == [LOW, MID, HIGH]
+    assert hashes_on(app, "b") == []
+    assert db.session.scalar(select(func.count()).select_from(FingerprintShardRange)) == 1
+    assert client.get(f"/api/fingerprint/{MID}", headers=api_headers).status_code == 200
+
+def test_move_catches_up_writes_made_during_the_copy(app, client, api_headers, sample_fingerprint, monkeypatch):
+    submit(client, api_headers, sample_fingerprint, LOW)
+    sleeps = []
+
+    def write_during_freeze(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            # A process that has not seen the freeze yet updates the source
+            with db.engine.begin() as conn:
+                conn.execute(update(Fingerprint).values(visit_count=7, last_seen=func.now()))
+
+    monkeypatch.setattr(sharding.time, "sleep", write_during_freeze)
+    move_range("", None, "a", settle=0, echo=lambda line: None)
+
+    engine = app.extensions["fingerprint_shards"].engine("a")
+    with engine.connect() as conn:
+        assert conn.execute(select(Fingerprint.visit_count)).scalar() == 7
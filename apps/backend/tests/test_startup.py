@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+from app.admin import SecureModelView
+from app.config import TestingConfig
+from app.main import create_app, warm_app
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous budget for a cold interpreter; the point is to catch regressions
+# like import-time DB access or eager heavy imports, not to micro-time
+STARTUP_BUDGET_SECONDS = 5.0
+
+def run_python(code):
+    env = dict(
+        os.environ,
+        SECRET_KEY="startup-test",
+        # Unreachable database: any connection attempt at boot would fail
+        DATABASE_URL="postgresql://nobody@127.0.0.1:1/none",
+        FLASK_ENV="production",
+    )
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+
+def test_import_does_not_create_app():
+    result = run_python(
+        "import sys, app.main as m\n"
+        "assert 'app' not in vars(m)\n"
+        "assert 'stripe' not in sys.modules\n"
+    )
+    assert result.returncode == 0, result.stderr
+
+def test_production_boot_does_not_touch_database():
+    result = run_python(
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "from app.main import create_app\n"
+        "create_app()\n"
+        "print(time.perf_counter() - start)\n"
+        "assert 'stripe' not in sys.modules\n"
+    )
+    assert result.returncode == 0, result.stderr
+    assert float(result.stdout.strip()) < STARTUP_BUDGET_SECONDS
+
+def test_admin_views_scaffold_lazily():
+    app = create_app(TestingConfig)
+    views = [v for v in app.extensions['sixfinger_admin']._views if isinstance(v, SecureModelView)]
+    assert views
+    assert not any(v._cache_ready for v in views)
+    
+    warm_app(app)
+    assert all(v._cache_ready for v in views)
+    assert views[0]._list_columns
+
+def test_init_db_command():
+    class Config(TestingConfig):
+        AUTO_CREATE_SCHEMA = False
+
+    app = create_app(Config)
+    result = app.test_cli_runner().invoke(args=["init-db"])
+    assert result.exit_code == 0
+    assert "created" in result.output
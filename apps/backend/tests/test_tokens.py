@@ -0,0 +1,118 @@
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.config import TestingConfig
+from app.main import create_app
+from app.models import db, APIKey, Credit, TokenRevocation
+from app.tokens import APITokens
+
+@pytest.fixture
+def app():
+    class TokenConfig(TestingConfig):
+        API_TOKEN_TTL = 60
+
+    app = create_app(TokenConfig)
+    with app.app_context():
+        # Sync by hand instead of from the background thread
+        app.extensions["api_tokens"].start = lambda: None
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def tokens(app):
+    tokens = app.extensions["api_tokens"]
+    tokens.sync()
+    return tokens
+
+@pytest.fixture
+def token(client, api_headers, tokens):
+    response = client.post("/api/token", headers=api_headers)
+    assert response.status_code == 200
+    return response.get_json()["token"]
+
+@pytest.fixture
+def queries(app):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", listener)
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+def test_token_authenticates_without_key_or_user_queries(client, user, token, tokens, queries, sample_fingerprint):
+    queries.clear()
+    response = client.post("/api/fingerprint", json=sample_fingerprint, headers={"X-API-Key": token})
+
+    assert response.status_code == 200
+    assert response.get_json()["credits_remaining"] == 99
+    assert not any("FROM api_keys" in sql or "FROM users" in sql for sql in queries)
+    assert tokens.stats()["verified"] == 1 and tokens.database_checks == 0
+    assert db.session.get(Credit, user.id).total_used == 1
+
+def test_invalid_expired_and_chained_tokens(client, api_key, token, tokens):
+    body, signature = token.rsplit(".", 1)
+    forged = body[:-2] + ("AA" if body[-2:] != "AA" else "BB") + "." + signature
+    for value, error in [(forged, "Invalid API token"), (token + "x", "Invalid API token"),
+                         ("sft1.garbage", "Invalid API token")]:
+        response = client.get(f"/api/fingerprint/{'a' * 32}", headers={"X-API-Key": value})
+        assert (response.status_code, response.get_json()["error"]) == (401, error)
+
+    expired, _ = tokens.mint(api_key, api_key.user, now=time.time() - 120)
+    response = client.get(f"/api/fingerprint/{'a' * 32}", headers={"X-API-Key": expired})
+    assert response.get_json()["error"] == "API token expired"
+
+    response = client.post("/api/token", headers={"X-API-Key": token})
+    assert response.status_code == 400
+
+def test_disabling_key_in_dashboard_revokes_tokens(app, client, user, api_key, token, tokens):
+    headers = {"X-API-Key": token}
+    login(client, user)
+    client.post(f"/dashboard/api-keys/{api_key.id}/toggle")
+
+    # Refused right away in this process, and by others once they sync
+    assert client.get(f"/api/fingerprint/{'a' * 32}", headers=headers).status_code == 401
+    other = APITokens(app, b"another process", ttl=60)
+    other.sync()
+    assert other.stats()["revocations"] == 1
+
+    client.post(f"/dashboard/api-keys/{api_key.id}/toggle")
+    tokens.sync()
+    assert client.get(f"/api/fingerprint/{'a' * 32}", headers=headers).status_code == 404
+    assert TokenRevocation.query.count() == 0
+
+def test_deactivated_user_and_deleted_key(client, user, api_key, token, tokens):
+    user.is_active = False
+    db.session.commit()
+    tokens.sync()
+    assert client.get(f"/api/fingerprint/{'a' * 32}", headers={"X-API-Key": token}).status_code == 401
+
+    user.is_active = True
+    db.session.delete(api_key)
+    db.session.commit()
+    tokens.sync()
+    assert {(r.subject, r.subject_id) for r in TokenRevocation.query} == {("key", api_key.id)}
+    assert client.get(f"/api/fingerprint/{'a' * 32}", headers={"X-API-Key": token}).status_code == 401
+
+def test_stale_revocation_list_checks_the_database(client, api_key, token, tokens):
+    headers = {"X-API-Key": token}
+    tokens._synced_at = time.monotonic() - tokens.max_age - 1
+    assert not tokens.fresh()
+    assert client.get(f"/api/fingerprint/{'a' * 32}", headers=headers).status_code == 404
+    assert tokens.database_checks == 1
+
+    # A revocation the list has not seen yet
+    db.session.execute(APIKey.__table__.update().values(is_active=False))
+    db.session.commit()
+    assert client.get(f"/api/fingerprint/{'a' * 32}", headers=headers).status_code == 401
+
+def test_opaque_keys_still_work_and_tokens_can_be_off(app, client, api_headers):
+    assert client.get(f"/api/fingerprint/{'a' * 32}", headers=api_headers).status_code == 404
+    app.extensions["api_tokens"] = None
+    assert client.post("/api/token", headers=api_headers).status_code == 404
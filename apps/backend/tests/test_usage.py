@@ -0,0 +1,87 @@
+from datetime import date, datetime, timedelta
+
+from app.models import db, APIKey, DailyUsage, Transaction, UsageCounter, UsageRollup
+from app.usage import get_usage_series, rebuild_usage_counters, record_usage
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+def test_debit_increments_counters(client, api_headers, sample_fingerprint, user):
+    for _ in range(3):
+        client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    
+    db.session.expire_all()
+    assert db.session.get(UsageCounter, user.id).api_calls == 3
+    daily = DailyUsage.query.filter_by(user_id=user.id).one()
+    assert daily.api_calls == 3
+    assert daily.credits_used == 3
+
+def test_stats_endpoint_reads_counters(client, api_headers, sample_fingerprint, user):
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    rebuild_usage_counters()
+    login(client, user)
+    
+    response = client.get("/dashboard/api/stats")
+    assert response.status_code == 200
+    assert response.json["api_calls"] == 1
+    assert response.json["active_keys"] == 1
+    assert response.json["credits"]["total_used"] == 1
+
+def test_toggle_key_adjusts_active_keys(client, api_key, user):
+    rebuild_usage_counters()
+    login(client, user)
+    
+    client.post(f"/dashboard/api-keys/{api_key.id}/toggle")
+    assert client.get("/dashboard/api/stats").json["active_keys"] == 0
+    
+    client.post(f"/dashboard/api-keys/{api_key.id}/toggle")
+    assert client.get("/dashboard/api/stats").json["active_keys"] == 1
+
+def test_reconcile_rebuilds_from_rollups(client, api_headers, sample_fingerprint, user):
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    
+    # Corrupt the counters, then rebuild them
+    UsageCounter.query.delete()
+    DailyUsage.query.delete()
+    db.session.add(APIKey(user_id=user.id, key="inactive", name="Old", is_active=False))
+    db.session.commit()
+    
+    assert rebuild_usage_counters(user.id) == 1
+    counter = db.session.get(UsageCounter, user.id)
+    assert counter.api_calls == 2
+    assert counter.active_keys == 1
+    assert DailyUsage.query.filter_by(user_id=user.id).one().day <= date.today()
+
+def test_usage_recorded_in_rollups_not_transactions(client, api_headers, api_key, sample_fingerprint, user):
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    
+    assert Transaction.query.filter_by(user_id=user.id).count() == 0
+    rollup = UsageRollup.query.filter_by(user_id=user.id).one()
+    assert rollup.api_key_id == api_key.id
+    assert rollup.endpoint == "api_blueprint.submit_fingerprint"
+    assert rollup.calls == 2
+    assert rollup.credits_used == 2
+
+def test_usage_series_resolutions(app, user):
+    start = datetime(2026, 3, 1, 10, 0)
+    for minute in (0, 1, 1, 61):
+        record_usage(user.id, 1, api_key_id=1, endpoint="e", when=start + timedelta(minutes=minute))
+    db.session.commit()
+    
+    minutes = get_usage_series(user.id, start, start + timedelta(hours=2), resolution='minute')
+    assert [p.api_calls for p in minutes] == [1, 2, 1]
+    
+    hours = get_usage_series(user.id, start, start + timedelta(hours=2), resolution='hour')
+    assert [p.api_calls for p in hours] == [3, 1]
+    
+    days = get_usage_series(user.id, start, start + timedelta(days=1), resolution='day')
+    assert [(p.api_calls, p.credits_used) for p in days] == [(4, 4)]
+
+def test_usage_api_rejects_unknown_range(client, user):
+    login(client, user)
+    assert client.get("/dashboard/api/usage?range=5y").status_code == 400
+    assert client.get("/dashboard/api/usage?range=24h").json["resolution"] == "hour"
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import event
+
+from app.models import db, Credit, User
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+@pytest.fixture
+def queries(app):
+    """SQL statements run while the fixture is active"""
+    engine = db.engine
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    yield statements
+    event.remove(engine, "before_cursor_execute", listener)
+
+def test_dashboard_queries_with_warm_cache(app, user, queries):
+    client = app.test_client()
+    login(client, user)
+    user_id = user.id
+
+    # Requests share the test's app context, so drop the session (and its
+    # identity map) before each one as a new request would
+    db.session.remove()
+    client.get("/dashboard/")
+    db.session.remove()
+    queries.clear()
+    response = client.get("/dashboard/")
+
+    assert response.status_code == 200
+    assert b"100" in response.data
+    assert not any("FROM users" in sql for sql in queries)
+    assert len(queries) <= 2
+    assert app.extensions["user_cache"]._get(user_id) is not None
+
+def test_cached_current_user_changes_are_saved(app, user):
+    client = app.test_client()
+    login(client, user)
+    client.get("/dashboard/")
+
+    response = client.post("/auth/change-password", data={
+        "current_password": "password123",
+        "new_password": "new-password-1",
+        "new_password_confirm": "new-password-1",
+    })
+    assert response.status_code == 302
+
+    db.session.expire_all()
+    assert db.session.get(User, user.id).check_password("new-password-1")
+
+def test_updates_invalidate_cached_user(app, user):
+    cache = app.extensions["user_cache"]
+    cache.load(user.id)
+    assert cache._get(user.id) is not None
+
+    user.is_active = False
+    db.session.commit()
+    assert cache._get(user.id) is None
+
+    cache.load(user.id)
+    Credit.query.filter_by(user_id=user.id).one().balance = 5
+    db.session.commit()
+    assert cache._get(user.id) is None
+
+def test_cache_hit_has_credits_without_query(app, user, queries):
+    cache = app.extensions["user_cache"]
+    cache.load(user.id)
+    db.session.remove()
+
+    queries.clear()
+    cached = cache.load(user.id)
+    assert cached.credits.balance == 100
+    assert cached.username == "tester"
+    assert queries == []
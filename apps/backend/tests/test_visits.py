@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.config import TestingConfig
+from app.main import create_app
+from app.models import db, APIKey, FingerprintVisit, User
+from app.visits import drop_expired, hash_key, interarrival_stats, pack_ip, unpack_ip
+
+@pytest.fixture
+def app():
+    class VisitConfig(TestingConfig):
+        VISIT_LOG = "thread"
+        VISIT_LOG_BATCH_SIZE = 2
+
+    app = create_app(VisitConfig)
+    with app.app_context():
+        # Flush by hand instead of from the background thread
+        app.extensions["visit_log"].start = lambda: None
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def visit_count():
+    return db.session.scalar(select(func.count()).select_from(FingerprintVisit))
+
+def test_compact_keys_and_addresses():
+    assert hash_key("a" * 32) == hash_key("a" * 32) != hash_key("b" * 32)
+    assert -2**63 <= hash_key("a" * 32) < 2**63
+    assert len(pack_ip("203.0.113.7")) == 4
+    assert unpack_ip(pack_ip("2001:db8::1")) == "2001:db8::1"
+    assert pack_ip("not an address") is None
+
+def test_submits_are_buffered_then_written_in_batches(app, client, api_headers, sample_fingerprint):
+    log = app.extensions["visit_log"]
+    for _ in range(3):
+        client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers)
+    assert visit_count() == 0
+    assert log.stats()["buffered"] == 3
+
+    assert log.flush() == 3
+    assert visit_count() == 3
+    assert log.stats() == {"buffered": 0, "written": 3, "dropped": 0, "errors": 0}
+
+def test_full_buffer_drops_instead_of_blocking(app):
+    log = app.extensions["visit_log"]
+    log.max_buffer = 2
+    for _ in range(5):
+        log.record("a" * 32, 1, "10.0.0.1")
+    assert log.stats()["buffered"] == 2
+    assert log.dropped == 3
+
+def test_timeline_and_interarrival(app, client, user, api_key, api_headers):
+    someone = User(username="someone", email="someone@example.com")
+    someone.set_password("password123")
+    db.session.add(someone)
+    db.session.flush()
+    other = APIKey(user_id=someone.id, name="Someone else", key="sk_other")
+    db.session.add(other)
+    db.session.commit()
+    log = app.extensions["visit_log"]
+    start = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+    for i, seconds in enumerate((0, 10, 20, 30)):
+        key_id = api_key.id if i % 2 == 0 else other.id
+        log.record("v" * 32, key_id, f"10.0.0.{i}", when=start + timedelta(seconds=seconds))
+    log.flush()
+
+    response = client.get(f"/api/fingerprint/{'v' * 32}/visits", headers=api_headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    # Only visits through the caller's keys, newest first
+    assert [v["ip"] for v in data["visits"]] == ["10.0.0.2", "10.0.0.0"]
+    assert data["interarrival"]["visits"] == 4
+    assert data["interarrival"]["mean_seconds"] == 10
+    assert data["interarrival"]["coefficient_of_variation"] == 0
+
+    assert client.get(f"/api/fingerprint/{'w' * 32}/visits", headers=api_headers).status_code == 404
+    assert client.get(f"/api/fingerprint/{'v' * 32}/visits?limit=0", headers=api_headers).status_code == 400
+
+def test_retention_and_stats_edge_cases(app):
+    log = app.extensions["visit_log"]
+    today = datetime.now(timezone.utc)
+    log.record("r" * 32, 1, None, when=today - timedelta(days=40))
+    log.record("r" * 32, 1, None, when=today)
+    log.flush()
+
+    assert drop_expired(db.engine, retention_days=30) == 1
+    assert visit_count() == 1
+    assert interarrival_stats([today])["mean_seconds"] is None
@@ -0,0 +1,97 @@
+import json
+import time
+
+import pytest
+
+from app.models import db, Credit, Transaction, WebhookEvent
+from app.webhooks import WebhookWorker, process_pending_events
+from bench.stripe_standin import StripeStandIn, checkout_completed_event, client_sender, sign_payload
+
+SECRET = "whsec_test"
+
+@pytest.fixture
+def stripe(app, client):
+    app.config["STRIPE_WEBHOOK_SECRET"] = SECRET
+    return StripeStandIn(SECRET, client_sender(client))
+
+def test_webhook_acknowledges_and_dedupes(client, stripe, user):
+    event = checkout_completed_event(user.id, 500)
+    assert stripe.deliver(event)[-1][0] == 200
+
+    response = client.post(
+        "/payment/webhook",
+        data=json.dumps(event).encode(),
+        headers={"Stripe-Signature": sign_payload(json.dumps(event).encode(), SECRET)},
+    )
+    assert response.get_json() == {"status": "duplicate"}
+
+    # Nothing is applied in the request
+    assert Credit.query.filter_by(user_id=user.id).one().balance == 100
+    assert WebhookEvent.query.one().status == "pending"
+
+    assert process_pending_events() == 1
+    assert process_pending_events() == 0
+    credit = Credit.query.filter_by(user_id=user.id).one()
+    db.session.refresh(credit)
+    assert credit.balance == 600
+    assert WebhookEvent.query.one().status == "processed"
+
+def test_same_payment_in_two_events_credited_once(stripe, user):
+    first = checkout_completed_event(user.id, 500, payment_intent="pi_same")
+    second = checkout_completed_event(user.id, 500, payment_intent="pi_same")
+    stripe.deliver(first)
+    stripe.deliver(second)
+
+    assert process_pending_events() == 2
+    assert Transaction.query.filter_by(stripe_payment_id="pi_same").count() == 1
+    credit = Credit.query.filter_by(user_id=user.id).one()
+    db.session.refresh(credit)
+    assert credit.balance == 600
+    assert {e.status for e in WebhookEvent.query} == {"processed"}
+
+def test_invalid_signature_rejected(client, stripe, user):
+    payload = json.dumps(checkout_completed_event(user.id, 500)).encode()
+    response = client.post(
+        "/payment/webhook", data=payload,
+        headers={"Stripe-Signature": sign_payload(payload, "whsec_wrong")}
+    )
+    assert response.status_code == 400
+    assert WebhookEvent.query.count() == 0
+
+def test_failed_event_retried_then_marked_failed(app, stripe):
+    stripe.deliver(checkout_completed_event(9999, 500))
+
+    assert process_pending_events(max_attempts=2) == 1
+    event = WebhookEvent.query.one()
+    assert (event.status, event.attempts) == ("pending", 1)
+    assert "9999" in event.last_error
+
+    # Backoff: not due yet
+    assert process_pending_events(max_attempts=2) == 0
+    event.available_at = event.received_at
+    db.session.commit()
+    process_pending_events(max_attempts=2)
+    assert WebhookEvent.query.one().status == "failed"
+
+def test_unhandled_event_type_ignored(stripe, user):
+    event = checkout_completed_event(user.id, 500)
+    event["type"] = "customer.created"
+    stripe.deliver(event)
+    process_pending_events()
+    assert WebhookEvent.query.one().status == "ignored"
+    assert Transaction.query.count() == 0
+
+def test_worker_thread_applies_events(app, stripe, user):
+    stripe.deliver(checkout_completed_event(user.id, 500))
+    worker = WebhookWorker(app, poll_interval=0.05)
+    worker.notify()
+    try:
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            db.session.expire_all()
+            if WebhookEvent.query.one().status == "processed":
+                break
+            time.sleep(0.05)
+    finally:
+        worker.stop(timeout=5)
+    assert WebhookEvent.query.one().status == "processed"
@@ -0,0 +1,84 @@
+import gzip
+
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+cbor2 = pytest.importorskip("cbor2")
+
+from app.importer import detect_format, import_fingerprints, open_import_file
+from app.models import Fingerprint
+
+def post(client, body, content_type, headers, encoding=None):
+    headers = dict(headers, **{"Content-Type": content_type})
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return client.post("/api/fingerprint", data=body, headers=headers)
+
+@pytest.mark.parametrize("content_type, loads, dumps", [
+    ("application/msgpack", msgpack.unpackb, msgpack.packb),
+    ("application/cbor", cbor2.loads, cbor2.dumps),
+])
+def test_binary_submit_answers_in_kind(client, api_headers, sample_fingerprint, content_type, loads, dumps):
+    json_data = client.post("/api/fingerprint", json=sample_fingerprint, headers=api_headers).get_json()
+
+    response = post(client, dumps(sample_fingerprint), content_type, api_headers)
+    assert response.status_code == 200
+    assert response.mimetype == content_type
+    data = loads(response.data)
+    assert data["hash"] == sample_fingerprint["hash"]
+    assert data["visit_count"] == 2
+    assert data["first_seen"] == json_data["first_seen"]
+
+def test_compressed_bodies(client, api_headers, sample_fingerprint):
+    zstandard = pytest.importorskip("zstandard")
+    body = msgpack.packb(sample_fingerprint)
+    assert post(client, gzip.compress(body), "application/msgpack", api_headers, "gzip").status_code == 200
+    compressed = zstandard.ZstdCompressor().compress(body)
+    response = post(client, compressed, "application/msgpack", api_headers, "zstd")
+    assert msgpack.unpackb(response.data)["visit_count"] == 2
+
+    assert post(client, body, "application/msgpack", api_headers, "br").status_code == 415
+    assert post(client, b"not gzip", "application/msgpack", api_headers, "gzip").status_code == 400
+
+def test_decompression_limit(app, client, api_headers, sample_fingerprint):
+    app.config["WIRE_MAX_DECODED_BYTES"] = 64
+    body = gzip.compress(msgpack.packb(sample_fingerprint))
+    response = post(client, body, "application/msgpack", api_headers, "gzip")
+    assert response.status_code == 413
+    assert msgpack.unpackb(response.data) == {"error": "Decompressed body is too large"}
+
+def test_errors_match_request_format(client, api_headers, sample_fingerprint):
+    response = post(client, msgpack.packb({"hash": "short"}), "application/msgpack", api_headers)
+    assert response.status_code == 422
+    assert msgpack.unpackb(response.data)["error"] == "Validation failed"
+
+    assert post(client, b"\xc1", "application/msgpack", api_headers).status_code == 400
+    # From the auth decorator
+    response = post(client, cbor2.dumps(sample_fingerprint), "application/cbor", {})
+    assert (response.status_code, response.mimetype) == (401, "application/cbor")
+    assert cbor2.loads(response.data) == {"error": "API key required"}
+
+@pytest.mark.parametrize("content_type, body", [
+    ("application/msgpack", b"\xff\xff"),
+    ("application/msgpack", b"\x91" * 100000),
+    ("application/msgpack", b"\x81\x90\x00"),
+    ("application/cbor", b"\xff\xff"),
+    ("application/cbor", b"\x81" * 100000),
+    ("application/cbor", b"\xa1"),
+])
+def test_malformed_bodies_are_rejected(client, api_headers, content_type, body):
+    response = post(client, body, content_type, api_headers)
+    assert response.status_code == 400
+    assert response.mimetype == content_type
+
+def test_import_msgpack_stream(app, tmp_path, sample_fingerprint):
+    path = tmp_path / "fingerprints.msgpack.gz"
+    records = [dict(sample_fingerprint, hash=f"{i:032d}") for i in range(3)]
+    path.write_bytes(gzip.compress(b"".join(msgpack.packb(r) for r in records + [{"hash": "bad"}])))
+
+    assert detect_format(str(path)) == "msgpack"
+    with open_import_file(str(path), "msgpack") as fh:
+        report = import_fingerprints(fh, fmt="msgpack", workers=1)
+    assert (report.imported, report.rejected) == (3, 1)
+    assert report.errors[0][0] == 4
+    assert Fingerprint.query.count() == 3
@@ -0,0 +1,61 @@
+/**
+ * @jest-environment node
+ */
+import {
+  decodeCBOR,
+  decodeMsgPack,
+  decodeResponse,
+  encodeCBOR,
+  encodeFingerprintRequest,
+  encodeMsgPack
+} from '../wire';
+
+const hex = (data: Uint8Array) => Buffer.from(data).toString('hex');
+
+describe('wire formats', () => {
+  const value = {
+    hash: 'a'.repeat(32),
+    count: 300,
+    negative: -200,
+    big: 2 ** 40,
+    ratio: 1.5,
+    flags: [true, false, null],
+    long: 'x'.repeat(70000),
+    skipped: undefined
+  };
+
+  it('should encode MessagePack like the reference encoders', () => {
+    expect(hex(encodeMsgPack({ a: 1 }))).toBe('81a16101');
+    expect(hex(encodeMsgPack([-1, -33, 255, 65536]))).toBe('94ffd0dfccffce00010000');
+    expect(hex(encodeMsgPack(1.5))).toBe('cb3ff8000000000000');
+  });
+
+  it('should encode CBOR like RFC 8949 examples', () => {
+    expect(hex(encodeCBOR({ a: 1 }))).toBe('a1616101');
+    expect(hex(encodeCBOR([-1, -500, 1000000]))).toBe('83203901f31a000f4240');
+    expect(hex(encodeCBOR('ü'))).toBe('62c3bc');
+  });
+
+  it('should round-trip values through both formats', () => {
+    const { skipped, ...expected } = value;
+    expect(skipped).toBeUndefined();
+    expect(decodeMsgPack(encodeMsgPack(value))).toEqual(expected);
+    expect(decodeCBOR(encodeCBOR(value))).toEqual(expected);
+  });
+
+  it('should reject truncated and trailing data', () => {
+    expect(() => decodeMsgPack(new Uint8Array([0xa5, 0x61]))).toThrow('Unexpected end of data');
+    expect(() => decodeCBOR(new Uint8Array([0x01, 0x02]))).toThrow('Unexpected data after the value');
+  });
+
+  it('should build fingerprint requests and read responses by content type', async () => {
+    const result = { hash: 'b'.repeat(32), components: { canvas: 'data:x' } as any };
+    const request = await encodeFingerprintRequest(result, { format: 'msgpack' });
+
+    expect(request.headers).toEqual({ 'Content-Type': 'application/msgpack' });
+    expect(decodeMsgPack(request.body)).toEqual(result);
+    expect(decodeResponse(encodeCBOR({ ok: true }), 'application/cbor')).toEqual({ ok: true });
+    expect(decodeResponse(new TextEncoder().encode('{"ok":1}'), 'application/json; charset=utf-8'))
+      .toEqual({ ok: 1 });
+  });
+});
@@ -70,3 +70,4 @@ export async function getFingerprint(): Promise<FingerprintResult> {
 // Export signal functions for advanced usage
 export * from './signals';
 export * from './hash';
+export * from './wire';
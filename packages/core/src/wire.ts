@@ -0,0 +1,550 @@
+/**
+ * Compact wire formats for submitting fingerprints
+ * Encodes request bodies as MessagePack or CBOR (optionally gzip-compressed)
+ * and decodes the API's responses, which come back in the request's format.
+ */
+
+import type { FingerprintResult } from './index';
+
+export type WireFormat = 'json' | 'msgpack' | 'cbor';
+
+export type WireValue =
+  | null
+  | boolean
+  | number
+  | string
+  | Uint8Array
+  | WireValue[]
+  | { [key: string]: WireValue | undefined };
+
+export const CONTENT_TYPES: Record<WireFormat, string> = {
+  json: 'application/json',
+  msgpack: 'application/msgpack',
+  cbor: 'application/cbor'
+};
+
+export interface EncodeOptions {
+  format?: WireFormat;
+  /** Gzip the body (needs CompressionStream; sent uncompressed otherwise) */
+  compress?: boolean;
+}
+
+export interface EncodedRequest {
+  body: Uint8Array;
+  headers: Record<string, string>;
+}
+
+/**
+ * Growable byte buffer
+ */
+class Writer {
+  private bytes = new Uint8Array(256);
+  private view = new DataView(this.bytes.buffer);
+  private length = 0;
+
+  private reserve(size: number): number {
+    if (this.length + size > this.bytes.length) {
+      const grown = new Uint8Array(Math.max(this.bytes.length * 2, this.length + size));
+      grown.set(this.bytes.subarray(0, this.length));
+      this.bytes = grown;
+      this.view = new DataView(grown.buffer);
+    }
+    const offset = this.length;
+    this.length += size;
+    return offset;
+  }
+
+  // reserve() may swap the buffer, so it runs before this.bytes/this.view are read
+
+  u8(value: number): void {
+    const offset = this.reserve(1);
+    this.bytes[offset] = value;
+  }
+
+  u16(value: number): void {
+    const offset = this.reserve(2);
+    this.view.setUint16(offset, value);
+  }
+
+  u32(value: number): void {
+    const offset = this.reserve(4);
+    this.view.setUint32(offset, value);
+  }
+
+  u64(value: number): void {
+    this.u32(Math.floor(value / 0x100000000));
+    this.u32(value >>> 0);
+  }
+
+  f64(value: number): void {
+    const offset = this.reserve(8);
+    this.view.setFloat64(offset, value);
+  }
+
+  raw(data: Uint8Array): void {
+    const offset = this.reserve(data.length);
+    this.bytes.set(data, offset);
+  }
+
+  result(): Uint8Array {
+    return this.bytes.slice(0, this.length);
+  }
+}
+
+/**
+ * Bounds-checked byte reader
+ */
+class Reader {
+  private view: DataView;
+  private offset = 0;
+
+  constructor(private bytes: Uint8Array) {
+    this.view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  }
+
+  private advance(size: number): number {
+    if (this.offset + size > this.bytes.length) {
+      throw new Error('Unexpected end of data');
+    }
+    const offset = this.offset;
+    this.offset += size;
+    return offset;
+  }
+
+  u8(): number {
+    return this.view.getUint8(this.advance(1));
+  }
+
+  u16(): number {
+    return this.view.getUint16(this.advance(2));
+  }
+
+  u32(): number {
+    return this.view.getUint32(this.advance(4));
+  }
+
+  u64(): number {
+    return this.u32() * 0x100000000 + this.u32();
+  }
+
+  i8(): number {
+    return this.view.getInt8(this.advance(1));
+  }
+
+  i16(): number {
+    return this.view.getInt16(this.advance(2));
+  }
+
+  i32(): number {
+    return this.view.getInt32(this.advance(4));
+  }
+
+  i64(): number {
+    return this.i32() * 0x100000000 + this.u32();
+  }
+
+  f32(): number {
+    return this.view.getFloat32(this.advance(4));
+  }
+
+  f64(): number {
+    return this.view.getFloat64(this.advance(8));
+  }
+
+  raw(size: number): Uint8Array {
+    const offset = this.advance(size);
+    return this.bytes.slice(offset, offset + size);
+  }
+
+  text(size: number): string {
+    return utf8Decode(this.raw(size));
+  }
+
+  done(): boolean {
+    return this.offset === this.bytes.length;
+  }
+}
+
+// Created on first use: some environments (e.g. jsdom) lack TextEncoder
+let textEncoder: TextEncoder | undefined;
+let textDecoder: TextDecoder | undefined;
+
+function utf8Encode(text: string): Uint8Array {
+  textEncoder = textEncoder ?? new TextEncoder();
+  return textEncoder.encode(text);
+}
+
+function utf8Decode(data: Uint8Array): string {
+  textDecoder = textDecoder ?? new TextDecoder();
+  return textDecoder.decode(data);
+}
+
+function entries(value: { [key: string]: WireValue | undefined }): [string, WireValue][] {
+  // Like JSON.stringify, undefined members are left out
+  return Object.entries(value).filter(([, item]) => item !== undefined) as [string, WireValue][];
+}
+
+function finish<T>(reader: Reader, value: T): T {
+  if (!reader.done()) {
+    throw new Error('Unexpected data after the value');
+  }
+  return value;
+}
+
+// MessagePack
+
+function packValue(writer: Writer, value: WireValue): void {
+  if (value === null) {
+    writer.u8(0xc0);
+  } else if (typeof value === 'boolean') {
+    writer.u8(value ? 0xc3 : 0xc2);
+  } else if (typeof value === 'number') {
+    if (Number.isSafeInteger(value) && value >= 0) {
+      if (value < 0x80) {
+        writer.u8(value);
+      } else if (value < 0x100) {
+        writer.u8(0xcc);
+        writer.u8(value);
+      } else if (value < 0x10000) {
+        writer.u8(0xcd);
+        writer.u16(value);
+      } else if (value < 0x100000000) {
+        writer.u8(0xce);
+        writer.u32(value);
+      } else {
+        writer.u8(0xcf);
+        writer.u64(value);
+      }
+    } else if (Number.isInteger(value) && value >= -0x80000000) {
+      if (value >= -32) {
+        writer.u8(value & 0xff);
+      } else if (value >= -0x80) {
+        writer.u8(0xd0);
+        writer.u8(value & 0xff);
+      } else if (value >= -0x8000) {
+        writer.u8(0xd1);
+        writer.u16(value & 0xffff);
+      } else {
+        writer.u8(0xd2);
+        writer.u32(value >>> 0);
+      }
+    } else {
+      writer.u8(0xcb);
+      writer.f64(value);
+    }
+  } else if (typeof value === 'string') {
+    const bytes = utf8Encode(value);
+    if (bytes.length < 32) {
+      writer.u8(0xa0 | bytes.length);
+    } else if (bytes.length < 0x100) {
+      writer.u8(0xd9);
+      writer.u8(bytes.length);
+    } else if (bytes.length < 0x10000) {
+      writer.u8(0xda);
+      writer.u16(bytes.length);
+    } else {
+      writer.u8(0xdb);
+      writer.u32(bytes.length);
+    }
+    writer.raw(bytes);
+  } else if (value instanceof Uint8Array) {
+    if (value.length < 0x100) {
+      writer.u8(0xc4);
+      writer.u8(value.length);
+    } else if (value.length < 0x10000) {
+      writer.u8(0xc5);
+      writer.u16(value.length);
+    } else {
+      writer.u8(0xc6);
+      writer.u32(value.length);
+    }
+    writer.raw(value);
+  } else if (Array.isArray(value)) {
+    if (value.length < 16) {
+      writer.u8(0x90 | value.length);
+    } else if (value.length < 0x10000) {
+      writer.u8(0xdc);
+      writer.u16(value.length);
+    } else {
+      writer.u8(0xdd);
+      writer.u32(value.length);
+    }
+    value.forEach(item => packValue(writer, item));
+  } else {
+    const members = entries(value);
+    if (members.length < 16) {
+      writer.u8(0x80 | members.length);
+    } else if (members.length < 0x10000) {
+      writer.u8(0xde);
+      writer.u16(members.length);
+    } else {
+      writer.u8(0xdf);
+      writer.u32(members.length);
+    }
+    members.forEach(([key, item]) => {
+      packValue(writer, key);
+      packValue(writer, item);
+    });
+  }
+}
+
+function unpackArray(reader: Reader, size: number): WireValue[] {
+  const items: WireValue[] = [];
+  for (let i = 0; i < size; i++) {
+    items.push(unpackValue(reader));
+  }
+  return items;
+}
+
+function unpackMap(reader: Reader, size: number): { [key: string]: WireValue } {
+  const map: { [key: string]: WireValue } = {};
+  for (let i = 0; i < size; i++) {
+    map[String(unpackValue(reader))] = unpackValue(reader);
+  }
+  return map;
+}
+
+function unpackValue(reader: Reader): WireValue {
+  const type = reader.u8();
+  if (type < 0x80) return type;
+  if (type >= 0xe0) return type - 0x100;
+  if (type < 0x90) return unpackMap(reader, type & 0x0f);
+  if (type < 0xa0) return unpackArray(reader, type & 0x0f);
+  if (type < 0xc0) return reader.text(type & 0x1f);
+  switch (type) {
+    case 0xc0: return null;
+    case 0xc2: return false;
+    case 0xc3: return true;
+    case 0xc4: return reader.raw(reader.u8());
+    case 0xc5: return reader.raw(reader.u16());
+    case 0xc6: return reader.raw(reader.u32());
+    case 0xca: return reader.f32();
+    case 0xcb: return reader.f64();
+    case 0xcc: return reader.u8();
+    case 0xcd: return reader.u16();
+    case 0xce: return reader.u32();
+    case 0xcf: return reader.u64();
+    case 0xd0: return reader.i8();
+    case 0xd1: return reader.i16();
+    case 0xd2: return reader.i32();
+    case 0xd3: return reader.i64();
+    case 0xd9: return reader.text(reader.u8());
+    case 0xda: return reader.text(reader.u16());
+    case 0xdb: return reader.text(reader.u32());
+    case 0xdc: return unpackArray(reader, reader.u16());
+    case 0xdd: return unpackArray(reader, reader.u32());
+    case 0xde: return unpackMap(reader, reader.u16());
+    case 0xdf: return unpackMap(reader, reader.u32());
+    default: throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+  }
+}
+
+/**
+ * Encode a value as MessagePack
+ */
+export function encodeMsgPack(value: WireValue): Uint8Array {
+  const writer = new Writer();
+  packValue(writer, value);
+  return writer.result();
+}
+
+/**
+ * Decode a MessagePack value (no extension types)
+ */
+export function decodeMsgPack(data: Uint8Array): WireValue {
+  const reader = new Reader(data);
+  return finish(reader, unpackValue(reader));
+}
+
+// CBOR (RFC 8949)
+
+function cborHead(writer: Writer, major: number, length: number): void {
+  const type = major << 5;
+  if (length < 24) {
+    writer.u8(type | length);
+  } else if (length < 0x100) {
+    writer.u8(type | 24);
+    writer.u8(length);
+  } else if (length < 0x10000) {
+    writer.u8(type | 25);
+    writer.u16(length);
+  } else if (length < 0x100000000) {
+    writer.u8(type | 26);
+    writer.u32(length);
+  } else {
+    writer.u8(type | 27);
+    writer.u64(length);
+  }
+}
+
+function cborValue(writer: Writer, value: WireValue): void {
+  if (value === null) {
+    writer.u8(0xf6);
+  } else if (typeof value === 'boolean') {
+    writer.u8(value ? 0xf5 : 0xf4);
+  } else if (typeof value === 'number') {
+    if (Number.isSafeInteger(value)) {
+      if (value >= 0) {
+        cborHead(writer, 0, value);
+      } else {
+        cborHead(writer, 1, -1 - value);
+      }
+    } else {
+      writer.u8(0xfb);
+      writer.f64(value);
+    }
+  } else if (typeof value === 'string') {
+    const bytes = utf8Encode(value);
+    cborHead(writer, 3, bytes.length);
+    writer.raw(bytes);
+  } else if (value instanceof Uint8Array) {
+    cborHead(writer, 2, value.length);
+    writer.raw(value);
+  } else if (Array.isArray(value)) {
+    cborHead(writer, 4, value.length);
+    value.forEach(item => cborValue(writer, item));
+  } else {
+    const members = entries(value);
+    cborHead(writer, 5, members.length);
+    members.forEach(([key, item]) => {
+      cborValue(writer, key);
+      cborValue(writer, item);
+    });
+  }
+}
+
+function cborLength(reader: Reader, info: number): number {
+  if (info < 24) return info;
+  switch (info) {
+    case 24: return reader.u8();
+    case 25: return reader.u16();
+    case 26: return reader.u32();
+    case 27: return reader.u64();
+    default: throw new Error('Indefinite-length CBOR items are not supported');
+  }
+}
+
+function halfFloat(bits: number): number {
+  const exponent = (bits >> 10) & 0x1f;
+  const fraction = bits & 0x3ff;
+  const sign = bits & 0x8000 ? -1 : 1;
+  if (exponent === 0) return sign * fraction * 2 ** -24;
+  if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+  return sign * (1 + fraction / 1024) * 2 ** (exponent - 15);
+}
+
+function cborDecode(reader: Reader): WireValue {
+  const initial = reader.u8();
+  const major = initial >> 5;
+  const info = initial & 0x1f;
+  if (major === 7) {
+    switch (info) {
+      case 20: return false;
+      case 21: return true;
+      case 22:
+      case 23: return null;
+      case 25: return halfFloat(reader.u16());
+      case 26: return reader.f32();
+      case 27: return reader.f64();
+      default: throw new Error(`Unsupported CBOR simple value ${info}`);
+    }
+  }
+  const length = cborLength(reader, info);
+  switch (major) {
+    case 0: return length;
+    case 1: return -1 - length;
+    case 2: return reader.raw(length);
+    case 3: return reader.text(length);
+    case 4: {
+      const items: WireValue[] = [];
+      for (let i = 0; i < length; i++) {
+        items.push(cborDecode(reader));
+      }
+      return items;
+    }
+    case 5: {
+      const map: { [key: string]: WireValue } = {};
+      for (let i = 0; i < length; i++) {
+        map[String(cborDecode(reader))] = cborDecode(reader);
+      }
+      return map;
+    }
+    default:
+      // Tags: keep the tagged value
+      return cborDecode(reader);
+  }
+}
+
+/**
+ * Encode a value as CBOR
+ */
+export function encodeCBOR(value: WireValue): Uint8Array {
+  const writer = new Writer();
+  cborValue(writer, value);
+  return writer.result();
+}
+
+/**
+ * Decode a CBOR value (definite lengths only; tags are dropped)
+ */
+export function decodeCBOR(data: Uint8Array): WireValue {
+  const reader = new Reader(data);
+  return finish(reader, cborDecode(reader));
+}
+
+// Requests and responses
+
+/**
+ * Gzip bytes with CompressionStream, or null where it is unavailable
+ */
+export async function gzipBytes(data: Uint8Array): Promise<Uint8Array | null> {
+  if (typeof CompressionStream === 'undefined' || typeof Response === 'undefined') {
+    return null;
+  }
+  const stream = new Blob([data]).stream().pipeThrough(new CompressionStream('gzip'));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+/**
+ * Encode a fingerprint for POST /api/fingerprint
+ * Returns the body and the Content-Type (and Content-Encoding) headers to send.
+ */
+export async function encodeFingerprintRequest(
+  result: FingerprintResult,
+  options: EncodeOptions = {}
+): Promise<EncodedRequest> {
+  const format = options.format ?? 'json';
+  const payload = { hash: result.hash, components: { ...result.components } };
+  let body: Uint8Array;
+  if (format === 'msgpack') {
+    body = encodeMsgPack(payload);
+  } else if (format === 'cbor') {
+    body = encodeCBOR(payload);
+  } else {
+    body = utf8Encode(JSON.stringify(payload));
+  }
+
+  const headers: Record<string, string> = { 'Content-Type': CONTENT_TYPES[format] };
+  if (options.compress) {
+    const compressed = await gzipBytes(body);
+    if (compressed) {
+      body = compressed;
+      headers['Content-Encoding'] = 'gzip';
+    }
+  }
+  return { body, headers };
+}
+
+/**
+ * Decode an API response body by its Content-Type
+ */
+export function decodeResponse(data: Uint8Array, contentType: string | null): WireValue {
+  const mimetype = (contentType || '').split(';')[0].trim().toLowerCase();
+  if (mimetype === CONTENT_TYPES.cbor) {
+    return decodeCBOR(data);
+  }
+  if (mimetype.endsWith('msgpack')) {
+    return decodeMsgPack(data);
+  }
+  return JSON.parse(utf8Decode(data));
+}